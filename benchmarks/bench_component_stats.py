@@ -0,0 +1,85 @@
+"""
+Benchmark of the per-region statistics of remove_tiny_objects.
+
+Times IncrementalLabels.statistics, one pass over the labels for the
+voxels, volume, box, extent and centroid of every region, against the
+same statistics from scipy.ndimage (label, sum, center_of_mass and
+find_objects) on an anisotropic spacing, and checks that both agree.
+Peak memory is traced by tracemalloc in a second run. Run from the
+repository root:
+
+    python -m benchmarks.bench_component_stats --sizes 256 384
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.ndimage as nd
+
+from benchmarks.bench_incremental_labeling import synthetic_mask
+from remove_tiny_objects.labeling import FOREGROUND_MIN, IncrementalLabels
+
+SPACING = (0.5, 0.5, 2.5)
+
+
+def measure(func):
+    # Timed without tracemalloc, which slows down the many small Python
+    # objects made by find_objects, then run again for the peak memory.
+    t0 = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    result = func()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def scipy_statistics(matrix, spacing):
+    labels, nlabels = nd.label(matrix >= FOREGROUND_MIN)
+    index = np.arange(1, nlabels + 1)
+    ones = np.ones(labels.shape, dtype=np.uint8)
+    voxels = nd.sum(ones, labels, index)
+    centroid = np.array(nd.center_of_mass(ones, labels, index)) * spacing[::-1]
+    objects = nd.find_objects(labels)
+    box_min = np.array([[s.start for s in o] for o in objects])
+    box_max = np.array([[s.stop for s in o] for o in objects])
+    return voxels, centroid, box_min, box_max
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256])
+    args = parser.parse_args()
+
+    mb = 1024**2
+    print(
+        f"{'size':>5} {'regions':>8} {'scipy (s)':>10} {'scipy (MB)':>11} "
+        f"{'one pass (s)':>13} {'one pass (MB)':>14} {'equal':>6}"
+    )
+    for size in args.sizes:
+        matrix = synthetic_mask(size)
+        labels = IncrementalLabels(matrix)
+        t_ref, m_ref, (voxels, centroid, box_min, box_max) = measure(
+            lambda: scipy_statistics(matrix, np.array(SPACING))
+        )
+        t_new, m_new, stats = measure(lambda: labels.statistics(SPACING))
+
+        # Both number the regions by their first voxel.
+        order = np.argsort(stats["label"])
+        equal = (
+            len(order) == len(voxels)
+            and bool((stats["voxels"][order] == voxels).all())
+            and bool((stats["box_min"][order] == box_min).all())
+            and bool((stats["box_max"][order] == box_max).all())
+            and np.allclose(stats["centroid"][order], centroid)
+        )
+        print(
+            f"{size:>5} {len(voxels):>8} {t_ref:>10.2f} {m_ref / mb:>11.0f} "
+            f"{t_new:>13.2f} {m_new / mb:>14.0f} {equal!s:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
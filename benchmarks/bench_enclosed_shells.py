@@ -0,0 +1,72 @@
+"""
+Benchmark of the enclosed shell pre-pass of remove_non_visible_faces.
+
+Runs the visibility passes with and without skip_enclosed on an outer
+folded sphere holding many closed inner shells (like the cavities of a CT
+bone surface), and reports the time, the time of the pre-pass itself and
+the faces that differ between both. Run from the repository root:
+
+    python -m benchmarks.bench_enclosed_shells --resolution 400 --shells 40 --engines cells raycast
+"""
+import argparse
+import time
+
+import numpy as np
+from vtkmodules.vtkFiltersCore import vtkAppendPolyData
+from vtkmodules.vtkFiltersSources import vtkSphereSource
+
+from benchmarks.bench_proxy_visibility import folded_spheres, kept_cells
+from remove_non_visible_faces.mesh import enclosed_cells
+from remove_non_visible_faces.remove_non_visible_faces import ENGINES, VisibilityEngine
+
+
+def hollow_surface(resolution, shells, seed=0):
+    # folded_spheres plus shells closed spheres within 0.3 of its centre,
+    # inside the deepest folds of the outer surface.
+    rng = np.random.default_rng(seed)
+    append = vtkAppendPolyData()
+    append.AddInputData(folded_spheres(resolution))
+    for _ in range(shells):
+        sphere = vtkSphereSource()
+        direction = rng.normal(size=3)
+        sphere.SetCenter(*(direction / np.linalg.norm(direction) * rng.uniform(0, 0.15)))
+        sphere.SetRadius(rng.uniform(0.05, 0.15))
+        sphere.SetThetaResolution(resolution // 4)
+        sphere.SetPhiResolution(resolution // 4)
+        append.AddInputConnection(sphere.GetOutputPort())
+    append.Update()
+    return append.GetOutput()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--resolution", type=int, default=400)
+    parser.add_argument("--shells", type=int, default=40)
+    parser.add_argument("--viewpoints", type=int, default=16)
+    parser.add_argument("--render-size", type=int, default=800)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=["cells", "raycast"])
+    args = parser.parse_args()
+
+    polydata = hollow_surface(args.resolution, args.shells)
+    t0 = time.perf_counter()
+    enclosed = enclosed_cells(polydata)
+    t_prepass = time.perf_counter() - t0
+    print(
+        f"{polydata.GetNumberOfCells()} faces, {np.count_nonzero(enclosed)} enclosed, "
+        f"pre-pass {t_prepass:.2f} s"
+    )
+    print(f"{'engine':<8} {'render all (s)':>15} {'skip enclosed (s)':>18} {'speedup':>8} {'differ':>8}")
+    for name in args.engines:
+        with VisibilityEngine(args.render_size, name) as engine:
+            options = {"n_viewpoints": args.viewpoints}
+            t_all, all_cells = kept_cells(engine, polydata, skip_enclosed=False, **options)
+            t_skip, skip_cells = kept_cells(engine, polydata, skip_enclosed=True, **options)
+        differ = len(np.setxor1d(all_cells, skip_cells, assume_unique=True))
+        print(
+            f"{name:<8} {t_all:>15.2f} {t_skip:>18.2f} {t_all / t_skip:>7.1f}x "
+            f"{differ / max(len(all_cells), 1):>8.3%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark of the kept cell extraction in remove_non_visible_faces.
+
+Compares the previous vtkExtractSelection + vtkGeometryFilter +
+vtkCleanPolyData chain against the numpy mesh.extract_cells on spheres
+(without coincident points) with normals and scalars, keeping a random half of
+the faces. Each method runs in a fresh process, where its peak resident
+memory above the input mesh is sampled. Run from the repository root:
+
+    python -m benchmarks.bench_extract_cells --points 500000 2000000
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+from vtkmodules.util import numpy_support
+from vtkmodules.vtkCommonDataModel import vtkSelection, vtkSelectionNode
+from vtkmodules.vtkFiltersCore import vtkCleanPolyData, vtkElevationFilter, vtkPolyDataNormals
+from vtkmodules.vtkFiltersExtraction import vtkExtractSelection
+from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
+from vtkmodules.vtkFiltersSources import vtkSphereSource
+
+from remove_non_visible_faces.mesh import extract_cells
+
+
+def reference_extract_cells(polydata, cells_ids):
+    selection_node = vtkSelectionNode()
+    selection_node.SetFieldType(vtkSelectionNode.CELL)
+    selection_node.SetContentType(vtkSelectionNode.INDICES)
+    selection_node.SetSelectionList(numpy_support.numpy_to_vtkIdTypeArray(cells_ids, deep=True))
+
+    selection = vtkSelection()
+    selection.AddNode(selection_node)
+
+    extract_selection = vtkExtractSelection()
+    extract_selection.SetInputData(0, polydata)
+    extract_selection.SetInputData(1, selection)
+    extract_selection.Update()
+
+    geometry_filter = vtkGeometryFilter()
+    geometry_filter.SetInputData(extract_selection.GetOutput())
+    geometry_filter.Update()
+
+    clean_polydata = vtkCleanPolyData()
+    clean_polydata.SetInputData(geometry_filter.GetOutput())
+    clean_polydata.Update()
+    return clean_polydata.GetOutput()
+
+
+METHODS = {"vtk": reference_extract_cells, "numpy": extract_cells}
+
+
+def test_mesh(npoints):
+    resolution = max(int(np.sqrt(npoints)), 3)
+    sphere = vtkSphereSource()
+    sphere.SetThetaResolution(resolution)
+    sphere.SetPhiResolution(resolution)
+    normals = vtkPolyDataNormals()
+    normals.SetInputConnection(sphere.GetOutputPort())
+    normals.SplittingOff()
+    normals.ConsistencyOff()
+    elevation = vtkElevationFilter()
+    elevation.SetInputConnection(normals.GetOutputPort())
+    elevation.Update()
+    polydata = elevation.GetOutput()
+    rng = np.random.default_rng(0)
+    cells_ids = np.flatnonzero(rng.random(polydata.GetNumberOfCells()) < 0.5)
+    return polydata, cells_ids
+
+
+def triangles(polydata):
+    # Triangles as sorted rows of their point coordinates, with point data.
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+    point_data = polydata.GetPointData()
+    values = np.hstack(
+        (
+            points,
+            numpy_support.vtk_to_numpy(point_data.GetNormals()),
+            numpy_support.vtk_to_numpy(point_data.GetScalars())[:, None],
+        )
+    )
+    connectivity = numpy_support.vtk_to_numpy(polydata.GetPolys().GetConnectivityArray())
+    rows = values[connectivity.reshape(-1, 3)].reshape(-1, 3 * values.shape[1])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _run(method, npoints, queue):
+    polydata, cells_ids = test_mesh(npoints)
+    before = rss()
+    peak = before
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.002):
+            peak = max(peak, rss())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    t0 = time.perf_counter()
+    output = METHODS[method](polydata, cells_ids)
+    elapsed = time.perf_counter() - t0
+    done.set()
+    sampler.join()
+    peak = max(peak, rss())
+    queue.put((elapsed, peak - before, output.GetNumberOfCells(), output.GetNumberOfPoints()))
+
+
+def measure(method, npoints):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run, args=(method, npoints, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--points", type=int, nargs="+", default=[500000, 2000000])
+    args = parser.parse_args()
+
+    mb = 1024 ** 2
+    print(
+        f"{'points':>9} {'vtk (s)':>8} {'vtk (MB)':>9} {'numpy (s)':>10} "
+        f"{'numpy (MB)':>11} {'output (MB)':>12} {'equal':>6}"
+    )
+    for npoints in args.points:
+        polydata, cells_ids = test_mesh(npoints)
+        ref = reference_extract_cells(polydata, cells_ids)
+        new = extract_cells(polydata, cells_ids)
+        equal = (
+            ref.GetNumberOfPoints() == new.GetNumberOfPoints()
+            and np.array_equal(triangles(ref), triangles(new))
+        )
+        output_size = new.GetActualMemorySize() * 1024
+        del polydata, ref, new
+
+        t_ref, m_ref, _, _ = measure("vtk", npoints)
+        t_new, m_new, _, _ = measure("numpy", npoints)
+        print(
+            f"{npoints:>9} {t_ref:>8.3f} {m_ref / mb:>9.0f} {t_new:>10.3f} "
+            f"{m_new / mb:>11.0f} {output_size / mb:>12.0f} {equal!s:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
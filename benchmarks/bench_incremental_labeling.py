@@ -0,0 +1,89 @@
+"""
+Benchmark of the incremental labeling of remove_tiny_objects.
+
+Applies brush strokes (balls set on or off) to a synthetic mask and times,
+per stroke, the previous full nd.label with per-voxel sizes against
+IncrementalLabels.update with the per-voxel sizes of the boxes where the
+preview of remove_tiny_objects changes for --min-size.
+The final labels are checked against a full relabel. Run from the
+repository root:
+
+    python -m benchmarks.bench_incremental_labeling --sizes 256 512 --strokes 20
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.ndimage as nd
+
+from remove_tiny_objects.labeling import IncrementalLabels
+
+
+def synthetic_mask(size, seed=0):
+    # Blobs of many sizes, like a thresholded CT mask with noise.
+    rng = np.random.default_rng(seed)
+    small = rng.random((size // 4,) * 3, dtype=np.float32)
+    field = nd.zoom(nd.gaussian_filter(small, 1.5), 4, order=1)
+    field += rng.random(field.shape, dtype=np.float32) * 0.02
+    return np.where(field > 0.52, 255, 0).astype(np.uint8)
+
+
+def full_sizes(matrix):
+    labels, nlabels = nd.label(matrix >= 128)
+    sizes = np.bincount(labels.ravel(), minlength=nlabels + 1)
+    sizes[0] = 0
+    return sizes[labels], nlabels
+
+
+def stroke(matrix, rng, radius):
+    center = rng.integers(0, matrix.shape, 3)
+    lo = np.maximum(center - radius, 0)
+    hi = np.minimum(center + radius + 1, matrix.shape)
+    z, y, x = np.ogrid[lo[0] : hi[0], lo[1] : hi[1], lo[2] : hi[2]]
+    ball = (z - center[0]) ** 2 + (y - center[1]) ** 2 + (x - center[2]) ** 2 <= radius**2
+    box = tuple(slice(a, b) for a, b in zip(lo, hi))
+    matrix[box][ball] = 255 if rng.random() < 0.5 else 1
+    return lo, hi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256])
+    parser.add_argument("--strokes", type=int, default=20)
+    parser.add_argument("--radius", type=int, default=6)
+    parser.add_argument("--min-size", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'size':>5} {'regions':>8} {'full (s)':>9} {'incremental (s)':>16} {'speedup':>8} {'equal':>6}")
+    for size in args.sizes:
+        matrix = synthetic_mask(size)
+        rng = np.random.default_rng(size)
+        labels = IncrementalLabels(matrix)
+        t_full = 0.0
+        t_incremental = 0.0
+        for _ in range(args.strokes):
+            box = stroke(matrix, rng, args.radius)
+
+            t0 = time.perf_counter()
+            full_sizes(matrix)
+            t_full += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            region, changed, old_sizes = labels.update(box)
+            flipped = labels.flipped(changed, old_sizes, args.min_size)
+            for slices in [region] + [labels.component_box(label) for label in flipped]:
+                labels.voxel_sizes(slices)
+            t_incremental += time.perf_counter() - t0
+
+        reference, nlabels = full_sizes(matrix)
+        equal = nlabels == labels.num_regions and bool((reference == labels.voxel_sizes()).all())
+        t_full /= args.strokes
+        t_incremental /= args.strokes
+        print(
+            f"{size:>5} {nlabels:>8} {t_full:>9.3f} {t_incremental:>16.4f} "
+            f"{t_full / t_incremental:>7.1f}x {equal!s:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
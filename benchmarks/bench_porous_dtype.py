@@ -0,0 +1,90 @@
+"""
+Benchmark of the float32 porous volume pipeline in porous_creation.schwarzp.
+
+Compares the float64 field + image_normalize pipeline against the float32
+one (TPMS scaled straight into int16, Blobs generated in float32) in time
+and peak memory traced by tracemalloc, and checks the precision loss of
+the int16 output. Run from the repository root:
+
+    python -m benchmarks.bench_porous_dtype --sizes 128 256
+
+Exits with an error if any voxel differs by more than --tolerance.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from porous_creation import schwarzp
+
+MIN_VALUE = -1000
+MAX_VALUE = 1000
+
+
+def image_normalize(image, min_=0, max_=1):
+    # Same as invesalius.data.imagedata_utils.image_normalize.
+    output = np.empty(shape=image.shape, dtype=np.int16)
+    imin, imax = image.min(), image.max()
+    output[:] = (image - imin) * ((max_ - min_) / (imax - imin)) + min_
+    return output
+
+
+def measure(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def pipelines(size):
+    bounds = (-10, 10, -10, 10, -10, 10)
+    for method in schwarzp.SURFACES:
+        yield (
+            method,
+            lambda: image_normalize(
+                schwarzp.create_schwarzp(method, *bounds, size, size, size), MIN_VALUE, MAX_VALUE
+            ),
+            lambda: schwarzp.create_schwarzp(
+                method, *bounds, size, size, size, dtype=np.float32, scale_to=(MIN_VALUE, MAX_VALUE)
+            ),
+        )
+    yield (
+        "Blobs",
+        lambda: image_normalize(schwarzp.create_blobs(size, size, size, seed=0), MIN_VALUE, MAX_VALUE),
+        lambda: schwarzp.normalize_volume(
+            schwarzp.create_blobs(size, size, size, seed=0, dtype=np.float32), MIN_VALUE, MAX_VALUE
+        ),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 256])
+    parser.add_argument("--tolerance", type=int, default=1)
+    args = parser.parse_args()
+
+    mb = 1024 ** 2
+    failed = False
+    print(f"{'field':<15} {'size':>5} {'f64 (s)':>8} {'f64 (MB)':>9} {'f32 (s)':>8} {'f32 (MB)':>9} {'max diff':>9} {'% diff':>7}")
+    for size in args.sizes:
+        for name, reference, float32 in pipelines(size):
+            t_ref, m_ref, ref = measure(reference)
+            t_new, m_new, new = measure(float32)
+            diff = np.abs(ref.astype(np.int32) - new)
+            max_diff = diff.max()
+            changed = 100.0 * np.count_nonzero(diff) / diff.size
+            failed |= max_diff > args.tolerance
+            del ref, new, diff
+            print(f"{name:<15} {size:>5} {t_ref:>8.3f} {m_ref / mb:>9.0f} {t_new:>8.3f} {m_new / mb:>9.0f} {max_diff:>9} {changed:>7.3f}")
+
+    if failed:
+        sys.exit(f"int16 output differs by more than {args.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
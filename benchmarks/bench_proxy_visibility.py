@@ -0,0 +1,94 @@
+"""
+Benchmark of the decimated proxy visibility in remove_non_visible_faces.
+
+Runs the visibility passes on the full mesh and on vertex clustered
+proxies of it, and reports the time and the false-removal rate: the
+fraction of the faces kept with the full mesh that the proxy drops. The
+test meshes are a sphere with deep radial folds and a hidden inner sphere,
+so partly visible concave regions are present. Run from the repository
+root (needs offscreen rendering):
+
+    python -m benchmarks.bench_proxy_visibility --resolution 1000 --proxy-points 20000 50000
+"""
+import argparse
+import time
+
+import numpy as np
+from vtkmodules.util import numpy_support
+from vtkmodules.vtkFiltersCore import vtkAppendPolyData
+from vtkmodules.vtkFiltersSources import vtkSphereSource
+
+from remove_non_visible_faces.mesh import cells_from_points
+from remove_non_visible_faces.remove_non_visible_faces import VisibilityEngine
+
+
+def folded_spheres(resolution, folds=8, depth=0.3):
+    outer = vtkSphereSource()
+    outer.SetThetaResolution(resolution)
+    outer.SetPhiResolution(resolution)
+    outer.Update()
+    polydata = outer.GetOutput()
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+    theta = np.arctan2(points[:, 1], points[:, 0])
+    phi = np.arccos(np.clip(points[:, 2] / 0.5, -1, 1))
+    radius = 1.0 + depth * np.sin(folds * theta) * np.sin(folds * phi)
+    points *= radius[:, None].astype(points.dtype)
+    polydata.GetPoints().Modified()
+
+    inner = vtkSphereSource()
+    inner.SetRadius(0.2)
+    inner.SetThetaResolution(resolution // 4)
+    inner.SetPhiResolution(resolution // 4)
+
+    append = vtkAppendPolyData()
+    append.AddInputData(polydata)
+    append.AddInputConnection(inner.GetOutputPort())
+    append.Update()
+    return append.GetOutput()
+
+
+def kept_cells(engine, polydata, **kwargs):
+    t0 = time.perf_counter()
+    visible = engine.visible(polydata, **kwargs)
+    if engine.engine == "points":
+        cells = cells_from_points(polydata, visible)
+    else:
+        cells = np.flatnonzero(visible)
+    return time.perf_counter() - t0, cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--resolution", type=int, default=1000)
+    parser.add_argument("--proxy-points", type=int, nargs="+", default=[20000, 50000])
+    parser.add_argument("--dilation", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--viewpoints", type=int, default=16)
+    parser.add_argument("--engine", choices=["points", "cells"], default="points")
+    parser.add_argument("--render-size", type=int, default=800)
+    args = parser.parse_args()
+
+    polydata = folded_spheres(args.resolution)
+    print(f"{polydata.GetNumberOfPoints()} points, {polydata.GetNumberOfCells()} faces")
+    with VisibilityEngine(args.render_size, args.engine) as engine:
+        t_full, full = kept_cells(engine, polydata, n_viewpoints=args.viewpoints)
+        print(f"{'proxy':>8} {'dilation':>8} {'time (s)':>9} {'speedup':>8} {'kept':>9} {'false removal':>14} {'extra kept':>11}")
+        print(f"{'-':>8} {'-':>8} {t_full:>9.2f} {1:>7.1f}x {len(full):>9} {0:>14.4%} {0:>11.4%}")
+        for proxy_points in args.proxy_points:
+            for dilation in args.dilation:
+                t_proxy, proxy = kept_cells(
+                    engine,
+                    polydata,
+                    n_viewpoints=args.viewpoints,
+                    proxy_points=proxy_points,
+                    dilation=dilation,
+                )
+                false_removal = len(np.setdiff1d(full, proxy, assume_unique=True)) / len(full)
+                extra = len(np.setdiff1d(proxy, full, assume_unique=True)) / polydata.GetNumberOfCells()
+                print(
+                    f"{proxy_points:>8} {dilation:>8} {t_proxy:>9.2f} {t_full / t_proxy:>7.1f}x "
+                    f"{len(proxy):>9} {false_removal:>14.4%} {extra:>11.4%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
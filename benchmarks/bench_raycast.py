@@ -0,0 +1,55 @@
+"""
+Benchmark of the CPU ray casting visibility engine of
+remove_non_visible_faces.
+
+Runs the "raycast" engine with several thread counts on the folded sphere
+test mesh of bench_proxy_visibility, and compares its kept faces against
+the OpenGL "cells" engine when rendering works. Run from the repository
+root:
+
+    python -m benchmarks.bench_raycast --resolution 500 --threads 1 2 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_proxy_visibility import folded_spheres
+from remove_non_visible_faces.remove_non_visible_faces import VisibilityEngine
+
+
+def kept_faces(engine, render_size, polydata, viewpoints, workers=1):
+    with VisibilityEngine(render_size, engine, workers) as visibility_engine:
+        t0 = time.perf_counter()
+        visible = visibility_engine.visible(polydata, n_viewpoints=viewpoints)
+        return time.perf_counter() - t0, np.flatnonzero(visible)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--resolution", type=int, default=500)
+    parser.add_argument("--viewpoints", type=int, default=16)
+    parser.add_argument("--render-size", type=int, default=800)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--no-opengl", action="store_true", help="skip the OpenGL comparison")
+    args = parser.parse_args()
+
+    polydata = folded_spheres(args.resolution)
+    print(f"{polydata.GetNumberOfPoints()} points, {polydata.GetNumberOfCells()} faces")
+    reference = None
+    if not args.no_opengl:
+        t_gl, reference = kept_faces("cells", args.render_size, polydata, args.viewpoints)
+        print(f"{'cells (OpenGL)':<16} {'':>8} {t_gl:>9.2f} s {len(reference):>9} faces")
+
+    for threads in args.threads:
+        t_ray, kept = kept_faces("raycast", args.render_size, polydata, args.viewpoints, threads)
+        line = f"{'raycast':<16} {threads:>3} thr {t_ray:>9.2f} s {len(kept):>9} faces"
+        if reference is not None:
+            only_gl = len(np.setdiff1d(reference, kept, assume_unique=True))
+            only_ray = len(np.setdiff1d(kept, reference, assume_unique=True))
+            line += f"   only OpenGL {only_gl / len(reference):.3%}, only raycast {only_ray / len(reference):.3%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
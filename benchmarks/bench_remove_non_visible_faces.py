@@ -0,0 +1,88 @@
+"""
+Benchmark of the point to cell mapping in remove_non_visible_faces.
+
+Compares the previous per point vtkIdList / GetPointCells loop against the
+vectorized cells_from_points on synthetic triangulated meshes with a
+random visible point mask. Run from the repository root:
+
+    python -m benchmarks.bench_remove_non_visible_faces --points 500000 2000000
+"""
+import argparse
+import time
+
+import numpy as np
+from vtkmodules.util import numpy_support
+from vtkmodules.vtkCommonCore import vtkIdList, vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData
+
+from remove_non_visible_faces.mesh import cells_from_points
+
+
+def synthetic_mesh(npoints):
+    # Triangulated n x n grid wrapped on a sphere, with about npoints points.
+    n = max(int(np.sqrt(npoints)), 2)
+    theta, phi = np.meshgrid(
+        np.linspace(0, np.pi, n), np.linspace(0, 2 * np.pi, n), indexing="ij"
+    )
+    points = np.stack(
+        (np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)),
+        axis=-1,
+    ).reshape(-1, 3)
+    ids = np.arange(n * n).reshape(n, n)
+    a, b, c, d = ids[:-1, :-1], ids[:-1, 1:], ids[1:, :-1], ids[1:, 1:]
+    triangles = np.concatenate(
+        (np.stack((a, b, d), axis=-1).reshape(-1, 3), np.stack((a, d, c), axis=-1).reshape(-1, 3))
+    )
+
+    polydata = vtkPolyData()
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+    polydata.SetPoints(vtk_points)
+    polys = vtkCellArray()
+    polys.SetData(
+        numpy_support.numpy_to_vtkIdTypeArray(np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64), deep=True),
+        numpy_support.numpy_to_vtkIdTypeArray(triangles.ravel().astype(np.int64), deep=True),
+    )
+    polydata.SetPolys(polys)
+    return polydata
+
+
+def reference_cells(polydata, point_mask):
+    polydata.BuildLinks()
+    cells_ids = set()
+    for p_id in np.flatnonzero(point_mask).tolist():
+        id_list = vtkIdList()
+        polydata.GetPointCells(p_id, id_list)
+        for i in range(id_list.GetNumberOfIds()):
+            cells_ids.add(id_list.GetId(i))
+    return np.array(sorted(cells_ids), dtype=np.int64)
+
+
+def timeit(func):
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--points", type=int, nargs="+", default=[500000, 2000000])
+    parser.add_argument("--visible", type=float, default=0.5, help="fraction of visible points")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'points':>9} {'cells':>9} {'loop (s)':>9} {'numpy (s)':>10} {'speedup':>8} {'equal':>6}")
+    for npoints in args.points:
+        polydata = synthetic_mesh(npoints)
+        point_mask = rng.random(polydata.GetNumberOfPoints()) < args.visible
+        t_ref, ref = timeit(lambda: reference_cells(polydata, point_mask))
+        t_new, new = timeit(lambda: cells_from_points(polydata, point_mask))
+        equal = np.array_equal(ref, new)
+        print(
+            f"{polydata.GetNumberOfPoints():>9} {polydata.GetNumberOfCells():>9} "
+            f"{t_ref:>9.3f} {t_new:>10.3f} {t_ref / t_new:>7.0f}x {equal!s:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of the TPMS field generation in porous_creation.schwarzp.
+
+Compares the previous whole-volume np.ogrid expressions against the
+separable slab-wise create_schwarzp for every surface type. Run from the
+repository root:
+
+    python -m benchmarks.bench_schwarzp --sizes 256 512
+"""
+import argparse
+import time
+
+import numpy as np
+
+from porous_creation import schwarzp
+
+BUILTIN_SURFACES = ["Schwarz P", "Schwarz D", "Gyroid", "Neovius", "iWP", "P_W_Hybrid"]
+
+def reference_schwarzp(method, init_x, end_x, init_y, end_y, init_z, end_z, sx, sy, sz):
+    z, y, x = np.ogrid[
+        init_z : end_z : complex(0, sz),
+        init_y : end_y : complex(0, sy),
+        init_x : end_x : complex(0, sx),
+    ]
+    if method == 'Schwarz P':
+        return np.cos(x) + np.cos(y) + np.cos(z)
+    elif method == 'Schwarz D':
+        return np.sin(x)*np.sin(y)*np.sin(z) + np.sin(x)*np.cos(y)*np.cos(z) + np.cos(x)*np.sin(y)*np.cos(z) + np.cos(x)*np.cos(y)*np.sin(z)
+    elif method == 'Gyroid':
+        return np.cos(x) * np.sin(y) + np.cos(y) * np.sin(z) + np.cos(z) * np.sin(x)
+    elif method == 'Neovius':
+        return 3 * (np.cos(x) + np.cos(y) + np.cos(z)) + 4 * np.cos(x) * np.cos(y) * np.cos(z)
+    elif method == 'iWP':
+        return np.cos(x) * np.cos(y) + np.cos(y) * np.cos(z) + np.cos(z) * np.cos(x) - np.cos(x) * np.cos(y) * np.cos(z)
+    elif method == 'P_W_Hybrid':
+        return 4.0 * (np.cos(x) * np.cos(y) + np.cos(y) * np.cos(z) + np.cos(z) * np.cos(x)) - 3 * np.cos(x) * np.cos(y) * np.cos(z) + 2.4
+
+
+def timeit(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bounds = (-10, 10, -10, 10, -10, 10)
+    print(f"{'surface':<12} {'size':>5} {'reference (s)':>14} {'separable (s)':>14} {'speedup':>8} {'max error':>10}")
+    for size in args.sizes:
+        for method in BUILTIN_SURFACES:
+            t_ref, ref = timeit(
+                lambda: reference_schwarzp(method, *bounds, size, size, size), args.repeat
+            )
+            out = np.empty((size, size, size), dtype=np.float64)
+            t_new, new = timeit(
+                lambda: schwarzp.create_schwarzp(method, *bounds, size, size, size, out=out),
+                args.repeat,
+            )
+            error = np.abs(ref - new).max()
+            del ref
+            print(f"{method:<12} {size:>5} {t_ref:>14.3f} {t_new:>14.3f} {t_ref / t_new:>7.1f}x {error:>10.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark of the size index behind the remove_tiny_objects threshold.
+
+Moves the maximum size to remove one tick at a time over a range and back,
+and times each tick of the previous full preview rewrite from a per-voxel
+size volume against the SizeIndex update, which only writes the voxels of
+the regions whose side of the threshold changed. Peak memory is traced by
+tracemalloc; the final previews are compared. Run from the repository
+root:
+
+    python -m benchmarks.bench_size_index --sizes 256 384 --ticks 1 50
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_incremental_labeling import synthetic_mask
+from remove_tiny_objects.labeling import IncrementalLabels, SizeIndex
+
+
+def measure(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - t0
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256])
+    parser.add_argument("--ticks", type=int, nargs=2, default=[1, 50], metavar=("FIRST", "LAST"))
+    args = parser.parse_args()
+
+    first, last = args.ticks
+    ticks = list(range(first, last + 1)) + list(range(last - 1, first - 1, -1))
+    mb = 1024**2
+    print(
+        f"{'size':>5} {'index (s)':>10} {'full/tick (s)':>14} {'full (MB)':>10} "
+        f"{'index/tick (s)':>15} {'index (MB)':>11} {'speedup':>8} {'equal':>6}"
+    )
+    for size in args.sizes:
+        labels = IncrementalLabels(synthetic_mask(size))
+        counts = labels.voxel_sizes()
+        reference = np.zeros(counts.shape, dtype=np.uint8)
+        preview = np.zeros(counts.shape, dtype=np.uint8)
+        flat = preview.reshape(-1)
+
+        t0 = time.perf_counter()
+        size_index = SizeIndex(labels)
+        size_index.between(0, 0)
+        t_index = time.perf_counter() - t0
+        voxels, _big = size_index.between(0, ticks[0])
+        flat[voxels] = 255
+
+        t_full = t_new = 0.0
+        m_full = m_new = 0
+        previous = ticks[0]
+        for tick in ticks[1:]:
+            def full_update():
+                reference[:] = ((counts > 0) & (counts <= tick)) * 255
+
+            elapsed, peak = measure(full_update)
+            t_full += elapsed
+            m_full = max(m_full, peak)
+
+            def update():
+                low, high = sorted((previous, tick))
+                voxels, big = size_index.between(low, high)
+                flat[voxels] = 255 if tick > previous else 0
+                # The benchmark masks have no regions too big to index.
+                assert len(big) == 0
+
+            elapsed, peak = measure(update)
+            t_new += elapsed
+            m_new = max(m_new, peak)
+            previous = tick
+
+        n = len(ticks) - 1
+        equal = bool((reference == preview).all())
+        print(
+            f"{size:>5} {t_index:>10.3f} {t_full / n:>14.4f} {m_full / mb:>10.0f} "
+            f"{t_new / n:>15.5f} {m_new / mb:>11.1f} {t_full / t_new:>7.0f}x {equal!s:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
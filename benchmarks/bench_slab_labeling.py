@@ -0,0 +1,82 @@
+"""
+Benchmark of the slab-parallel labeling of remove_tiny_objects.
+
+Compares scipy.ndimage.label over the whole thresholded mask against
+label_slabs with several thread counts, and the previous start of the
+labels of remove_tiny_objects (nd.label, then the sizes and boxes of the
+labels over the whole volume) against IncrementalLabels, which takes the
+sizes and boxes from the slabs. Times, and peak memory traced by
+tracemalloc in a second run, on the synthetic mask of
+bench_incremental_labeling. Run from the repository root:
+
+    python -m benchmarks.bench_slab_labeling --sizes 256 512 --workers 1 2 4
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.ndimage as nd
+
+from benchmarks.bench_incremental_labeling import synthetic_mask
+from remove_tiny_objects.labeling import FOREGROUND_MIN, IncrementalLabels, label_slabs
+
+
+def measure(func):
+    # Timed without tracemalloc, which slows down the many small Python
+    # objects made by find_objects, then run again for the peak memory.
+    t0 = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    result = func()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def full_start(matrix):
+    labels, nlabels = nd.label(matrix >= FOREGROUND_MIN)
+    sizes = np.bincount(labels.ravel(), minlength=nlabels + 1)
+    objects = nd.find_objects(labels)
+    return labels, sizes, objects
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    mb = 1024**2
+    print(f"{'size':>5} {'method':<24} {'time (s)':>9} {'peak (MB)':>10} {'equal':>6}")
+
+    def row(size, method, elapsed, peak, equal="-"):
+        print(f"{size:>5} {method:<24} {elapsed:>9.3f} {peak / mb:>10.0f} {equal!s:>6}")
+
+    for size in args.sizes:
+        matrix = synthetic_mask(size)
+        t_ref, m_ref, (reference, nlabels) = measure(lambda: nd.label(matrix >= FOREGROUND_MIN))
+        row(size, "nd.label", t_ref, m_ref)
+        for workers in args.workers:
+            t_new, m_new, (labels, n) = measure(lambda: label_slabs(matrix, workers=workers))
+            equal = n == nlabels and bool((labels == reference).all())
+            del labels
+            row(size, f"label_slabs, {workers} thr", t_new, m_new, equal)
+
+        sizes = np.bincount(reference.ravel())
+        sizes[0] = 0
+        reference = sizes[reference]
+        t_ref, m_ref, started = measure(lambda: full_start(matrix))
+        del started
+        row(size, "nd.label, sizes, boxes", t_ref, m_ref)
+        for workers in args.workers:
+            t_new, m_new, labels = measure(lambda: IncrementalLabels(matrix, workers=workers))
+            equal = labels.num_regions == nlabels and bool((labels.voxel_sizes() == reference).all())
+            del labels
+            row(size, f"IncrementalLabels, {workers} thr", t_new, m_new, equal)
+        del reference
+
+
+if __name__ == "__main__":
+    main()
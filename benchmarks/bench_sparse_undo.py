@@ -0,0 +1,150 @@
+"""
+Benchmark of the Remove button of remove_tiny_objects, end to end.
+
+Removes the regions up to --min-size voxels from a synthetic mask (with
+the one voxel border of InVesalius masks) the way OnRemove does, from
+setting the mask voxels to refreshing the labels, the preview and the
+size index shown in the dialog. Compares the previous removal, which kept
+full copies of the mask before and after, saved both to disk as the
+InVesalius history nodes do, and relabelled with IncrementalLabels.update,
+against set_voxels with two SparseEditionNode and IncrementalLabels.remove.
+Reports the time, the peak memory traced by tracemalloc in a second run
+and the disk used, and checks that both leave the same labels and preview
+and that undoing and redoing the sparse nodes give back both masks. Run
+from the repository root:
+
+    python -m benchmarks.bench_sparse_undo --sizes 256 384 --min-size 100
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_incremental_labeling import synthetic_mask
+from remove_tiny_objects.history import SparseEditionNode, set_voxels
+from remove_tiny_objects.labeling import IncrementalLabels, SizeIndex
+
+# As in remove_tiny_objects.gui.
+PREVIEW_CHUNK_SIZE = 32
+
+
+def measure(make_state, func):
+    # Timed without tracemalloc, which slows down the many small Python
+    # objects made by find_objects, then run again on a new state for the
+    # peak memory.
+    state = make_state()
+    t0 = time.perf_counter()
+    func(*state)
+    elapsed = time.perf_counter() - t0
+    state = make_state()
+    tracemalloc.start()
+    result = func(*state)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result, state
+
+
+def bordered(size):
+    matrix = np.zeros((size + 1,) * 3, dtype=np.uint8)
+    matrix[1:, 1:, 1:] = synthetic_mask(size)
+    return matrix
+
+
+def refresh_dialog(labels, min_size):
+    # The size index and the figures shown after the labels changed.
+    size_index = SizeIndex(labels)
+    size_index.at_most(min_size)
+    size_index.histogram()
+
+
+def full_removal(matrix, labels, preview, min_size):
+    # The previous OnRemove, with np.save for the history nodes. Returns
+    # the disk they used, and deletes them.
+    cp_mask = matrix.copy()
+    m = matrix[1:, 1:, 1:]
+    m[preview > 127] = 1
+    filenames = []
+    for array in (cp_mask, matrix.copy()):
+        fd, filename = tempfile.mkstemp(suffix=".npy")
+        with os.fdopen(fd, "wb") as npy_file:
+            np.save(npy_file, array)
+        filenames.append(filename)
+    region, _changed, _old_sizes = labels.update()
+    start, stop, _step = region[0].indices(len(preview))
+    for z0 in range(start, stop, PREVIEW_CHUNK_SIZE):
+        chunk = (slice(z0, min(z0 + PREVIEW_CHUNK_SIZE, stop)),) + region[1:]
+        sizes = labels.voxel_sizes(chunk)
+        preview[chunk] = ((sizes > 0) & (sizes <= min_size)) * 255
+    refresh_dialog(labels, min_size)
+    disk = 0
+    for filename in filenames:
+        disk += os.path.getsize(filename)
+        os.remove(filename)
+    return disk
+
+
+def sparse_removal(matrix, labels, preview, min_size):
+    # OnRemove and Window._remove_regions.
+    voxels, old_values = set_voxels(matrix, preview, 1, (1, 1, 1), PREVIEW_CHUNK_SIZE)
+    nodes = SparseEditionNode(voxels, old_values), SparseEditionNode(voxels, 1)
+    index = np.unravel_index(voxels, matrix.shape)
+    label_voxels = np.ravel_multi_index([i - 1 for i in index], labels.labels.shape)
+    assert labels.remove(label_voxels)
+    preview.reshape(-1)[label_voxels] = 0
+    refresh_dialog(labels, min_size)
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256])
+    parser.add_argument("--min-size", type=int, default=100)
+    args = parser.parse_args()
+
+    mb = 1024**2
+    print(
+        f"{'size':>5} {'removed':>9} {'full (s)':>9} {'full (MB)':>10} {'disk (MB)':>10} "
+        f"{'sparse (s)':>11} {'sparse (MB)':>12} {'disk (MB)':>10} {'same':>5} {'undo ok':>8}"
+    )
+    for size in args.sizes:
+        original = bordered(size)
+        sizes = IncrementalLabels(original[1:, 1:, 1:]).voxel_sizes()
+        original_preview = (((sizes > 0) & (sizes <= args.min_size)) * 255).astype(np.uint8)
+        del sizes
+
+        def make_state():
+            matrix = original.copy()
+            labels = IncrementalLabels(matrix[1:, 1:, 1:])
+            return matrix, labels, original_preview.copy(), args.min_size
+
+        t_full, m_full, d_full, (removed, full_labels, full_preview, _) = measure(
+            make_state, full_removal
+        )
+
+        t_sparse, m_sparse, (before, after), (matrix, labels, preview, _) = measure(
+            make_state, sparse_removal
+        )
+        d_sparse = os.path.getsize(before.filename) + os.path.getsize(after.filename)
+        same = (
+            bool((preview == full_preview).all())
+            and bool((labels.voxel_sizes() == full_labels.voxel_sizes()).all())
+            and labels.num_regions == full_labels.num_regions
+        )
+        undo_ok = bool((matrix == removed).all())
+        before.commit_history(matrix)
+        undo_ok &= bool((matrix == original).all())
+        after.commit_history(matrix)
+        undo_ok &= bool((matrix == removed).all())
+
+        print(
+            f"{size:>5} {np.count_nonzero(original_preview):>9} {t_full:>9.3f} "
+            f"{m_full / mb:>10.0f} {d_full / mb:>10.0f} {t_sparse:>11.3f} "
+            f"{m_sparse / mb:>12.1f} {d_sparse / mb:>10.1f} {same!s:>5} {undo_ok!s:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of the Voronoi border extraction in porous_creation.schwarzp.
+
+Compares the previous np.gradient based borders against the neighbour
+label comparison of voronoi_borders, in time and peak memory traced by
+tracemalloc, on a synthetic owner volume. Run from the repository root:
+
+    python -m benchmarks.bench_voronoi_borders --sizes 256 512
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from porous_creation import schwarzp
+
+
+def reference_borders(map_owners):
+    gz, gy, gx = np.gradient(map_owners)
+    mag = np.sqrt(gz*gz + gy*gy + gx*gx)
+    return mag > 0
+
+
+def synthetic_owners(size, cell_size=16, seed=0):
+    # Labelled blocks with jittered boundaries, as an int32 owner volume.
+    rng = np.random.default_rng(seed)
+    ncells = size // cell_size + 2
+    labels = rng.permutation(ncells ** 3).astype(np.int32).reshape(ncells, ncells, ncells)
+    coords = [
+        np.clip((np.arange(size) + rng.integers(0, cell_size, size)) // cell_size, 0, ncells - 1)
+        for _ in range(3)
+    ]
+    return labels[np.ix_(*coords)]
+
+
+def measure(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--no-reference", action="store_true",
+        help="skip the gradient path, which needs ~40 bytes/voxel",
+    )
+    args = parser.parse_args()
+
+    mb = 1024 ** 2
+    print(f"{'size':>5} {'gradient (s)':>13} {'gradient (MB)':>14} {'compare (s)':>12} {'compare (MB)':>13} {'equal':>6}")
+    for size in args.sizes:
+        map_owners = synthetic_owners(size)
+        t_new, m_new, new = measure(lambda: schwarzp.voronoi_borders(map_owners, workers=args.workers))
+        if args.no_reference:
+            print(f"{size:>5} {'-':>13} {'-':>14} {t_new:>12.3f} {m_new / mb:>13.0f} {'-':>6}")
+            continue
+        t_ref, m_ref, ref = measure(lambda: reference_borders(map_owners))
+        equal = bool((ref == new).all())
+        del ref, new
+        print(f"{size:>5} {t_ref:>13.3f} {m_ref / mb:>14.0f} {t_new:>12.3f} {m_new / mb:>13.0f} {equal!s:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+
+def make_key(func, params):
+    """
+    Key identifying the output of func(**params). Surfaces given as
+    ImplicitSurface objects are keyed by their expression.
+    """
+    items = []
+    for name, value in sorted(params.items()):
+        value = getattr(value, "expression", value)
+        items.append((name, value))
+    return (func.__name__, tuple(items))
+
+
+class ArrayCache:
+    """
+    LRU cache of numpy arrays bounded by their total size in bytes. Arrays
+    bigger than the cache itself are not stored. Safe to use from the
+    preview thread.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                return None
+            return self._items[key]
+
+    def put(self, key, array):
+        if array.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._items[key] = array
+            self.nbytes += array.nbytes
+            while self.nbytes > self.max_bytes:
+                _key, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
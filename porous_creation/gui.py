@@ -1,16 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import wx
 from invesalius.data import imagedata_utils
 from pubsub import pub as Publisher
 
-from . import schwarzp
+from . import cache, schwarzp, surface
 
 INIT_FROM = "-10"
 INIT_TO = "10"
 INIT_SIZE = "250"
+INIT_EXPRESSION = "cos(x) + cos(y) + cos(z)"
+
+CUSTOM_SURFACE = "Custom expression"
+
+PREVIEW_COARSE_FACTOR = 4
+PREVIEW_DELAY = 250
+MAX_SEED = 2**31 - 1
+
+# Generated previews and volumes, kept across dialogs. Cached volumes are
+# sent as they are to "Create project from matrix", which copies them.
+PREVIEW_CACHE = cache.ArrayCache(64 * 1024 ** 2)
+VOLUME_CACHE = cache.ArrayCache(512 * 1024 ** 2)
+
+OUTPUT_VOLUME = "Volume (new project)"
+OUTPUT_SURFACE = "Surface (STL file)"
 
 DISTANCE_TYPES = [
     "Euclidian",
@@ -18,7 +37,7 @@ DISTANCE_TYPES = [
 ]
 
 
-def np2bitmap(arr):
+def np2bitmap(arr, size=None):
     try:
         height, width, bands = arr.shape
         npimg = arr
@@ -33,6 +52,8 @@ def np2bitmap(arr):
 
     image = wx.Image(width, height)
     image.SetData(npimg.tostring())
+    if size is not None:
+        image.Rescale(*size)
     return image.ConvertToBitmap()
 
 
@@ -46,22 +67,16 @@ class GUISchwarzP(wx.Dialog):
         wx.Dialog.__init__(self, parent, -1, title=title, style=style)
 
         self.np_img = None
+        self.preview_id = 0
+        self.preview_timer = None
+        self.preview_executor = ThreadPoolExecutor(max_workers=1)
         self._init_gui()
         self._bind_events()
         self.update_image()
 
     def _init_gui(self):
 
-        options = [
-            "Schwarz P",
-            "Schwarz D",
-            "Gyroid",
-            "Neovius",
-            "iWP",
-            "P_W_Hybrid",
-            "Blobs",
-            "Voronoi",
-        ]
+        options = list(schwarzp.SURFACES) + [CUSTOM_SURFACE, "Blobs", "Voronoi"]
         self.cb_option = wx.ComboBox(
             self, -1, options[0], choices=options, style=wx.CB_READONLY
         )
@@ -72,17 +87,60 @@ class GUISchwarzP(wx.Dialog):
 
         self.spacing_panel = SpacingPanel(self)
 
+        self.schwarp_panel.show_expression(False)
         self.blobs_panel.Hide()
         self.voronoi_panel.Hide()
 
         self.image_panel = wx.Panel(self, -1)
         self.image_panel.SetMinSize(self.schwarp_panel.GetSizer().CalcMin())
+        # Why there is no preview, such as an invalid custom expression.
+        self.txt_preview_error = wx.StaticText(self, -1, "")
+        self.txt_preview_error.SetForegroundColour(wx.RED)
 
         self.cb_new_inv_instance = wx.CheckBox(
             self, -1, "Launch new InVesalius instance"
         )
         self.cb_new_inv_instance.SetValue(True)
 
+        self.rb_output = wx.RadioBox(
+            self, -1, "Output", choices=[OUTPUT_VOLUME, OUTPUT_SURFACE]
+        )
+        lbl_level = wx.StaticText(self, -1, "Surface level:", style=wx.ALIGN_RIGHT)
+        self.spin_level = wx.SpinCtrlDouble(
+            self, -1, value="0.0", min=-1000.0, max=1000.0, inc=0.01
+        )
+        self.spin_level.SetDigits(3)
+        self.spin_level.Enable(False)
+        level_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        level_sizer.Add(lbl_level, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL, 5)
+        level_sizer.Add(self.spin_level, 0)
+
+        lbl_seed = wx.StaticText(self, -1, "Seed:", style=wx.ALIGN_RIGHT)
+        self.spin_seed = wx.SpinCtrl(self, -1, min=0, max=MAX_SEED)
+        self.spin_seed.SetValue(random.randint(0, MAX_SEED))
+        self.btn_new_seed = wx.Button(self, -1, "New seed")
+
+        self.cb_preview_slice = wx.CheckBox(self, -1, "Preview volume slice")
+        self.cb_preview_slice.SetValue(False)
+        self.spin_preview_z = wx.SpinCtrl(self, -1, value="0", min=0, max=1000)
+
+        seed_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        seed_sizer.Add(lbl_seed, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL, 5)
+        seed_sizer.Add(self.spin_seed, 0, wx.RIGHT, 5)
+        seed_sizer.Add(self.btn_new_seed, 0)
+
+        preview_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        preview_sizer.Add(self.cb_preview_slice, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL, 5)
+        preview_sizer.Add(self.spin_preview_z, 0)
+
+        lbl_workers = wx.StaticText(self, -1, "Threads:", style=wx.ALIGN_RIGHT)
+        self.spin_workers = wx.SpinCtrl(
+            self, -1, value=str(os.cpu_count() or 1), min=1, max=256
+        )
+        workers_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        workers_sizer.Add(lbl_workers, 0, wx.RIGHT | wx.ALIGN_CENTER_VERTICAL, 5)
+        workers_sizer.Add(self.spin_workers, 0)
+
         self.button_ok = wx.Button(self, wx.ID_OK)
         self.button_cancel = wx.Button(self, wx.ID_CANCEL)
 
@@ -97,7 +155,13 @@ class GUISchwarzP(wx.Dialog):
         main_sizer.Add(self.blobs_panel, 0, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(self.voronoi_panel, 0, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(self.spacing_panel, 0, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(seed_sizer, 0, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(preview_sizer, 0, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(self.image_panel, 2, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(self.txt_preview_error, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        main_sizer.Add(workers_sizer, 0, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(self.rb_output, 0, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(level_sizer, 0, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(self.cb_new_inv_instance, 0, wx.EXPAND | wx.ALL, 5)
         main_sizer.Add(button_sizer, 0, wx.EXPAND | wx.ALL, 5)
 
@@ -110,131 +174,227 @@ class GUISchwarzP(wx.Dialog):
         #  self.image_panel.Bind(wx.EVT_ERASE_BACKGROUND, self.OnEraseBackground)
 
         self.cb_option.Bind(wx.EVT_COMBOBOX, self.OnSetValues)
+        self.spin_seed.Bind(wx.EVT_SPINCTRL, self.OnSetValues)
+        self.btn_new_seed.Bind(wx.EVT_BUTTON, self.OnNewSeed)
+        self.rb_output.Bind(wx.EVT_RADIOBOX, self.OnSetOutput)
+        self.cb_preview_slice.Bind(wx.EVT_CHECKBOX, self.OnSetValues)
+        self.spin_preview_z.Bind(wx.EVT_SPINCTRL, self.OnSetValues)
 
         self.button_ok.Bind(wx.EVT_BUTTON, self.OnOk)
         self.button_cancel.Bind(wx.EVT_BUTTON, self.OnCancel)
 
-    def update_image(self):
+    def get_generator(self, scale=1, preview=True):
+        """
+        Returns (function, params) such that function(**params) creates the
+        field for the current options: the 2D preview at 1/scale of the
+        resolution, or the whole volume. When previewing a volume slice the
+        preview is that Z slice of the (scaled) volume, created alone. The
+        parameters are read here, in the main thread, so the function can
+        be run in a background thread.
+        """
+        preview_slice = preview and self.cb_preview_slice.GetValue()
+        seed = self.spin_seed.GetValue()
+
+        def scaled(size):
+            return max(2, size // scale)
+
+        def scaled_z(size):
+            if preview_slice:
+                return scaled(size)
+            elif preview:
+                return 1
+            return size
+
         if self.cb_option.GetValue() == "Blobs":
-            size_x = self.blobs_panel.spin_size_x.GetValue()
-            size_y = self.blobs_panel.spin_size_y.GetValue()
-            size_z = self.blobs_panel.spin_size_z.GetValue()
-            gaussian = self.blobs_panel.spin_gaussian.GetValue()
-            self.np_img = np2bitmap(
-                schwarzp.create_blobs(size_x, size_y, 1, gaussian)[0]
-            )
+            func = schwarzp.create_blobs
+            params = {
+                "sx": scaled(self.blobs_panel.spin_size_x.GetValue()),
+                "sy": scaled(self.blobs_panel.spin_size_y.GetValue()),
+                "sz": scaled_z(self.blobs_panel.spin_size_z.GetValue()),
+                "gaussian": self.blobs_panel.spin_gaussian.GetValue() / scale,
+                "seed": seed,
+                # The dtype of the volume, so previews show its values.
+                "dtype": np.float32,
+            }
         elif self.cb_option.GetValue() == "Voronoi":
+            normalize = self.voronoi_panel.cb_normalize.GetValue()
+            borders = self.voronoi_panel.cb_borders.GetValue()
+            #  distance = self.voronoi_panel.cb_distance.GetSelection()
             if self.voronoi_panel.cb_distribution.GetValue() == "Random":
-                size_x = self.voronoi_panel.random_options.spin_size_x.GetValue()
-                size_y = self.voronoi_panel.random_options.spin_size_y.GetValue()
-                size_z = self.voronoi_panel.random_options.spin_size_z.GetValue()
-                number_sites = self.voronoi_panel.random_options.spin_nsites.GetValue()
-                #  distance = self.voronoi_panel.cb_distance.GetSelection()
-                normalize = self.voronoi_panel.cb_normalize.GetValue()
-                borders = self.voronoi_panel.cb_borders.GetValue()
-                self.np_img = np2bitmap(
-                    schwarzp.create_voronoi(size_x, size_y, 1, number_sites, normalize, borders)[0]
-                )
+                options = self.voronoi_panel.random_options
+                func = schwarzp.create_voronoi
+                params = {
+                    "sx": scaled(options.spin_size_x.GetValue()),
+                    "sy": scaled(options.spin_size_y.GetValue()),
+                    "sz": scaled_z(options.spin_size_z.GetValue()),
+                    "number_sites": options.spin_nsites.GetValue(),
+                    "normalize": normalize,
+                    "border": borders,
+                    "seed": seed,
+                }
             else:
-                size_x = self.voronoi_panel.non_random_options.spin_size_x.GetValue()
-                size_y = self.voronoi_panel.non_random_options.spin_size_y.GetValue()
-                size_z = self.voronoi_panel.non_random_options.spin_size_z.GetValue()
-                nsites_x = self.voronoi_panel.non_random_options.spin_nsites_x .GetValue()
-                nsites_y = self.voronoi_panel.non_random_options.spin_nsites_y.GetValue()
-                nsites_z = self.voronoi_panel.non_random_options.spin_nsites_z.GetValue()
-                #  distance = self.voronoi_panel.cb_distance.GetSelection()
-                noise = self.voronoi_panel.non_random_options.cb_noise.GetValue()
-                normalize = self.voronoi_panel.cb_normalize.GetValue()
-                borders = self.voronoi_panel.cb_borders.GetValue()
-                self.np_img = np2bitmap(
-                    schwarzp.create_voronoi_non_random(size_x, size_y, 3, nsites_x, nsites_y, 1, normalize, noise, borders)[0]
-                )
+                options = self.voronoi_panel.non_random_options
+                in_plane = preview and not preview_slice
+                func = schwarzp.create_voronoi_non_random
+                params = {
+                    "sx": scaled(options.spin_size_x.GetValue()),
+                    "sy": scaled(options.spin_size_y.GetValue()),
+                    "sz": 3 if in_plane else scaled_z(options.spin_size_z.GetValue()),
+                    "nsx": options.spin_nsites_x.GetValue(),
+                    "nsy": options.spin_nsites_y.GetValue(),
+                    "nsz": 1 if in_plane else options.spin_nsites_z.GetValue(),
+                    "normalize": normalize,
+                    "noise": options.cb_noise.GetValue(),
+                    "border": borders,
+                    "seed": seed,
+                }
         else:
-            init_x = self.schwarp_panel.spin_from_x.GetValue()
-            end_x = self.schwarp_panel.spin_to_x.GetValue()
-            size_x = self.schwarp_panel.spin_size_x.GetValue()
-
-            init_y = self.schwarp_panel.spin_from_y.GetValue()
-            end_y = self.schwarp_panel.spin_to_y.GetValue()
-            size_y = self.schwarp_panel.spin_size_y.GetValue()
-
-            init_z = self.schwarp_panel.spin_from_z.GetValue()
-            end_z = self.schwarp_panel.spin_to_z.GetValue()
-            size_z = self.schwarp_panel.spin_size_z.GetValue()
-
-            self.np_img = np2bitmap(
-                schwarzp.create_schwarzp(
-                    self.cb_option.GetValue(),
-                    init_x,
-                    end_x,
-                    init_y,
-                    end_y,
-                    1.0,
-                    1.0,
-                    size_x,
-                    size_y,
-                    1,
-                )[0]
+            in_plane = preview and not preview_slice
+            func = schwarzp.create_schwarzp
+            params = {
+                "method": self.get_surface(),
+                "init_x": self.schwarp_panel.spin_from_x.GetValue(),
+                "end_x": self.schwarp_panel.spin_to_x.GetValue(),
+                "init_y": self.schwarp_panel.spin_from_y.GetValue(),
+                "end_y": self.schwarp_panel.spin_to_y.GetValue(),
+                "init_z": 1.0 if in_plane else self.schwarp_panel.spin_from_z.GetValue(),
+                "end_z": 1.0 if in_plane else self.schwarp_panel.spin_to_z.GetValue(),
+                "sx": scaled(self.schwarp_panel.spin_size_x.GetValue()),
+                "sy": scaled(self.schwarp_panel.spin_size_y.GetValue()),
+                "sz": scaled_z(self.schwarp_panel.spin_size_z.GetValue()),
+            }
+
+        if preview_slice:
+            z = min(self.spin_preview_z.GetValue() // scale, params["sz"] - 1)
+            params["z_range"] = (z, z + 1)
+        return func, params
+
+    def compute_preview(self, generator):
+        func, params = generator
+        key = cache.make_key(func, params)
+        image = PREVIEW_CACHE.get(key)
+        if image is None:
+            image = func(**params)[0]
+            PREVIEW_CACHE.put(key, image)
+        return image
+
+    def compute_volume(self, generator):
+        """
+        Creates the int16 volume, or reuses it if it was already created
+        with the same parameters.
+        """
+        func, params = generator
+        key = cache.make_key(func, params)
+        schwarp_i16 = VOLUME_CACHE.get(key)
+        if schwarp_i16 is not None:
+            return schwarp_i16
+
+        workers = self.spin_workers.GetValue()
+        if func is schwarzp.create_schwarzp:
+            # Computed in float32 and scaled straight into the int16 volume.
+            schwarp_i16 = func(
+                **params, scale_to=(-1000, 1000), dtype=np.float32, workers=workers
             )
+        else:
+            schwarp_f = func(**params, workers=workers)
+            schwarp_i16 = schwarzp.normalize_volume(schwarp_f, min_=-1000, max_=1000)
+            del schwarp_f
+        VOLUME_CACHE.put(key, schwarp_i16)
+        return schwarp_i16
+
+    def update_image(self):
+        """
+        Shows a coarse preview right away and schedules the full resolution
+        one, which is computed in a background thread once the values stop
+        changing for PREVIEW_DELAY ms. Older requests are dropped. Previews
+        already computed are shown directly from the cache.
+        """
+        self.preview_id += 1
+        if self.preview_timer is not None:
+            self.preview_timer.Stop()
+            self.preview_timer = None
+
+        try:
+            coarse = self.get_generator(PREVIEW_COARSE_FACTOR)
+            refine = self.get_generator()
+            func, params = refine
+            image = PREVIEW_CACHE.get(cache.make_key(func, params))
+            if image is None:
+                coarse_image = self.compute_preview(coarse)
+        except (ValueError, SyntaxError) as err:
+            self._set_preview_error(self.preview_id, err)
+            return
+        self.txt_preview_error.SetLabel("")
+
+        if image is not None:
+            self.np_img = np2bitmap(image)
+            return
+
+        full_size = (params["sx"], params["sy"])
+        self.np_img = np2bitmap(coarse_image, size=full_size)
+        self.preview_timer = wx.CallLater(PREVIEW_DELAY, self._refine_preview, self.preview_id, refine)
+
+    def _refine_preview(self, preview_id, refine):
+        self.preview_timer = None
+        if preview_id == self.preview_id:
+            self.preview_executor.submit(self._compute_preview, preview_id, refine)
+
+    def _compute_preview(self, preview_id, refine):
+        # Runs in the preview thread. Skips requests that got stale while
+        # waiting in the queue.
+        if preview_id != self.preview_id:
+            return
+        try:
+            image = self.compute_preview(refine)
+        except (ValueError, SyntaxError) as err:
+            wx.CallAfter(self._set_preview_error, preview_id, err)
+            return
+        wx.CallAfter(self._set_preview, preview_id, image)
+
+    def _set_preview(self, preview_id, image):
+        if not self or preview_id != self.preview_id:
+            return
+        self.np_img = np2bitmap(image)
+        self.image_panel.Refresh()
+
+    def _set_preview_error(self, preview_id, error):
+        if not self or preview_id != self.preview_id:
+            return
+        self.np_img = None
+        self.txt_preview_error.SetLabel(str(error))
+        self.image_panel.Refresh()
+
+    def stop_preview(self):
+        self.preview_id += 1
+        if self.preview_timer is not None:
+            self.preview_timer.Stop()
+            self.preview_timer = None
+        self.preview_executor.shutdown(wait=False)
+
+    def get_surface(self):
+        option = self.cb_option.GetValue()
+        if option == CUSTOM_SURFACE:
+            expression = self.schwarp_panel.txt_expression.GetValue()
+            return schwarzp.ImplicitSurface(CUSTOM_SURFACE, expression=expression)
+        return option
 
     def OnCancel(self, evt):
+        self.stop_preview()
         self.Destroy()
 
     def OnOk(self, evt):
-        if self.cb_option.GetValue() == "Blobs":
-            size_x = self.blobs_panel.spin_size_x.GetValue()
-            size_y = self.blobs_panel.spin_size_y.GetValue()
-            size_z = self.blobs_panel.spin_size_z.GetValue()
-            gaussian = self.blobs_panel.spin_gaussian.GetValue()
-            schwarp_f = schwarzp.create_blobs(size_x, size_y, size_z, gaussian)
-        elif self.cb_option.GetValue() == "Voronoi":
-            if self.voronoi_panel.cb_distribution.GetValue() == "Random":
-                size_x = self.voronoi_panel.random_options.spin_size_x.GetValue()
-                size_y = self.voronoi_panel.random_options.spin_size_y.GetValue()
-                size_z = self.voronoi_panel.random_options.spin_size_z.GetValue()
-                number_sites = self.voronoi_panel.random_options.spin_nsites.GetValue()
-                #  distance = self.voronoi_panel.cb_distance.GetSelection()
-                normalize = self.voronoi_panel.cb_normalize.GetValue()
-                borders = self.voronoi_panel.cb_borders.GetValue()
-                schwarp_f = schwarzp.create_voronoi(size_x, size_y, size_z, number_sites, normalize, borders)
-            else:
-                size_x = self.voronoi_panel.non_random_options.spin_size_x.GetValue()
-                size_y = self.voronoi_panel.non_random_options.spin_size_y.GetValue()
-                size_z = self.voronoi_panel.non_random_options.spin_size_z.GetValue()
-                nsites_x = self.voronoi_panel.non_random_options.spin_nsites_x .GetValue()
-                nsites_y = self.voronoi_panel.non_random_options.spin_nsites_y.GetValue()
-                nsites_z = self.voronoi_panel.non_random_options.spin_nsites_z.GetValue()
-                #  distance = self.voronoi_panel.cb_distance.GetSelection()
-                noise = self.voronoi_panel.non_random_options.cb_noise.GetValue()
-                normalize = self.voronoi_panel.cb_normalize.GetValue()
-                borders = self.voronoi_panel.cb_borders.GetValue()
-                schwarp_f = schwarzp.create_voronoi_non_random(size_x, size_y, size_z, nsites_x, nsites_y, nsites_z, normalize, noise, borders)
-        else:
-            init_x = self.schwarp_panel.spin_from_x.GetValue()
-            end_x = self.schwarp_panel.spin_to_x.GetValue()
-            size_x = self.schwarp_panel.spin_size_x.GetValue()
-
-            init_y = self.schwarp_panel.spin_from_y.GetValue()
-            end_y = self.schwarp_panel.spin_to_y.GetValue()
-            size_y = self.schwarp_panel.spin_size_y.GetValue()
-
-            init_z = self.schwarp_panel.spin_from_z.GetValue()
-            end_z = self.schwarp_panel.spin_to_z.GetValue()
-            size_z = self.schwarp_panel.spin_size_z.GetValue()
-            schwarp_f = schwarzp.create_schwarzp(
-                self.cb_option.GetValue(),
-                init_x,
-                end_x,
-                init_y,
-                end_y,
-                init_z,
-                end_z,
-                size_x,
-                size_y,
-                size_z,
-            )
+        try:
+            generator = self.get_generator(preview=False)
+        except (ValueError, SyntaxError) as err:
+            wx.MessageBox(str(err), "Invalid expression", wx.OK | wx.ICON_ERROR)
+            return
         spacing = self.spacing_panel.get_spacing()
-        schwarp_i16 = imagedata_utils.image_normalize(schwarp_f, min_=-1000, max_=1000)
+
+        if self.rb_output.GetStringSelection() == OUTPUT_SURFACE:
+            self.save_surface(generator, spacing)
+            return
+
+        schwarp_i16 = self.compute_volume(generator)
         Publisher.sendMessage(
             "Create project from matrix",
             name="SchwarzP",
@@ -242,6 +402,7 @@ class GUISchwarzP(wx.Dialog):
             spacing=spacing,
             new_instance=self.cb_new_inv_instance.GetValue(),
         )
+        self.stop_preview()
         self.Close()
 
     def OnSetValues(self, evt):
@@ -259,11 +420,53 @@ class GUISchwarzP(wx.Dialog):
             self.blobs_panel.Hide()
             self.voronoi_panel.Hide()
             self.schwarp_panel.Show()
+            self.schwarp_panel.show_expression(
+                self.cb_option.GetValue() == CUSTOM_SURFACE
+            )
             self.Layout()
 
         self.update_image()
         self.image_panel.Refresh()
 
+    def save_surface(self, generator, spacing):
+        """
+        Extracts the isosurface straight from the float field, slab by slab,
+        and saves it as STL, instead of creating a project from the volume.
+        """
+        dlg = wx.FileDialog(
+            self,
+            "Save porous surface",
+            wildcard="STL files (*.stl)|*.stl",
+            style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT,
+        )
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        filename = dlg.GetPath()
+        dlg.Destroy()
+
+        func, params = generator
+        with wx.BusyCursor():
+            polydata = surface.create_surface(
+                func,
+                params,
+                level=self.spin_level.GetValue(),
+                spacing=spacing,
+                workers=self.spin_workers.GetValue(),
+            )
+            surface.save_stl(polydata, filename)
+        self.stop_preview()
+        self.Close()
+
+    def OnSetOutput(self, evt):
+        output_surface = self.rb_output.GetStringSelection() == OUTPUT_SURFACE
+        self.spin_level.Enable(output_surface)
+        self.cb_new_inv_instance.Enable(not output_surface)
+
+    def OnNewSeed(self, evt):
+        self.spin_seed.SetValue(random.randint(0, MAX_SEED))
+        self.OnSetValues(evt)
+
     def OnEraseBackground(self, evt):
         pass
 
@@ -394,8 +597,18 @@ class SchwarzPPanel(wx.Panel):
         sizer_dirs.Add(sizer_diry, 0, wx.ALL, 5)
         sizer_dirs.Add(sizer_dirz, 0, wx.ALL, 5)
 
+        # Custom expression
+        self.lbl_expression = wx.StaticText(self, -1, "f(x, y, z) =", style=wx.ALIGN_RIGHT)
+        self.txt_expression = wx.TextCtrl(
+            self, -1, INIT_EXPRESSION, style=wx.TE_PROCESS_ENTER
+        )
+        self.sizer_expression = wx.BoxSizer(wx.HORIZONTAL)
+        self.sizer_expression.Add(self.lbl_expression, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
+        self.sizer_expression.Add(self.txt_expression, 1, wx.EXPAND | wx.ALL, 5)
+
         main_sizer = wx.BoxSizer(wx.VERTICAL)
         main_sizer.Add(sizer_dirs, 0, wx.EXPAND | wx.ALL, 5)
+        main_sizer.Add(self.sizer_expression, 0, wx.EXPAND | wx.ALL, 5)
 
         self.SetSizer(main_sizer)
         main_sizer.Fit(self)
@@ -414,6 +627,13 @@ class SchwarzPPanel(wx.Panel):
         self.spin_to_z.Bind(wx.EVT_SPINCTRLDOUBLE, self.OnSetValues)
         self.spin_size_z.Bind(wx.EVT_SPINCTRL, self.OnSetValues)
 
+        self.txt_expression.Bind(wx.EVT_TEXT_ENTER, self.OnSetValues)
+
+    def show_expression(self, show):
+        self.lbl_expression.Show(show)
+        self.txt_expression.Show(show)
+        self.Layout()
+
     def OnSetValues(self, evt):
         self.Parent.OnSetValues(evt)
 
@@ -1,60 +1,588 @@
+import ast
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from scipy import ndimage as nd
 import random
 
-from invesalius_rs import jump_flooding
+from . import cache
 
 
 GAUSSIAN_SIGMA = 1.5
+CHUNK_SIZE = 16
+
+
+def iter_slabs(sz, chunk_size=CHUNK_SIZE):
+    for z0 in range(0, sz, chunk_size):
+        yield z0, min(z0 + chunk_size, sz)
+
+
+def _schwarz_p(cx, sx, cy, sy):
+    return cx + cy, [("cos", None)]
+
+
+def _schwarz_d(cx, sx, cy, sy):
+    return None, [("sin", sx * sy + cx * cy), ("cos", sx * cy + cx * sy)]
+
+
+def _gyroid(cx, sx, cy, sy):
+    return cx * sy, [("sin", cy), ("cos", sx)]
+
+
+def _neovius(cx, sx, cy, sy):
+    return 3 * (cx + cy), [("cos", 3 + 4 * cx * cy)]
+
+
+def _iwp(cx, sx, cy, sy):
+    return cx * cy, [("cos", cx + cy - cx * cy)]
+
+
+def _p_w_hybrid(cx, sx, cy, sy):
+    return 4.0 * cx * cy + 2.4, [("cos", 4.0 * (cx + cy) - 3 * cx * cy)]
+
+
+def _fill_separable(base, terms, tables, z0, z1, out, buf):
+    n = z1 - z0
+    add_base = base is not None
+    for i, (table, plane) in enumerate(terms):
+        zt = tables[table][z0:z1, np.newaxis, np.newaxis]
+        if i == 0:
+            if plane is None and add_base:
+                np.add(zt, base, out=out)
+                add_base = False
+            elif plane is None:
+                out[:] = zt
+            else:
+                np.multiply(zt, plane, out=out)
+        elif plane is None:
+            np.add(out, zt, out=out)
+        else:
+            np.multiply(zt, plane, out=buf[:n])
+            np.add(out, buf[:n], out=out)
+    if add_base:
+        np.add(out, base, out=out)
+
+
+# Functions and constants that can be used in custom surface expressions.
+EXPRESSION_NAMESPACE = {
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "abs": np.abs,
+    "pi": np.pi,
+}
+EXPRESSION_VARIABLES = ("x", "y", "z")
+_EXPRESSION_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Pow,
+    ast.USub,
+    ast.UAdd,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+)
+# Largest constant exponent allowed in expressions.
+MAX_EXPONENT = 16
+# Compiled expressions kept, see compile_expression.
+EXPRESSION_CACHE_SIZE = 32
+
+
+def _constant_value(node):
+    # Value of a number, possibly signed, or None for any other node.
+    sign = 1
+    while isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.USub):
+            sign = -sign
+        node = node.operand
+    if isinstance(node, ast.Constant):
+        return sign * node.value
+    return None
+
+
+def _uses_variables(node):
+    return any(isinstance(n, ast.Name) and n.id in EXPRESSION_VARIABLES for n in ast.walk(node))
+
+
+class _FloatConstants(ast.NodeTransformer):
+    # Integer constants become floats, so constant arithmetic overflows
+    # instead of growing Python integers without bound.
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expression):
+    """
+    Compiles an implicit function of x, y and z, e.g. "cos(x) + cos(y) +
+    cos(z)", into a vectorized evaluator. Only +, -, *, /, ** (with
+    constant exponents up to MAX_EXPONENT or exponents of x, y and z) and
+    the names in EXPRESSION_NAMESPACE are allowed. Errors while evaluating
+    are raised as ValueError, and checked once here. The last
+    EXPRESSION_CACHE_SIZE compiled expressions are cached by their string.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as err:
+        raise ValueError(f"Invalid expression: {expression}") from err
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES):
+            raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in EXPRESSION_NAMESPACE and node.id not in EXPRESSION_VARIABLES:
+            raise ValueError(f"Unknown name in expression: {node.id}")
+        if isinstance(node, ast.Constant) and (
+            isinstance(node.value, bool) or not isinstance(node.value, (int, float))
+        ):
+            raise ValueError(f"Invalid constant in expression: {node.value!r}")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow) and not _uses_variables(node.right):
+            exponent = _constant_value(node.right)
+            if exponent is None or abs(exponent) > MAX_EXPONENT:
+                raise ValueError(
+                    f"Exponents must be x, y, z or numbers up to {MAX_EXPONENT}"
+                )
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and callable(EXPRESSION_NAMESPACE.get(node.func.id))):
+                raise ValueError("Only the functions {} can be called".format(
+                    ", ".join(k for k, v in EXPRESSION_NAMESPACE.items() if callable(v))
+                ))
+            if len(node.args) != 1 or node.keywords:
+                raise ValueError(f"{node.func.id} takes exactly one argument")
+
+    tree = ast.fix_missing_locations(_FloatConstants().visit(tree))
+    code = compile(tree, "<expression>", "eval")
+    namespace = {"__builtins__": {}, **EXPRESSION_NAMESPACE}
+
+    def evaluator(x, y, z):
+        try:
+            return eval(code, namespace, {"x": x, "y": y, "z": z})
+        except (ArithmeticError, TypeError) as err:
+            raise ValueError(f"Can't evaluate expression {expression}: {err}") from err
+
+    # Errors of the constant parts don't depend on the grid, they are
+    # found here, where callers validate the expression.
+    evaluator(*[np.zeros((1, 1, 1))] * 3)
+    return evaluator
+
+
+class ImplicitSurface:
+    """
+    Implicit function f(x, y, z) used to create porous volumes. Built-in
+    TPMS are given in separable form: a function of the cos/sin of x and y
+    returning base(y, x) and a list of (table, plane) terms, so the field is
+    base + sum(table(z) * plane) with table the "cos" or "sin" of z (plane
+    None means the table is just added). Any other surface is given as an
+    expression of x, y and z (see compile_expression).
+    """
+
+    def __init__(self, name, expression=None, separable=None):
+        if (expression is None) == (separable is None):
+            raise ValueError("Give either an expression or a separable form")
+        self.name = name
+        self.expression = expression
+        self.separable = separable
+        if expression is not None:
+            self.evaluator = compile_expression(expression)
+        else:
+            self.evaluator = None
+
+    def slab_evaluator(self, x, y, z, chunk_size, dtype=np.float64):
+        """
+        Returns fill(z0, z1, out), which writes the field of the slab z0:z1
+        (at most chunk_size slices) into the float array out, computing it
+        in dtype. x, y and z are the open grids from np.ogrid.
+        """
+        if self.separable is None:
+            evaluator = self.evaluator
+            x, y, z = x.astype(dtype), y.astype(dtype), z.astype(dtype)
+
+            def fill(z0, z1, out):
+                out[:] = evaluator(x, y, z[z0:z1])
+
+            return fill
+
+        # The tables are computed in float64 and only then cast to dtype.
+        base, terms = self.separable(np.cos(x[0]), np.sin(x[0]), np.cos(y[0]), np.sin(y[0]))
+        if base is not None:
+            base = np.asarray(base, dtype=dtype)
+        terms = [(table, None if plane is None else plane.astype(dtype)) for table, plane in terms]
+        tables = {
+            "cos": np.cos(z.ravel()).astype(dtype),
+            "sin": np.sin(z.ravel()).astype(dtype),
+        }
+        if len(terms) > 1:
+            buf = np.empty((chunk_size, y.shape[1], x.shape[2]), dtype=dtype)
+        else:
+            buf = None
+
+        def fill(z0, z1, out):
+            _fill_separable(base, terms, tables, z0, z1, out, buf)
+
+        return fill
+
+
+SURFACES = {}
+
+
+def register_surface(name, expression=None, separable=None):
+    """Adds a surface to the registry, listed in the GUI by its name."""
+    surface = ImplicitSurface(name, expression=expression, separable=separable)
+    SURFACES[name] = surface
+    return surface
+
+
+def get_surface(method):
+    if isinstance(method, ImplicitSurface):
+        return method
+    try:
+        return SURFACES[method]
+    except KeyError:
+        raise ValueError(f"Unknown surface type: {method}")
+
+
+register_surface("Schwarz P", separable=_schwarz_p)
+register_surface("Schwarz D", separable=_schwarz_d)
+register_surface("Gyroid", separable=_gyroid)
+register_surface("Neovius", separable=_neovius)
+register_surface("iWP", separable=_iwp)
+register_surface("P_W_Hybrid", separable=_p_w_hybrid)
+register_surface(
+    "Fischer-Koch S",
+    expression="cos(2*x)*sin(y)*cos(z) + cos(x)*cos(2*y)*sin(z) + sin(x)*cos(y)*cos(2*z)",
+)
+register_surface(
+    "Lidinoid",
+    expression="0.5*(sin(2*x)*cos(y)*sin(z) + sin(2*y)*cos(z)*sin(x) + sin(2*z)*cos(x)*sin(y))"
+    " - 0.5*(cos(2*x)*cos(2*y) + cos(2*y)*cos(2*z) + cos(2*z)*cos(2*x)) + 0.15",
+)
+
 
+def create_schwarzp(method, init_x, end_x, init_y, end_y, init_z, end_z, sx=256, sy=256, sz=256, out=None, chunk_size=CHUNK_SIZE, workers=1, z_range=None, dtype=np.float64, scale_to=None):
+    """
+    Evaluates the implicit surface method (a registered name or an
+    ImplicitSurface) slab by slab along Z, so the working set is bounded by
+    chunk_size * sy * sx voxels per worker. The field is computed in dtype,
+    or in the dtype of out if it is a float array; out is filled in place
+    and returned. If z_range is given only the slices
+    z_range[0]:z_range[1] are created.
+
+    If scale_to=(min_, max_) is given the field is scaled to that range into
+    an int16 out, as imagedata_utils.image_normalize does, without storing
+    the float field: a first pass finds its range and a second one computes
+    it again and writes the scaled values.
+    """
+    surface = get_surface(method)
 
-def create_schwarzp(method, init_x, end_x, init_y, end_y, init_z, end_z, sx=256, sy=256, sz=256):
     z, y, x = np.ogrid[
         init_z : end_z : complex(0, sz),
         init_y : end_y : complex(0, sy),
         init_x : end_x : complex(0, sx),
     ]
-    if method == 'Schwarz P':
-        return np.cos(x) + np.cos(y) + np.cos(z)
-    elif method == 'Schwarz D':
-        return np.sin(x)*np.sin(y)*np.sin(z) + np.sin(x)*np.cos(y)*np.cos(z) + np.cos(x)*np.sin(y)*np.cos(z) + np.cos(x)*np.cos(y)*np.sin(z)
-    elif method == 'Gyroid':
-        return np.cos(x) * np.sin(y) + np.cos(y) * np.sin(z) + np.cos(z) * np.sin(x)
-    elif method == 'Neovius':
-        return 3 * (np.cos(x) + np.cos(y) + np.cos(z)) + 4 * np.cos(x) * np.cos(y) * np.cos(z)
-    elif method == 'iWP':
-        return np.cos(x) * np.cos(y) + np.cos(y) * np.cos(z) + np.cos(z) * np.cos(x) - np.cos(x) * np.cos(y) * np.cos(z)
-    elif method == 'P_W_Hybrid':
-        return 4.0 * (np.cos(x) * np.cos(y) + np.cos(y) * np.cos(z) + np.cos(z) * np.cos(x)) - 3 * np.cos(x) * np.cos(y) * np.cos(z) + 2.4
-
-
-def create_blobs(sx=256, sy=256, sz=256, gaussian=5):
-    random_image = np.random.random((sz, sy, sx))
+    if z_range is not None:
+        z = z[z_range[0] : z_range[1]]
+        sz = z.shape[0]
+
+    if out is None:
+        out = np.empty((sz, sy, sx), dtype=np.int16 if scale_to is not None else dtype)
+    if out.dtype.kind == "f":
+        dtype = out.dtype
+    chunk_size = min(chunk_size, sz)
+
+    def evaluate(consume=None):
+        # Float outputs are filled in place, otherwise each slab is computed
+        # in a work buffer and given to consume(z0, z1, field).
+        def evaluate_range(start, end):
+            fill = surface.slab_evaluator(x, y, z, chunk_size, dtype)
+            if consume is not None:
+                work = np.empty((chunk_size, sy, sx), dtype=dtype)
+            for z0, z1 in iter_slabs(end - start, chunk_size):
+                z0, z1 = z0 + start, z1 + start
+                if consume is None:
+                    fill(z0, z1, out[z0:z1])
+                else:
+                    fill(z0, z1, work[: z1 - z0])
+                    consume(z0, z1, work[: z1 - z0])
+
+        run_slabs(evaluate_range, sz, workers)
+
+    if scale_to is None:
+        if out.dtype.kind == "f":
+            evaluate()
+        else:
+            evaluate(lambda z0, z1, field: out.__setitem__(slice(z0, z1), field))
+        return out
+
+    ranges = []
+    evaluate(lambda z0, z1, field: ranges.append((field.min(), field.max())))
+    imin = min(r[0] for r in ranges)
+    imax = max(r[1] for r in ranges)
+    min_, max_ = scale_to
+    if imin == imax:
+        out[:] = min_
+        return out
+    scale = (max_ - min_) / (imax - imin)
+    evaluate(lambda z0, z1, field: _scale_into(field, imin, scale, min_, out[z0:z1]))
+    return out
+
+
+def _scale_into(field, imin, scale, min_, out):
+    # (field - imin) * scale + min_ in place on the work buffer.
+    field -= imin
+    field *= scale
+    field += min_
+    out[:] = field
+
+
+def normalize_volume(image, min_=0, max_=1, out=None, chunk_size=CHUNK_SIZE):
+    """
+    Same as imagedata_utils.image_normalize, but scales slab by slab into an
+    int16 output instead of creating full volume float64 temporaries.
+    """
+    if out is None:
+        out = np.empty(image.shape, dtype=np.int16)
+    imin, imax = image.min(), image.max()
+    if imin == imax:
+        out[:] = min_
+        return out
+    scale = (max_ - min_) / (imax - imin)
+    for z0, z1 in iter_slabs(image.shape[0], chunk_size):
+        field = image[z0:z1].astype(np.promote_types(image.dtype, np.float32))
+        _scale_into(field, imin, scale, min_, out[z0:z1])
+    return out
+
+
+def run_slabs(func, sz, workers=1):
+    """
+    Splits [0, sz) in one contiguous Z range per worker and calls
+    func(start, end) for each of them in a thread pool. NumPy ufuncs and
+    scipy.ndimage filters release the GIL, so the ranges run in parallel.
+    """
+    workers = max(1, min(workers, sz))
+    if workers == 1:
+        func(0, sz)
+        return
+    bounds = np.linspace(0, sz, workers + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(func, start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+        for future in futures:
+            future.result()
+
+
+def _gaussian_radius(sigma, truncate=4.0):
+    # Same kernel radius used by nd.gaussian_filter.
+    return int(truncate * float(sigma) + 0.5)
+
+
+def gaussian_filter(image, sigma, workers=1, truncate=4.0):
+    """
+    nd.gaussian_filter computed by Z slabs in parallel. Each slab is read
+    with a halo of the kernel radius, so the result is bit-identical to the
+    serial filter.
+    """
+    if workers <= 1 or image.shape[0] == 1:
+        return nd.gaussian_filter(image, sigma, truncate=truncate)
+    sz = image.shape[0]
+    halo = _gaussian_radius(sigma, truncate)
+    out = np.empty(image.shape, dtype=image.dtype)
+
+    def filter_range(start, end):
+        h0 = max(0, start - halo)
+        h1 = min(sz, end + halo)
+        filtered = nd.gaussian_filter(image[h0:h1], sigma, truncate=truncate)
+        out[start:end] = filtered[start - h0 : end - h0]
+
+    run_slabs(filter_range, sz, workers)
+    return out
+
+
+def _axis_borders(owners, axis, out):
+    # out |= (np.gradient(owners, axis=axis) != 0): central differences
+    # inside, one-sided ones on the edges.
+    n = owners.shape[axis]
+    if n < 2:
+        return
+
+    def index(start, stop):
+        idx = [slice(None)] * owners.ndim
+        idx[axis] = slice(start, stop)
+        return tuple(idx)
+
+    out[index(1, -1)] |= owners[index(2, None)] != owners[index(None, -2)]
+    edge = owners[index(1, 2)] != owners[index(0, 1)]
+    out[index(0, 1)] |= edge
+    edge = owners[index(n - 1, n)] != owners[index(n - 2, n - 1)]
+    out[index(n - 1, n)] |= edge
+
+
+def voronoi_borders(map_owners, out=None, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Voxels where the owner changes, the same as np.gradient(map_owners)
+    being non-zero on any axis. Neighbour labels are compared directly, slab
+    by slab, into a bool volume instead of creating float64 gradients.
+    """
+    sz = map_owners.shape[0]
+    if out is None:
+        out = np.empty(map_owners.shape, dtype=bool)
+
+    def borders_range(start, end):
+        for z0, z1 in iter_slabs(end - start, chunk_size):
+            z0, z1 = z0 + start, z1 + start
+            slab = out[z0:z1]
+            slab[:] = False
+            for axis in range(1, map_owners.ndim):
+                _axis_borders(map_owners[z0:z1], axis, slab)
+            if sz < 2:
+                continue
+            # Along Z the slab reads one slice before and after it.
+            i0, i1 = max(z0, 1), min(z1, sz - 1)
+            if i0 < i1:
+                slab[i0 - z0 : i1 - z0] |= map_owners[i0 + 1 : i1 + 1] != map_owners[i0 - 1 : i1 - 1]
+            if z0 == 0:
+                slab[0] |= map_owners[1] != map_owners[0]
+            if z1 == sz:
+                slab[-1] |= map_owners[-1] != map_owners[-2]
+
+    run_slabs(borders_range, sz, workers)
+    return out
+
+
+def _voronoi_borders(map_owners, workers=1):
+    borders = voronoi_borders(map_owners, workers=workers)
+    return gaussian_filter(borders.astype(np.float32), GAUSSIAN_SIGMA, workers)
+
+
+def _get_seed(seed):
+    """
+    Integer seed from an int, a np.random.Generator or None. None draws it
+    from the global np.random state.
+    """
+    if seed is None:
+        return int(np.random.randint(0, 2**31 - 1))
+    if isinstance(seed, np.random.Generator):
+        return int(seed.integers(0, 2**63 - 1))
+    return int(seed)
+
+
+def _get_rng(seed):
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(_get_seed(seed))
+
+
+def _random_slices(seed, out, z0):
+    # Each slice has its own generator, so any slab of the volume can be
+    # recreated without generating the slices before it. The noise is always
+    # drawn in float64, so a seed gives the same volume in any dtype.
+    buf = None if out.dtype == np.float64 else np.empty(out.shape[1:])
+    for i in range(out.shape[0]):
+        rng = np.random.default_rng([seed, z0 + i])
+        if buf is None:
+            rng.random(out=out[i])
+        else:
+            rng.random(out=buf)
+            out[i] = buf
+
+
+def create_blobs(sx=256, sy=256, sz=256, gaussian=5, workers=1, seed=None, z_range=None, dtype=np.float64):
+    """
+    Gaussian filtered noise, created and filtered in dtype (float32 halves
+    the memory). Giving the same seed gives the same volume. If
+    z_range is given only the slices z_range[0]:z_range[1] are created, from
+    the noise of those slices plus a halo of the gaussian radius, and they
+    are identical to the same slices of the whole volume.
+    """
+    seed = _get_seed(seed)
+    if z_range is None:
+        random_image = np.empty((sz, sy, sx), dtype=dtype)
+        run_slabs(lambda start, end: _random_slices(seed, random_image[start:end], start), sz, workers)
+        image = gaussian_filter(random_image, gaussian, workers)
+        return image
+
+    z0, z1 = z_range
+    halo = _gaussian_radius(gaussian)
+    h0, h1 = max(0, z0 - halo), min(sz, z1 + halo)
+    random_image = np.empty((h1 - h0, sy, sx), dtype=dtype)
+    _random_slices(seed, random_image, h0)
     image = nd.gaussian_filter(random_image, sigma=gaussian)
-    return image
+    return image[z0 - h0 : z1 - h0]
 
 
-def create_voronoi(sx=256, sy=256, sz=256, number_sites=1000, normalize=False, border=True):
+# Jump flooding results, the owners (for the borders) or the distances of
+# whole Voronoi volumes, so the slices of one volume are previewed, and the
+# volume made, without flooding it again.
+FLOOD_CACHE_BYTES = 256 * 1024 ** 2
+_FLOOD_CACHE = cache.ArrayCache(FLOOD_CACHE_BYTES)
+
+
+def _flood(sites, sx, sy, sz, normalize, border):
+    # The owners of the voxels if border, else their distances, and
+    # whether they are kept in the cache. Computed without holding any
+    # lock, so a preview in another thread never waits for this one.
+    # invesalius_rs is only needed by the Voronoi generators.
+    from invesalius_rs import jump_flooding
+
+    key = (sites.tobytes(), sx, sy, sz, normalize, border)
+    flood = _FLOOD_CACHE.get(key)
+    if flood is not None:
+        return flood, True
     distance_map = np.zeros((sz, sy, sx), dtype=np.float32)
     map_owners = np.zeros((sz, sy, sx), dtype=np.int32)
-    sites = np.random.randint((0, 0, 0), (sz, sy, sx), (number_sites, 3), dtype=np.int32)
     jump_flooding(distance_map, map_owners, sites, normalize)
-    if border:
-        if sz == 1:
-            gy, gx = np.gradient(map_owners[0])
-            mag = np.sqrt(gy*gy + gx*gx).reshape(sz, sy, sx)
-        else:
-            gz, gy, gx = np.gradient(map_owners)
-            mag = np.sqrt(gz*gz + gy*gy + gx*gx)
-        borders =  mag > 0
-        return nd.gaussian_filter(borders.astype(np.float32), GAUSSIAN_SIGMA)
-    else:
-        return distance_map
+    flood = map_owners if border else distance_map
+    del distance_map, map_owners
+    _FLOOD_CACHE.put(key, flood)
+    return flood, _FLOOD_CACHE.get(key) is flood
 
 
-def create_voronoi_non_random(sx=256, sy=256, sz=256, nsx=25, nsy=25, nsz=25, normalize=False, noise=False, border=True):
-    distance_map = np.zeros((sz, sy, sx), dtype=np.float32)
-    map_owners = np.zeros((sz, sy, sx), dtype=np.int32)
+def _voronoi_volume(sites, sx, sy, sz, normalize, border, workers=1, z_range=None):
+    """
+    Voronoi volume of sites by jump flooding, its blurred borders if
+    border. jump_flooding can't flood part of a volume, so for z_range the
+    whole volume is flooded (and kept for the next z_range and the whole
+    volume, see _flood), and only the slices z_range[0]:z_range[1] are
+    made from it, with a halo of the gaussian radius for the borders. They
+    are identical to the same slices of the whole volume.
+    """
+    flood, cached = _flood(sites, sx, sy, sz, normalize, border)
+    if z_range is None:
+        if border:
+            return _voronoi_borders(flood, workers)
+        return flood.copy() if cached else flood
+
+    z0, z1 = z_range
+    if not border:
+        return flood[z0:z1].copy()
+    halo = _gaussian_radius(GAUSSIAN_SIGMA)
+    h0, h1 = max(0, z0 - halo), min(sz, z1 + halo)
+    # The borders of a slice compare it with the slices around it.
+    b0, b1 = max(0, h0 - 1), min(sz, h1 + 1)
+    borders = voronoi_borders(flood[b0:b1])[h0 - b0 : h1 - b0]
+    image = nd.gaussian_filter(borders.astype(np.float32), GAUSSIAN_SIGMA)
+    return image[z0 - h0 : z1 - h0]
+
+
+def create_voronoi(sx=256, sy=256, sz=256, number_sites=1000, normalize=False, border=True, workers=1, seed=None, z_range=None):
+    """
+    Voronoi cells of number_sites random sites. Giving the same seed gives
+    the same sites. If z_range is given only the slices
+    z_range[0]:z_range[1] are returned (see _voronoi_volume).
+    """
+    rng = _get_rng(seed)
+    sites = rng.integers((0, 0, 0), (sz, sy, sx), (number_sites, 3), dtype=np.int32)
+    return _voronoi_volume(sites, sx, sy, sz, normalize, border, workers, z_range)
+
+
+def create_voronoi_non_random(sx=256, sy=256, sz=256, nsx=25, nsy=25, nsz=25, normalize=False, noise=False, border=True, workers=1, seed=None, z_range=None):
     x = np.arange(nsx)
     y = np.arange(nsy)
     z = np.arange(nsz)
@@ -64,21 +592,10 @@ def create_voronoi_non_random(sx=256, sy=256, sz=256, nsx=25, nsy=25, nsz=25, no
     z = (z.flatten() + 0.5)
     sites = np.stack((z, y, x), axis=1)
     if noise:
-        r_noise = np.random.random(sites.shape) * 0.5 - 0.25
+        r_noise = _get_rng(seed).random(sites.shape) * 0.5 - 0.25
         sites += r_noise
     sites[:, 0] *= (sz / nsz)
     sites[:, 1] *= (sy / nsy)
     sites[:, 2] *= (sx / nsx)
     sites = np.array(sites, dtype=np.int32)
-    jump_flooding(distance_map, map_owners, sites, normalize)
-    if border:
-        if sz == 1:
-            gy, gx = np.gradient(map_owners[0])
-            mag = np.sqrt(gy**2 + gx**2).reshape(sz, sy, sx)
-        else:
-            gz, gy, gx = np.gradient(map_owners)
-            mag = np.sqrt(gz**2 + gy**2 + gx**2)
-        borders =  mag > 0
-        return nd.gaussian_filter(borders.astype(np.float32), GAUSSIAN_SIGMA)
-    else:
-        return distance_map
+    return _voronoi_volume(sites, sx, sy, sz, normalize, border, workers, z_range)
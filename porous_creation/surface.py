@@ -0,0 +1,148 @@
+import numpy as np
+from vtkmodules.util import numpy_support
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkImageData, vtkPolyData
+from vtkmodules.vtkFiltersCore import vtkFlyingEdges3D
+from vtkmodules.vtkIOGeometry import vtkSTLWriter
+
+from . import schwarzp
+
+SURFACE_CHUNK_SIZE = 64
+
+
+def _contour_slab(field, level):
+    """
+    Marching cubes of a (nz, ny, nx) slab in voxel coordinates. Returns the
+    points (x, y, z) and the triangles as numpy arrays.
+    """
+    nz, ny, nx = field.shape
+    scalars = numpy_support.numpy_to_vtk(
+        np.ascontiguousarray(field, dtype=np.float32).ravel(), deep=True
+    )
+    image = vtkImageData()
+    image.SetDimensions(nx, ny, nz)
+    image.GetPointData().SetScalars(scalars)
+
+    flying_edges = vtkFlyingEdges3D()
+    flying_edges.SetInputData(image)
+    flying_edges.SetValue(0, level)
+    flying_edges.ComputeNormalsOff()
+    flying_edges.ComputeGradientsOff()
+    flying_edges.ComputeScalarsOff()
+    flying_edges.Update()
+
+    output = flying_edges.GetOutput()
+    if output.GetNumberOfPolys() == 0:
+        return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int64)
+    points = numpy_support.vtk_to_numpy(output.GetPoints().GetData())
+    triangles = numpy_support.vtk_to_numpy(output.GetPolys().GetConnectivityArray())
+    return points, triangles.reshape(-1, 3).astype(np.int64)
+
+
+def _weld(prev_xy, prev_ids, cur_xy):
+    """
+    Ids of the points cur_xy in the previous slab, matching exact (x, y)
+    coordinates on the shared plane, or -1 if there is no such point.
+    """
+    ids = np.full(len(cur_xy), -1, dtype=np.int64)
+    if len(prev_xy) == 0 or len(cur_xy) == 0:
+        return ids
+    _uniq, inverse = np.unique(
+        np.concatenate((prev_xy, cur_xy)), axis=0, return_inverse=True
+    )
+    inverse = inverse.ravel()
+    lookup = np.full(inverse.max() + 1, -1, dtype=np.int64)
+    lookup[inverse[: len(prev_xy)]] = prev_ids
+    return lookup[inverse[len(prev_xy):]]
+
+
+def to_polydata(points, triangles):
+    polydata = vtkPolyData()
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+    polydata.SetPoints(vtk_points)
+
+    offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64)
+    polys = vtkCellArray()
+    polys.SetData(
+        numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=True),
+        numpy_support.numpy_to_vtkIdTypeArray(triangles.ravel(), deep=True),
+    )
+    polydata.SetPolys(polys)
+    return polydata
+
+
+def contour_slabs(slabs, level=0.0, spacing=(1.0, 1.0, 1.0)):
+    """
+    Isosurface at level of a volume given as slabs: an iterable of (z0,
+    field) where field holds slices z0 to z0 + len(field) - 1 and each slab
+    starts at the last slice of the previous one. Points on that shared
+    slice are welded, so the result has no seams between slabs. Returns a
+    vtkPolyData in physical coordinates.
+    """
+    all_points = []
+    all_triangles = []
+    npoints = 0
+    prev_xy = np.empty((0, 2), dtype=np.float32)
+    prev_ids = np.empty(0, dtype=np.int64)
+    for z0, field in slabs:
+        points, triangles = _contour_slab(field, level)
+        top = len(field) - 1
+
+        bottom = points[:, 2] == 0
+        welded = _weld(prev_xy, prev_ids, points[bottom, :2])
+        ids = np.empty(len(points), dtype=np.int64)
+        ids[bottom] = welded
+        new = ids == -1
+        new[~bottom] = True
+        ids[new] = np.arange(npoints, npoints + new.sum())
+        npoints += new.sum()
+
+        points = points[new]
+        points[:, 2] += z0
+        all_points.append(points)
+        all_triangles.append(ids[triangles])
+
+        top_mask = points[:, 2] == z0 + top
+        prev_xy = points[top_mask, :2]
+        prev_ids = ids[new][top_mask]
+
+    points = np.concatenate(all_points).astype(np.float32)
+    triangles = np.concatenate(all_triangles)
+    points *= np.array(spacing, dtype=np.float32)
+    return to_polydata(points, triangles)
+
+
+def create_surface(func, params, level=0.0, spacing=(1.0, 1.0, 1.0), chunk_size=SURFACE_CHUNK_SIZE, workers=1):
+    """
+    Isosurface at level of the field func(**params) (one of the schwarzp
+    generators), without creating an intermediate int16 volume. Implicit
+    surfaces are generated slab by slab, so only chunk_size slices of the
+    field exist at a time. The other generators create the whole float
+    field first.
+    """
+    sz = params["sz"]
+    if func is schwarzp.create_schwarzp:
+        def get_slab(z0, z1):
+            out = np.empty((z1 - z0, params["sy"], params["sx"]), dtype=np.float32)
+            return func(**params, out=out, workers=workers, z_range=(z0, z1))
+    else:
+        field = func(**params, workers=workers)
+
+        def get_slab(z0, z1):
+            return field[z0:z1]
+
+    def slabs():
+        for z0 in range(0, max(sz - 1, 1), chunk_size):
+            z1 = min(z0 + chunk_size, sz - 1)
+            yield z0, get_slab(z0, z1 + 1)
+
+    return contour_slabs(slabs(), level, spacing)
+
+
+def save_stl(polydata, filename):
+    writer = vtkSTLWriter()
+    writer.SetInputData(polydata)
+    writer.SetFileName(filename)
+    writer.SetFileTypeToBinary()
+    writer.Write()
@@ -1,10 +1,26 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import wx
 from invesalius import project
 from invesalius.gui.utils import calc_width_needed
 from invesalius.utils import new_name_by_pattern
 from pubsub import pub as Publisher
+from vtkmodules.vtkCommonDataModel import vtkPolyData
+
+from .remove_non_visible_faces import (
+    RENDER_SIZE,
+    VisibilityCancelled,
+    VisibilityEngine,
+    remove_non_visible_faces,
+)
 
-from .remove_non_visible_faces import remove_non_visible_faces
+ENGINE_CHOICES = {
+    "Points (z-buffer)": "points",
+    "Faces (cell ids)": "cells",
+    "Faces (CPU ray casting)": "raycast",
+}
 
 
 class Window(wx.Dialog):
@@ -15,6 +31,14 @@ class Window(wx.Dialog):
             style=wx.DEFAULT_DIALOG_STYLE | wx.FRAME_FLOAT_ON_PARENT,
         )
 
+        # OpenGL must stay on the main thread (Cocoa and GLX render windows
+        # can't be used from other threads), so the "points" and "cells"
+        # engines render one viewpoint per event loop step, see _step. The
+        # passes without OpenGL, and the whole "raycast" engine, run in this
+        # worker thread.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.cancel_event = None
+
         self._init_gui()
         self._bind_events()
         self._bind_ps_events()
@@ -26,6 +50,28 @@ class Window(wx.Dialog):
         )
         self.overwrite_check = wx.CheckBox(self, -1, "Overwrite surface")
         self.remove_visible_check = wx.CheckBox(self, -1, "Remove visible faces")
+        self.engine_choice = wx.Choice(self, -1, choices=list(ENGINE_CHOICES))
+        self.engine_choice.SetSelection(0)
+        self.sphere_check = wx.CheckBox(self, -1, "Sample viewpoints on a sphere")
+        self.skip_enclosed_check = wx.CheckBox(self, -1, "Drop enclosed shells without rendering")
+        self.skip_enclosed_check.SetValue(False)
+        self.viewpoints_spin = wx.SpinCtrl(self, -1, value="32", min=1, max=1000)
+        self.render_size_spin = wx.SpinCtrl(
+            self, -1, value=str(RENDER_SIZE), min=100, max=8192
+        )
+        self.min_new_points_spin = wx.SpinCtrl(self, -1, value="0", min=0, max=10**9)
+        self.min_new_points_spin.SetToolTip(
+            "Stop once a viewpoint adds fewer new visible points than this (0 to disable)"
+        )
+        self.proxy_points_spin = wx.SpinCtrl(self, -1, value="0", min=0, max=10**9)
+        self.proxy_points_spin.SetToolTip(
+            "Render the views from a decimated copy with about this many points (0 to use the whole surface)"
+        )
+        self.viewpoints_spin.Enable(False)
+        self.gauge = wx.Gauge(self, -1, range=1)
+        self.status_text = wx.StaticText(self, -1, "")
+        self.cancel_button = wx.Button(self, -1, "Cancel")
+        self.cancel_button.Enable(False)
         self.apply_button = wx.Button(self, wx.ID_APPLY, "Apply")
         close_button = wx.Button(self, wx.ID_CLOSE, "Close")
 
@@ -40,6 +86,24 @@ class Window(wx.Dialog):
         )
         combo_sizer.Add(self.surfaces_combo, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
 
+        options_sizer = wx.FlexGridSizer(2, 5, 5)
+        options_sizer.AddGrowableCol(1)
+        for label, ctrl in (
+            ("Visibility", self.engine_choice),
+            ("Viewpoints", self.viewpoints_spin),
+            ("Render size", self.render_size_spin),
+            ("Minimum new points", self.min_new_points_spin),
+            ("Proxy points", self.proxy_points_spin),
+        ):
+            options_sizer.Add(
+                wx.StaticText(self, -1, label), 0, wx.ALIGN_CENTER_VERTICAL
+            )
+            options_sizer.Add(ctrl, 1, wx.EXPAND)
+
+        progress_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        progress_sizer.Add(self.gauge, 1, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        progress_sizer.Add(self.cancel_button, 0)
+
         button_sizer = wx.StdDialogButtonSizer()
         button_sizer.AddButton(self.apply_button)
         button_sizer.AddButton(close_button)
@@ -49,6 +113,11 @@ class Window(wx.Dialog):
         sizer.Add(combo_sizer, 0, wx.EXPAND | wx.ALL, 5)
         sizer.Add(self.overwrite_check, 0, wx.EXPAND | wx.ALL, 5)
         sizer.Add(self.remove_visible_check, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.sphere_check, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.skip_enclosed_check, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(options_sizer, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(progress_sizer, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.status_text, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
         sizer.Add(button_sizer, 0, wx.EXPAND | wx.ALL, 5)
 
         self.SetSizerAndFit(sizer)
@@ -56,6 +125,8 @@ class Window(wx.Dialog):
     def _bind_events(self):
         self.Bind(wx.EVT_BUTTON, self.on_apply, id=wx.ID_APPLY)
         self.Bind(wx.EVT_BUTTON, self.on_quit, id=wx.ID_CLOSE)
+        self.sphere_check.Bind(wx.EVT_CHECKBOX, self.on_set_sphere)
+        self.cancel_button.Bind(wx.EVT_BUTTON, self.on_cancel)
         self.Bind(wx.EVT_CLOSE, self.on_quit)
 
     def _bind_ps_events(self):
@@ -75,36 +146,177 @@ class Window(wx.Dialog):
 
         self.surfaces_combo.SetItems(choices)
         self.surfaces_combo.SetValue(initial_value)
-        self.apply_button.Enable(enable)
+        self.apply_button.Enable(enable and self.cancel_event is None)
 
     def on_quit(self, evt):
-        print("closing")
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.executor.shutdown(wait=False)
         self.Destroy()
 
+    def on_cancel(self, evt):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.status_text.SetLabel("Cancelling...")
+
+    def on_set_sphere(self, evt):
+        self.viewpoints_spin.Enable(self.sphere_check.GetValue())
+
     def on_apply(self, evt):
         inv_proj = project.Project()
         idx = self.surfaces_combo.GetSelection()
         surface = list(inv_proj.surface_dict.values())[idx]
         remove_visible = self.remove_visible_check.GetValue()
         overwrite = self.overwrite_check.GetValue()
-        new_polydata = remove_non_visible_faces(
-            surface.polydata, remove_visible=remove_visible
-        )
+        if self.sphere_check.GetValue():
+            n_viewpoints = self.viewpoints_spin.GetValue()
+        else:
+            n_viewpoints = None
+        options = {
+            "remove_visible": remove_visible,
+            "n_viewpoints": n_viewpoints,
+            "render_size": self.render_size_spin.GetValue(),
+            "min_new_points": self.min_new_points_spin.GetValue(),
+            "engine": ENGINE_CHOICES[self.engine_choice.GetStringSelection()],
+            "proxy_points": self.proxy_points_spin.GetValue() or None,
+            "workers": os.cpu_count() or 1,
+            "skip_enclosed": self.skip_enclosed_check.GetValue(),
+        }
         if overwrite:
             name = surface.name
             colour = surface.colour
-            index = surface.index
         else:
             name = new_name_by_pattern(f"{surface.name}_removed_nonvisible")
             colour = None
-            index = None
+        message = {
+            "name": name,
+            "overwrite": overwrite,
+            "index": idx,
+            "colour": colour,
+        }
+
+        # The engines read a shallow copy, so the pipeline of the surface
+        # shown in the viewer is not touched while they run.
+        polydata = vtkPolyData()
+        polydata.ShallowCopy(surface.polydata)
+
+        cancel = self.cancel_event = threading.Event()
+        self._set_running(True)
+        if options["engine"] == "raycast":
+            self.executor.submit(self._run, polydata, options, message, cancel)
+            return
+
+        try:
+            engine = VisibilityEngine(
+                options.pop("render_size"), options.pop("engine"), options.pop("workers")
+            )
+        except Exception as e:
+            self._set_error(cancel, e)
+            return
+
+        def progress(done, total):
+            self._set_progress(cancel, done, total)
+
+        steps = engine.remove_non_visible_faces_steps(
+            polydata, progress=progress, cancel=cancel, **options
+        )
+        wx.CallAfter(self._step, engine, steps, message, cancel)
+
+    def _step(self, engine, steps, message, cancel, result=None, error=None):
+        # Renders the next viewpoint of steps on the main thread and calls
+        # itself again after the pending events, so the dialog keeps
+        # showing the progress and the Cancel button keeps working. The
+        # work steps yields is sent to the worker thread, which calls this
+        # again with its result or error (see _work).
+        if not self or cancel is not self.cancel_event:
+            steps.close()
+            engine.close()
+            return
+        try:
+            if error is not None:
+                work = steps.throw(error)
+            else:
+                work = steps.send(result)
+        except StopIteration as stop:
+            new_polydata = stop.value
+        except VisibilityCancelled:
+            new_polydata = None
+        except Exception as e:
+            engine.close()
+            self._set_error(cancel, e)
+            return
+        else:
+            if work is None:
+                wx.CallAfter(self._step, engine, steps, message, cancel)
+            else:
+                self.executor.submit(self._work, work, engine, steps, message, cancel)
+            return
+        engine.close()
+        self._set_result(cancel, new_polydata, message)
+
+    def _work(self, work, engine, steps, message, cancel):
+        # Runs work in the worker thread and gives its result back to
+        # _step on the main thread.
+        try:
+            result = work()
+        except Exception as e:
+            wx.CallAfter(self._step, engine, steps, message, cancel, error=e)
+            return
+        wx.CallAfter(self._step, engine, steps, message, cancel, result)
+
+    def _run(self, polydata, options, message, cancel):
+        # Runs the "raycast" engine in the worker thread. Only talks to the
+        # GUI through CallAfter.
+        def progress(done, total):
+            wx.CallAfter(self._set_progress, cancel, done, total)
+
+        try:
+            new_polydata = remove_non_visible_faces(
+                polydata, progress=progress, cancel=cancel, **options
+            )
+        except VisibilityCancelled:
+            new_polydata = None
+        except Exception as e:
+            wx.CallAfter(self._set_error, cancel, e)
+            return
+        wx.CallAfter(self._set_result, cancel, new_polydata, message)
+
+    def _set_running(self, running):
+        self.apply_button.Enable(not running and bool(self.surfaces_combo.GetItems()))
+        self.cancel_button.Enable(running)
+        if running:
+            self.gauge.SetValue(0)
+            self.status_text.SetLabel("Rendering viewpoints...")
+
+    def _set_progress(self, cancel, done, total):
+        if not self or cancel is not self.cancel_event:
+            return
+        self.gauge.SetRange(total)
+        self.gauge.SetValue(done)
+        if not cancel.is_set():
+            self.status_text.SetLabel(f"Viewpoint {done} of {total}")
+
+    def _set_error(self, cancel, error):
+        if not self or cancel is not self.cancel_event:
+            return
+        self.cancel_event = None
+        self._set_running(False)
+        self.status_text.SetLabel("")
+        wx.MessageBox(str(error), "Remove non-visible faces", wx.ICON_ERROR | wx.OK, self)
+
+    def _set_result(self, cancel, new_polydata, message):
+        if not self or cancel is not self.cancel_event:
+            return
+        self.cancel_event = None
+        self._set_running(False)
+        if new_polydata is None:
+            self.gauge.SetValue(0)
+            self.status_text.SetLabel("Cancelled")
+            return
+        self.gauge.SetValue(self.gauge.GetRange())
+        self.status_text.SetLabel("Done")
         Publisher.sendMessage(
-            "Create surface from polydata",
-            polydata=new_polydata,
-            name=name,
-            overwrite=overwrite,
-            index=idx,
-            colour=colour,
+            "Create surface from polydata", polydata=new_polydata, **message
         )
         Publisher.sendMessage('Fold surface task')
 
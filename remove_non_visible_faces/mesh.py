@@ -0,0 +1,476 @@
+import numpy as np
+from vtkmodules.util import numpy_support
+from vtkmodules.vtkCommonCore import vtkIdList, vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData
+
+# VTK array types numpy_support can convert.
+NUMPY_TYPES = set(numpy_support.get_vtk_to_numpy_typemap())
+
+
+def cell_connectivity(polydata):
+    """
+    Offsets and connectivity of all cells of polydata as numpy arrays, in
+    cell id order (verts, lines, polys and strips).
+    """
+    all_offsets = [np.zeros(1, dtype=np.int64)]
+    all_connectivity = []
+    start = 0
+    for cells in (
+        polydata.GetVerts(),
+        polydata.GetLines(),
+        polydata.GetPolys(),
+        polydata.GetStrips(),
+    ):
+        if cells is None or cells.GetNumberOfCells() == 0:
+            continue
+        offsets = numpy_support.vtk_to_numpy(cells.GetOffsetsArray())
+        connectivity = numpy_support.vtk_to_numpy(cells.GetConnectivityArray())
+        all_offsets.append(offsets[1:].astype(np.int64) + start)
+        all_connectivity.append(connectivity.astype(np.int64, copy=False))
+        start += len(connectivity)
+    if not all_connectivity:
+        return all_offsets[0], np.empty(0, dtype=np.int64)
+    return np.concatenate(all_offsets), np.concatenate(all_connectivity)
+
+
+def cells_from_points(polydata, point_mask, mode="any"):
+    """
+    Ids of the cells of polydata with any (mode="any") or all (mode="all")
+    of their points set in the boolean point_mask.
+    """
+    if mode not in ("any", "all"):
+        raise ValueError(f"Invalid mode {mode!r}, expected 'any' or 'all'")
+    offsets, connectivity = cell_connectivity(polydata)
+    sizes = np.diff(offsets)
+    if len(sizes) == 0:
+        return np.empty(0, dtype=np.int64)
+    marked = point_mask[connectivity]
+    if sizes.min() == sizes.max() and sizes[0] > 0:
+        # Only one kind of cell (e.g. triangles): one row per cell.
+        marked = marked.reshape(-1, sizes[0])
+        selected = marked.any(axis=1) if mode == "any" else marked.all(axis=1)
+    else:
+        cell_of_point = np.repeat(np.arange(len(sizes)), sizes)
+        count = np.bincount(cell_of_point[marked], minlength=len(sizes))
+        selected = count > 0 if mode == "any" else (count == sizes) & (sizes > 0)
+    return np.flatnonzero(selected)
+
+
+def _take_cells(cells, ids):
+    # Offsets and connectivity of the cells ids of the vtkCellArray cells.
+    offsets = numpy_support.vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64, copy=False)
+    connectivity = numpy_support.vtk_to_numpy(cells.GetConnectivityArray())
+    sizes = offsets[ids + 1] - offsets[ids]
+    new_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=new_offsets[1:])
+    cell_size = cells.IsHomogeneous()
+    if cell_size > 0:
+        # Only one kind of cell (e.g. triangles): one row per cell.
+        new_connectivity = connectivity.reshape(-1, cell_size)[ids].ravel()
+    else:
+        index = np.arange(new_offsets[-1], dtype=np.int64)
+        index += np.repeat(offsets[ids] - new_offsets[:-1], sizes)
+        new_connectivity = connectivity[index]
+    return new_offsets, new_connectivity.astype(np.int64, copy=False)
+
+
+def _copy_arrays(source, target, ids):
+    # Copies the tuples ids (indices or a boolean mask) of each array of the
+    # vtkDataSetAttributes source to target, keeping the names and the
+    # active attributes (normals, scalars, ...).
+    for i in range(source.GetNumberOfArrays()):
+        array = source.GetAbstractArray(i)
+        if array.IsA("vtkDataArray") and array.GetDataType() in NUMPY_TYPES:
+            values = numpy_support.vtk_to_numpy(array)
+            new_array = numpy_support.numpy_to_vtk(
+                values[ids], deep=True, array_type=array.GetDataType()
+            )
+        else:
+            new_array = _take_tuples(array, ids)
+        new_array.SetName(array.GetName())
+        attribute = source.IsArrayAnAttribute(i)
+        if attribute >= 0:
+            target.SetAttribute(new_array, attribute)
+        else:
+            target.AddArray(new_array)
+
+
+def _take_tuples(array, ids):
+    # Slow path for the arrays numpy_support can't convert (strings, bits).
+    if ids.dtype == bool:
+        ids = np.flatnonzero(ids)
+    id_list = vtkIdList()
+    id_list.SetNumberOfIds(len(ids))
+    for j, i in enumerate(ids.tolist()):
+        id_list.SetId(j, i)
+    new_array = array.NewInstance()
+    new_array.SetNumberOfComponents(array.GetNumberOfComponents())
+    new_array.SetNumberOfTuples(len(ids))
+    array.GetTuples(id_list, new_array)
+    return new_array
+
+
+def extract_cells(polydata, cells_ids, return_points=False):
+    """
+    New polydata with only the cells cells_ids of polydata, built directly
+    from numpy views of its cell arrays. Only the points used by the kept
+    cells are copied, keeping their order, and the point and cell data
+    arrays are carried over. Unlike vtkCleanPolyData, coincident points are
+    not merged. With return_points, also returns the ids in polydata of the
+    points of the new polydata.
+    """
+    cells_ids = np.asarray(cells_ids, dtype=np.int64)
+    if len(cells_ids) > 1 and not (cells_ids[1:] > cells_ids[:-1]).all():
+        cells_ids = np.sort(cells_ids)
+        cells_ids = cells_ids[np.append(True, cells_ids[1:] != cells_ids[:-1])]
+    output = vtkPolyData()
+
+    used = np.zeros(polydata.GetNumberOfPoints(), dtype=bool)
+    kept_cells = []
+    start = 0
+    for name in ("Verts", "Lines", "Polys", "Strips"):
+        cells = getattr(polydata, f"Get{name}")()
+        ncells = cells.GetNumberOfCells() if cells is not None else 0
+        lo, hi = np.searchsorted(cells_ids, (start, start + ncells))
+        ids = cells_ids[lo:hi] - start
+        start += ncells
+        if len(ids) == 0:
+            continue
+        offsets, connectivity = _take_cells(cells, ids)
+        used[connectivity] = True
+        kept_cells.append((name, offsets, connectivity))
+
+    point_map = np.cumsum(used, dtype=np.int64)
+    point_map -= 1
+    for name, offsets, connectivity in kept_cells:
+        np.take(point_map, connectivity, out=connectivity)
+        cell_array = vtkCellArray()
+        cell_array.SetData(
+            numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=True),
+            numpy_support.numpy_to_vtkIdTypeArray(connectivity, deep=True),
+        )
+        getattr(output, f"Set{name}")(cell_array)
+    del point_map, kept_cells
+
+    points = vtkPoints()
+    if polydata.GetPoints() is not None:
+        points_data = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+        points.SetData(numpy_support.numpy_to_vtk(points_data[used], deep=True))
+    output.SetPoints(points)
+
+    _copy_arrays(polydata.GetPointData(), output.GetPointData(), used)
+    _copy_arrays(polydata.GetCellData(), output.GetCellData(), cells_ids)
+    if return_points:
+        return output, np.flatnonzero(used)
+    return output
+
+
+def _group(keys):
+    # Inverse indices of the unique values of the int64 keys (sorting
+    # based, much faster than np.unique for millions of keys), and the
+    # number of unique values.
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.empty(len(keys), dtype=bool)
+    starts[:1] = True
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=starts[1:])
+    inverse = np.empty(len(keys), dtype=np.int64)
+    inverse[order] = np.cumsum(starts) - 1
+    return inverse, int(starts.sum())
+
+
+def triangles(polydata, return_cells=False):
+    """
+    Triangles of the polys of polydata as a (n, 3) array, triangulating
+    the polygons that are not triangles. With return_cells, also returns
+    the cell id of polydata each triangle comes from.
+    """
+    polys = polydata.GetPolys()
+    if polys is None or polys.GetNumberOfCells() == 0:
+        tris = np.empty((0, 3), dtype=np.int64)
+        cells = np.empty(0, dtype=np.int64)
+    elif polys.IsHomogeneous() == 3:
+        connectivity = numpy_support.vtk_to_numpy(polys.GetConnectivityArray())
+        tris = connectivity.reshape(-1, 3).astype(np.int64, copy=False)
+        cells = np.arange(len(tris), dtype=np.int64)
+    else:
+        # Fan triangulation of each polygon.
+        connectivity = numpy_support.vtk_to_numpy(polys.GetConnectivityArray())
+        offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray()).astype(np.int64)
+        ntriangles = np.maximum(np.diff(offsets) - 2, 0)
+        cells = np.repeat(np.arange(len(ntriangles), dtype=np.int64), ntriangles)
+        first = offsets[:-1][cells]
+        k = np.arange(len(cells)) - (np.cumsum(ntriangles) - ntriangles)[cells]
+        tris = np.stack(
+            (connectivity[first], connectivity[first + k + 1], connectivity[first + k + 2]),
+            axis=-1,
+        ).astype(np.int64, copy=False)
+    if return_cells:
+        # Polys come after the verts and lines in the cell ids.
+        return tris, cells + polydata.GetNumberOfVerts() + polydata.GetNumberOfLines()
+    return tris
+
+
+def cluster_vertices(polydata, target_points):
+    """
+    Decimated proxy of the surface polydata by vertex clustering on a
+    regular grid sized so the proxy has about target_points points. Every
+    point of polydata falls in exactly one grid bin, which is one proxy
+    point placed at the mean of its points. Returns the proxy triangle
+    polydata and point_to_proxy, the proxy point of each original point.
+    """
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+    tris = triangles(polydata)
+    npoints = len(points)
+    target_points = max(int(target_points), 1)
+
+    origin = points.min(axis=0)
+    edges = points[tris[:, 1]] - points[tris[:, 0]] if len(tris) else np.ones((1, 3))
+    bin_size = np.linalg.norm(edges, axis=1).mean() * np.sqrt(npoints / target_points)
+    # The first estimate ignores how the surface fills the bins, so it is
+    # corrected once from the number of points it gave.
+    for _ in range(2):
+        bins = np.floor((points - origin) / bin_size).astype(np.int64)
+        dims = bins.max(axis=0) + 1
+        keys = (bins[:, 0] * dims[1] + bins[:, 1]) * dims[2] + bins[:, 2]
+        point_to_proxy, nproxy = _group(keys)
+        if nproxy <= target_points * 1.25:
+            break
+        bin_size *= np.sqrt(nproxy / target_points)
+
+    counts = np.bincount(point_to_proxy, minlength=nproxy)
+    proxy_points = np.stack(
+        [np.bincount(point_to_proxy, weights=points[:, i], minlength=nproxy) for i in range(3)],
+        axis=-1,
+    ) / counts[:, None]
+
+    proxy_tris = point_to_proxy[tris]
+    degenerate = (
+        (proxy_tris[:, 0] == proxy_tris[:, 1])
+        | (proxy_tris[:, 1] == proxy_tris[:, 2])
+        | (proxy_tris[:, 0] == proxy_tris[:, 2])
+    )
+    proxy_tris = proxy_tris[~degenerate]
+
+    proxy = vtkPolyData()
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(proxy_points.astype(np.float32), deep=True))
+    proxy.SetPoints(vtk_points)
+    polys = vtkCellArray()
+    polys.SetData(
+        numpy_support.numpy_to_vtkIdTypeArray(
+            np.arange(0, 3 * len(proxy_tris) + 1, 3, dtype=np.int64), deep=True
+        ),
+        numpy_support.numpy_to_vtkIdTypeArray(proxy_tris.ravel(), deep=True),
+    )
+    proxy.SetPolys(polys)
+    return proxy, point_to_proxy
+
+
+def dilate_points(polydata, point_mask, iterations=1):
+    """
+    Grows the boolean point_mask by iterations rings of neighbours along
+    the edges of the triangles of polydata.
+    """
+    tris = triangles(polydata)
+    a = tris.ravel()
+    b = np.roll(tris, -1, axis=1).ravel()
+    point_mask = point_mask.copy()
+    for _ in range(iterations):
+        grown = point_mask.copy()
+        grown[b[point_mask[a]]] = True
+        grown[a[point_mask[b]]] = True
+        point_mask = grown
+    return point_mask
+
+
+def connected_components(polydata):
+    """
+    Connected components of the triangles of polydata, by a union-find
+    over their edges: every point is hooked to the smallest root of its
+    neighbours and the paths are compressed until nothing changes. Returns
+    the component of each point, numbered from 0, and the number of
+    components. Points not used by any triangle are components of their
+    own.
+    """
+    tris = triangles(polydata)
+    parent = np.arange(polydata.GetNumberOfPoints(), dtype=np.int64)
+    a = tris.ravel()
+    b = np.roll(tris, -1, axis=1).ravel()
+    while len(a):
+        root_a = parent[a]
+        root_b = parent[b]
+        pending = root_a != root_b
+        a = a[pending]
+        b = b[pending]
+        low = np.minimum(root_a[pending], root_b[pending])
+        high = np.maximum(root_a[pending], root_b[pending])
+        # Roots always hook to a smaller root, so no cycles are made.
+        np.minimum.at(parent, high, low)
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+    return _group(parent)
+
+
+# Directions of the parity rays of enclosed_cells, chosen not to be aligned
+# with the voxel grid of marching cubes surfaces nor with each other.
+PARITY_DIRECTIONS = np.array(
+    [[0.5384, 0.2611, 0.8012], [-0.7071, 0.6124, 0.3536], [0.2673, -0.8018, 0.5345]]
+)
+PARITY_DIRECTIONS /= np.linalg.norm(PARITY_DIRECTIONS, axis=1)[:, None]
+
+
+def _crossings(points, tris, origins, direction):
+    # Number of the triangles tris of points crossed by the rays from each
+    # of origins along direction. The triangles are binned on a grid in
+    # the plane perpendicular to direction, so each ray is only tested
+    # against the triangles of its bin. Bins without rays are dropped
+    # before sorting, there are usually few rays.
+    up = (0.0, 0.0, 1.0) if abs(direction[2]) < 0.9 else (0.0, 1.0, 0.0)
+    u = np.cross(up, direction)
+    u /= np.linalg.norm(u)
+    v = np.cross(direction, u)
+    x = points @ u
+    y = points @ v
+    ox = origins @ u
+    oy = origins @ v
+
+    tx = x[tris]
+    ty = y[tris]
+    # Triangles away from all the rays.
+    near = (tx.max(axis=1) >= ox.min()) & (tx.min(axis=1) <= ox.max())
+    near &= (ty.max(axis=1) >= oy.min()) & (ty.min(axis=1) <= oy.max())
+    tris = tris[near]
+    tx = tx[near]
+    ty = ty[near]
+    if len(tris) == 0:
+        return np.zeros(len(origins), dtype=np.int64)
+    lo = np.array([min(tx.min(), ox.min()), min(ty.min(), oy.min())])
+    hi = np.array([max(tx.max(), ox.max()), max(ty.max(), oy.max())])
+    nbins = max(int(np.sqrt(len(tris))), 1)
+    bin_size = np.maximum((hi - lo) / nbins, 1e-12)
+
+    def bins(values, axis):
+        return np.clip(((values - lo[axis]) / bin_size[axis]).astype(np.int64), 0, nbins - 1)
+
+    x0 = bins(tx.min(axis=1), 0)
+    x1 = bins(tx.max(axis=1), 0)
+    y0 = bins(ty.min(axis=1), 1)
+    y1 = bins(ty.max(axis=1), 1)
+    width = x1 - x0 + 1
+    counts = width * (y1 - y0 + 1)
+    tri_of_entry = np.repeat(np.arange(len(tris)), counts)
+    local = np.arange(len(tri_of_entry)) - np.repeat(np.cumsum(counts) - counts, counts)
+    entry_bins = (y0[tri_of_entry] + local // width[tri_of_entry]) * nbins
+    entry_bins += x0[tri_of_entry] + local % width[tri_of_entry]
+    origin_bins = bins(oy, 1) * nbins + bins(ox, 0)
+    occupied = np.zeros(nbins * nbins, dtype=bool)
+    occupied[origin_bins] = True
+    used = occupied[entry_bins]
+    entry_bins = entry_bins[used]
+    tri_of_entry = tri_of_entry[used]
+    order = np.argsort(entry_bins, kind="stable")
+    entry_bins = entry_bins[order]
+    tri_of_entry = tri_of_entry[order]
+
+    start = np.searchsorted(entry_bins, origin_bins, "left")
+    ntests = np.searchsorted(entry_bins, origin_bins, "right") - start
+    ray = np.repeat(np.arange(len(origins)), ntests)
+    tri = tri_of_entry[
+        np.arange(len(ray)) - np.repeat(np.cumsum(ntests) - ntests, ntests) + start[ray]
+    ]
+
+    ax, bx, cx = tx[tri].T
+    ay, by, cy = ty[tri].T
+    px = ox[ray]
+    py = oy[ray]
+    area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    w0 = ((bx - px) * (cy - py) - (by - py) * (cx - px)) * np.sign(area)
+    w1 = ((cx - px) * (ay - py) - (cy - py) * (ax - px)) * np.sign(area)
+    w2 = np.abs(area) - w0 - w1
+    hit = (w0 > 0) & (w1 > 0) & (w2 > 0)
+
+    # Only the crossings ahead of the origin count.
+    ray = ray[hit]
+    za, zb, zc = (points[tris[tri[hit]]] @ direction).T
+    w0 = w0[hit]
+    w1 = w1[hit]
+    depth = (w0 * za + w1 * zb + w2[hit] * zc) / np.abs(area[hit])
+    ahead = depth > origins[ray] @ direction
+    return np.bincount(ray[ahead], minlength=len(origins))
+
+
+def enclosed_cells(polydata):
+    """
+    Boolean mask of the cells of polydata in a connected component
+    enclosed by another one, such as a cavity inside a closed outer
+    surface, which can't be seen from outside. A component is enclosed
+    when its bounding box is inside the bounding box of a closed component
+    (every edge shared by exactly two triangles) and the rays from one of
+    its faces along each of PARITY_DIRECTIONS all cross that component an
+    odd number of times. A ray grazing an edge or a vertex can miscount,
+    so the rays must agree: a component is rather kept (and rendered)
+    than dropped while visible.
+    """
+    enclosed = np.zeros(polydata.GetNumberOfCells(), dtype=bool)
+    tris, tri_cells = triangles(polydata, return_cells=True)
+    if len(tris) == 0:
+        return enclosed
+    point_labels, ncomponents = connected_components(polydata)
+    tri_labels = point_labels[tris[:, 0]]
+    present = np.bincount(tri_labels, minlength=ncomponents) > 0
+    if np.count_nonzero(present) < 2:
+        return enclosed
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+
+    # Bounding box of each component.
+    bmin = np.full((ncomponents, 3), np.inf)
+    bmax = np.full((ncomponents, 3), -np.inf)
+    np.minimum.at(bmin, point_labels, points)
+    np.maximum.at(bmax, point_labels, points)
+
+    # Closed components: no edge used by one or more than two triangles.
+    a = tris.ravel()
+    b = np.roll(tris, -1, axis=1).ravel()
+    edge_keys = np.minimum(a, b) * len(points) + np.maximum(a, b)
+    edge_of, nedges = _group(edge_keys)
+    edge_uses = np.bincount(edge_of, minlength=nedges)
+    open_edges = np.zeros(nedges, dtype=bool)
+    open_edges[edge_of] = (edge_uses != 2)[edge_of]
+    edge_labels = np.empty(nedges, dtype=np.int64)
+    edge_labels[edge_of] = point_labels[a]
+    closed = present & (np.bincount(edge_labels[open_edges], minlength=ncomponents) == 0)
+
+    # Origin of the parity ray of each component: the centroid of its
+    # first triangle.
+    first_tri = np.zeros(ncomponents, dtype=np.int64)
+    first_tri[tri_labels[::-1]] = np.arange(len(tris) - 1, -1, -1)
+    origins = points[tris[first_tri]].mean(axis=1)
+
+    is_enclosed = np.zeros(ncomponents, dtype=bool)
+    volume = np.prod(bmax - bmin, axis=1)
+    # The biggest containers first, they enclose most of the others.
+    for container in np.flatnonzero(closed)[np.argsort(-volume[closed])]:
+        candidates = np.flatnonzero(
+            present
+            & ~is_enclosed
+            & (bmin > bmin[container]).all(axis=1)
+            & (bmax < bmax[container]).all(axis=1)
+        )
+        if len(candidates) == 0:
+            continue
+        container_tris = tris[tri_labels == container]
+        inside = np.ones(len(candidates), dtype=bool)
+        for direction in PARITY_DIRECTIONS:
+            candidates = candidates[inside]
+            crossings = _crossings(points, container_tris, origins[candidates], direction)
+            inside = crossings % 2 == 1
+            if not inside.any():
+                break
+        is_enclosed[candidates[inside]] = True
+
+    enclosed[tri_cells[is_enclosed[tri_labels]]] = True
+    return enclosed
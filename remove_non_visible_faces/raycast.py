@@ -0,0 +1,149 @@
+"""
+CPU ray casting visibility, for machines without a working OpenGL.
+
+Each view casts one ray per pixel centre, all parallel to the view
+direction. For parallel rays the first triangle hit by every ray is found
+by projecting the triangles on the view plane: a ray hits a triangle when
+its pixel centre is inside the projected triangle, at the depth
+interpolated there. This is done for chunks of triangles at a time in
+numpy arrays, spread over threads, and the nearest hit of each pixel is
+kept.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TRIANGLE_CHUNK_SIZE = 65536
+
+
+def _view_basis(direction):
+    # Two unit vectors spanning the plane perpendicular to direction.
+    up = (0.0, 0.0, 1.0) if abs(direction[2]) < 0.9 else (0.0, 1.0, 0.0)
+    u = np.cross(up, direction)
+    u /= np.linalg.norm(u)
+    v = np.cross(direction, u)
+    return u, v
+
+
+def _nearest(pixel, depth, triangle):
+    # For each pixel keeps the hit with the smallest depth.
+    order = np.lexsort((depth, pixel))
+    pixel = pixel[order]
+    first = np.ones(len(pixel), dtype=bool)
+    first[1:] = pixel[1:] != pixel[:-1]
+    keep = order[first]
+    return pixel[first], depth[keep], triangle[keep]
+
+
+def _cast_chunk(x, y, z, triangles, first_triangle, resolution):
+    # Hits of the pixel rays on triangles (whose vertices have the pixel
+    # coordinates x, y and depth z), as (pixel, depth, triangle) arrays
+    # with one nearest hit per pixel.
+    ax, bx, cx = x[triangles].T
+    ay, by, cy = y[triangles].T
+    area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+    x0 = np.clip(np.ceil(np.minimum(np.minimum(ax, bx), cx)), 0, resolution)
+    x1 = np.clip(np.floor(np.maximum(np.maximum(ax, bx), cx)), -1, resolution - 1)
+    y0 = np.clip(np.ceil(np.minimum(np.minimum(ay, by), cy)), 0, resolution)
+    y1 = np.clip(np.floor(np.maximum(np.maximum(ay, by), cy)), -1, resolution - 1)
+    width = np.maximum(x1 - x0 + 1, 0).astype(np.int64)
+    height = np.maximum(y1 - y0 + 1, 0).astype(np.int64)
+    counts = width * height
+    counts[np.abs(area) < 1e-12] = 0
+
+    # One (triangle, pixel) pair per pixel centre in the triangle's box.
+    tri = np.repeat(np.arange(len(triangles)), counts)
+    local = np.arange(len(tri)) - np.repeat(np.cumsum(counts) - counts, counts)
+    px = x0[tri] + local % width[tri]
+    py = y0[tri] + local // width[tri]
+
+    inv_area = 1.0 / area[tri]
+    l0 = ((bx[tri] - px) * (cy[tri] - py) - (by[tri] - py) * (cx[tri] - px)) * inv_area
+    l1 = ((cx[tri] - px) * (ay[tri] - py) - (cy[tri] - py) * (ax[tri] - px)) * inv_area
+    l2 = 1.0 - l0 - l1
+    inside = (l0 >= 0.0) & (l1 >= 0.0) & (l2 >= 0.0)
+
+    tri = tri[inside]
+    l0 = l0[inside]
+    l1 = l1[inside]
+    l2 = l2[inside]
+    za, zb, zc = z[triangles[tri]].T
+    depth = l0 * za + l1 * zb + l2 * zc
+    pixel = py[inside].astype(np.int64) * resolution + px[inside].astype(np.int64)
+    return _nearest(pixel, depth, tri + first_triangle)
+
+
+def cast_view(points, triangles, center, radius, direction, resolution, executor=None):
+    """
+    Indices of the triangles hit first by the parallel rays through the
+    centres of a resolution x resolution grid of pixels covering the
+    bounding sphere (center, radius), cast from outside the sphere along
+    -direction.
+    """
+    direction = np.asarray(direction, dtype=np.float64)
+    direction = direction / np.linalg.norm(direction)
+    u, v = _view_basis(direction)
+    pixel_size = 2.0 * radius / resolution
+    relative = points - center
+    # Pixel coordinates, with the pixel centres at integer values, and the
+    # depth along the rays.
+    x = relative @ (u / pixel_size) + (resolution / 2.0 - 0.5)
+    y = relative @ (v / pixel_size) + (resolution / 2.0 - 0.5)
+    z = -(relative @ direction)
+
+    starts = range(0, len(triangles), TRIANGLE_CHUNK_SIZE)
+
+    def cast(start):
+        chunk = triangles[start : start + TRIANGLE_CHUNK_SIZE]
+        return _cast_chunk(x, y, z, chunk, start, resolution)
+
+    if executor is None:
+        hits = [cast(start) for start in starts]
+    else:
+        hits = list(executor.map(cast, starts))
+    if not hits:
+        return np.empty(0, dtype=np.int64)
+    pixel, depth, triangle = (np.concatenate(h) for h in zip(*hits))
+    return _nearest(pixel, depth, triangle)[2]
+
+
+def visible_triangles(
+    points,
+    triangles,
+    directions,
+    resolution,
+    workers=1,
+    progress=None,
+    cancel=None,
+    min_new=0,
+):
+    """
+    Boolean mask of the triangles (n, 3) of points (m, 3) hit first by the
+    pixel rays of cast_view from each of the directions, around the
+    bounding sphere of the points. Chunks of triangles are spread over
+    workers threads. progress, cancel and min_new behave as in
+    VisibilityEngine.visible, except that None is returned if cancel gets
+    set.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    triangles = np.asarray(triangles, dtype=np.int64)
+    pmin = points.min(axis=0)
+    pmax = points.max(axis=0)
+    center = (pmin + pmax) / 2.0
+    radius = max(np.linalg.norm(pmax - pmin) / 2.0, 1e-12)
+
+    visible = np.zeros(len(triangles), dtype=bool)
+    total = len(directions)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for done, direction in enumerate(directions):
+            if cancel is not None and cancel.is_set():
+                return None
+            ids = cast_view(points, triangles, center, radius, direction, resolution, executor)
+            new_visible = np.count_nonzero(~visible[ids])
+            visible[ids] = True
+            if progress is not None:
+                progress(done + 1, total)
+            if new_visible < min_new:
+                break
+    return visible
@@ -1,142 +1,834 @@
+import argparse
+import csv
+import functools
+import glob
+import multiprocessing
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 from vtkmodules.util import numpy_support
-from vtkmodules.vtkCommonCore import vtkIdList, vtkIdTypeArray
-from vtkmodules.vtkCommonDataModel import vtkSelection, vtkSelectionNode
-from vtkmodules.vtkFiltersCore import vtkCleanPolyData, vtkIdFilter
-from vtkmodules.vtkFiltersExtraction import vtkExtractSelection
-from vtkmodules.vtkFiltersGeometry import vtkGeometryFilter
+from vtkmodules.vtkCommonDataModel import vtkDataObject
+try:
+    from vtkmodules.vtkFiltersCore import vtkIdFilter
+except ImportError:
+    # Renamed in newer VTK versions.
+    from vtkmodules.vtkFiltersCore import vtkGenerateIds as vtkIdFilter
+try:
+    # OpenGL implementations of the render window and the hardware selector.
+    import vtkmodules.vtkRenderingOpenGL2  # noqa: F401
+except ImportError:
+    # Without OpenGL only the "raycast" engine works.
+    pass
 from vtkmodules.vtkRenderingCore import (
     vtkActor,
+    vtkHardwareSelector,
     vtkPolyDataMapper,
     vtkRenderer,
     vtkRenderWindow,
     vtkSelectVisiblePoints,
 )
 
+from .mesh import (
+    cells_from_points,
+    cluster_vertices,
+    dilate_points,
+    enclosed_cells,
+    extract_cells,
+    triangles,
+)
+from .raycast import visible_triangles
+
+AXIS_POSITIONS = [[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]]
+# Size in pixels of the views. The "cells" and "raycast" engines only keep
+# faces that win at least one pixel in some view: visible faces smaller
+# than a pixel at this size can be dropped, so they are not exact per face
+# on meshes with faces much smaller than the surface / RENDER_SIZE.
+RENDER_SIZE = 800
+ENGINES = ("points", "cells", "raycast")
+
+
+class VisibilityCancelled(Exception):
+    pass
+
+
+def run_steps(steps):
+    """
+    Runs the generator steps, such as VisibilityEngine.visible_steps, to
+    the end and returns its result. The work it yields (see visible_steps)
+    is done right here.
+    """
+    result = None
+    while True:
+        try:
+            work = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = None if work is None else work()
+
+
+def fibonacci_sphere(n):
+    """
+    n unit vectors spread evenly on the sphere (Fibonacci lattice). The
+    lattice goes from the top pole to the bottom one, so its points are
+    listed in the order of the golden ratio sequence frac(k * phi) of
+    their heights: any prefix of the list covers the whole sphere, which
+    suits early stopping.
+    """
+    i = np.arange(n) + 0.5
+    z = 1.0 - 2.0 * i / n
+    r = np.sqrt(1.0 - z * z)
+    phi = i * np.pi * (3.0 - np.sqrt(5.0))
+    points = np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=-1)
+    # The k-th point listed is the one at the rank of frac(k * phi).
+    order = np.argsort(np.argsort((np.arange(n) * (np.sqrt(5.0) - 1.0) / 2.0) % 1.0))
+    return points[order]
+
+
+def _view_up(direction):
+    # Any up vector not parallel to the view direction.
+    if abs(direction[2]) < 0.9:
+        return (0.0, 0.0, 1.0)
+    return (0.0, 1.0, 0.0)
+
+
+def _visible_point_ids(renderer, id_points_data):
+    # Points of id_points_data (with the vtkIdFilter_Ids array) in front of
+    # the z-buffer of the last render.
+    select_visible_points = vtkSelectVisiblePoints()
+    select_visible_points.SetInputData(id_points_data)
+    select_visible_points.SetRenderer(renderer)
+    select_visible_points.Update()
+    output = select_visible_points.GetOutput()
+    return numpy_support.vtk_to_numpy(
+        output.GetPointData().GetAbstractArray("vtkIdFilter_Ids")
+    )
+
+
+def _visible_cell_ids(selector, render_size):
+    # Ids of the cells covering at least one pixel, read back from a render
+    # of the cell ids into the colour buffer.
+    selector.SetArea(0, 0, render_size[0] - 1, render_size[1] - 1)
+    selection = selector.Select()
+    if selection.GetNumberOfNodes() == 0:
+        return np.empty(0, dtype=np.int64)
+    return numpy_support.vtk_to_numpy(selection.GetNode(0).GetSelectionList())
+
+
+class VisibilityEngine:
+    """
+    Offscreen renderer that finds the faces of surfaces seen from a set of
+    viewpoints. The render window, renderer and mapper are created once and
+    kept alive, so processing many surfaces with the same engine does not
+    create a new rendering context for each one. Call close() when done.
+
+    engine="points" tests the points against the z-buffer with
+    vtkSelectVisiblePoints, and a face is visible if any (mode="any") or
+    all (mode="all") of its points are. engine="cells" renders the cell ids
+    with vtkHardwareSelector and keeps the faces that win at least one
+    pixel; mode is then unused and min_new_points counts faces. Visible
+    faces smaller than a pixel in every view are dropped (see RENDER_SIZE),
+    so dense meshes need a bigger render_size or more viewpoints with this
+    engine.
+
+    engine="raycast" needs no OpenGL: it casts one parallel ray per pixel of
+    a render_size view from each viewpoint on the CPU, with workers
+    threads, and keeps the faces hit first, like engine="cells".
+    """
+
+    def __init__(self, render_size=RENDER_SIZE, engine="points", workers=1):
+        if engine not in ENGINES:
+            raise ValueError(f"Invalid engine {engine!r}, expected one of {ENGINES}")
+        self.engine = engine
+        self.workers = workers
+        self.render_window = None
+        if engine == "raycast":
+            self.set_render_size(render_size)
+            return
+
+        self.mapper = vtkPolyDataMapper()
+
+        actor = vtkActor()
+        actor.SetMapper(self.mapper)
+
+        self.renderer = vtkRenderer()
+        self.renderer.AddActor(actor)
+
+        self.render_window = vtkRenderWindow()
+        self.render_window.AddRenderer(self.renderer)
+        self.render_window.OffScreenRenderingOn()
+        self.set_render_size(render_size)
+
+        self.id_filter = vtkIdFilter()
+        self.id_filter.PointIdsOn()
+        self.id_filter.SetPointIdsArrayName("vtkIdFilter_Ids")
+
+        self.selector = vtkHardwareSelector()
+        self.selector.SetRenderer(self.renderer)
+        self.selector.SetFieldAssociation(vtkDataObject.FIELD_ASSOCIATION_CELLS)
+
+    def set_render_size(self, render_size):
+        """
+        Size in pixels of the offscreen render, an int or (width, height).
+        """
+        if np.isscalar(render_size):
+            render_size = (render_size, render_size)
+        self.render_size = (int(render_size[0]), int(render_size[1]))
+        if self.render_window is not None:
+            self.render_window.SetSize(self.render_size)
+
+    def visible(
+        self,
+        polydata,
+        positions=AXIS_POSITIONS,
+        n_viewpoints=None,
+        min_new_points=0,
+        progress=None,
+        cancel=None,
+        proxy_points=None,
+        dilation=2,
+        skip_enclosed=False,
+    ):
+        """
+        Boolean mask of the points (engine="points") or cells
+        (engine="cells") of polydata seen from the given camera positions
+        (directions from the centre of the surface), or from n_viewpoints
+        directions on a Fibonacci sphere if given. Rendering stops early
+        once a viewpoint adds fewer than min_new_points new visible ones,
+        so the positions should spread over the sphere in any prefix, as
+        the ones of fibonacci_sphere do.
+
+        progress(done, total) is called after each viewpoint. If the
+        threading.Event cancel gets set, VisibilityCancelled is raised
+        before the next viewpoint.
+
+        If proxy_points is given and smaller than the number of points, the
+        views are rendered from a proxy of about proxy_points points made
+        by vertex clustering (min_new_points then counts proxy points or
+        cells). A point of polydata is visible if its proxy point, or one
+        within dilation rings of proxy neighbours, was seen; the dilation
+        keeps faces near the edge of the seen region of the coarse proxy.
+
+        With skip_enclosed, the connected components enclosed by a closed
+        component (see mesh.enclosed_cells) are marked as not visible
+        without rendering them, and only the rest of the surface is
+        rendered.
+        """
+        return run_steps(
+            self.visible_steps(
+                polydata,
+                positions,
+                n_viewpoints,
+                min_new_points,
+                progress,
+                cancel,
+                proxy_points,
+                dilation,
+                skip_enclosed,
+            )
+        )
+
+    def visible_steps(
+        self,
+        polydata,
+        positions=AXIS_POSITIONS,
+        n_viewpoints=None,
+        min_new_points=0,
+        progress=None,
+        cancel=None,
+        proxy_points=None,
+        dilation=2,
+        skip_enclosed=False,
+    ):
+        """
+        Generator doing the work of visible(), which it returns as its
+        StopIteration value (see run_steps). The OpenGL engines yield None
+        after each viewpoint, so a GUI can render one viewpoint per event
+        loop step on its own thread; OpenGL contexts must not be used from
+        other threads. The passes without OpenGL (enclosed components,
+        proxy, extracting cells) are yielded as functions taking no
+        arguments, which the caller may run in another thread, sending
+        back their result. The "raycast" engine renders without yielding.
+        """
+        if skip_enclosed:
+            enclosed = yield functools.partial(enclosed_cells, polydata)
+            if enclosed.any():
+                return (
+                    yield from self._visible_without(
+                        polydata,
+                        enclosed,
+                        positions=positions,
+                        n_viewpoints=n_viewpoints,
+                        min_new_points=min_new_points,
+                        progress=progress,
+                        cancel=cancel,
+                        proxy_points=proxy_points,
+                        dilation=dilation,
+                    )
+                )
+        if proxy_points and proxy_points < polydata.GetNumberOfPoints():
+            return (
+                yield from self._visible_from_proxy(
+                    polydata,
+                    proxy_points,
+                    dilation,
+                    positions=positions,
+                    n_viewpoints=n_viewpoints,
+                    min_new_points=min_new_points,
+                    progress=progress,
+                    cancel=cancel,
+                )
+            )
+        if n_viewpoints:
+            positions = fibonacci_sphere(n_viewpoints)
+        total = len(positions)
+        if self.engine == "raycast":
+            return self._visible_raycast(polydata, positions, min_new_points, progress, cancel)
+
+        self.mapper.SetInputData(polydata)
+        self.mapper.Update()
+
+        camera = self.renderer.GetActiveCamera()
+        self.renderer.ResetCamera()
+
+        pos = np.array(camera.GetPosition())
+        fp = np.array(camera.GetFocalPoint())
+        v = pos - fp
+        mag = np.linalg.norm(v)
+
+        if self.engine == "points":
+            self.id_filter.SetInputData(polydata)
+            self.id_filter.Update()
+            visible = np.zeros(polydata.GetNumberOfPoints(), dtype=bool)
+        else:
+            visible = np.zeros(polydata.GetNumberOfCells(), dtype=bool)
+
+        try:
+            for done, position in enumerate(positions):
+                if cancel is not None and cancel.is_set():
+                    raise VisibilityCancelled()
+                direction = np.array(position, dtype=np.float64)
+                direction /= np.linalg.norm(direction)
+                camera.SetPosition((fp + direction * mag).tolist())
+                camera.SetViewUp(_view_up(direction))
+                self.renderer.ResetCamera()
+
+                if self.engine == "points":
+                    self.render_window.Render()
+                    ids = _visible_point_ids(self.renderer, self.id_filter.GetOutput())
+                else:
+                    ids = _visible_cell_ids(self.selector, self.render_size)
+                new_visible = np.count_nonzero(~visible[ids])
+                visible[ids] = True
+                if progress is not None:
+                    progress(done + 1, total)
+                yield
+                if new_visible < min_new_points:
+                    break
+        finally:
+            # Do not keep a reference to the last surface.
+            self.mapper.RemoveAllInputs()
+            self.id_filter.RemoveAllInputs()
+        return visible
+
+    def _visible_raycast(self, polydata, positions, min_new_points, progress, cancel):
+        # See visible().
+        tris, tri_cells = triangles(polydata, return_cells=True)
+        visible = np.zeros(polydata.GetNumberOfCells(), dtype=bool)
+        if len(tris) == 0:
+            return visible
+        points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData())
+        tri_visible = visible_triangles(
+            points,
+            tris,
+            positions,
+            max(self.render_size),
+            workers=self.workers,
+            progress=progress,
+            cancel=cancel,
+            min_new=min_new_points,
+        )
+        if tri_visible is None:
+            raise VisibilityCancelled()
+        visible[tri_cells[tri_visible]] = True
+        return visible
+
+    def _visible_without(self, polydata, hidden_cells, **kwargs):
+        # See visible().
+        rest, rest_points = yield functools.partial(
+            extract_cells, polydata, np.flatnonzero(~hidden_cells), return_points=True
+        )
+        rest_visible = yield from self.visible_steps(rest, skip_enclosed=False, **kwargs)
+        if self.engine == "points":
+            visible = np.zeros(polydata.GetNumberOfPoints(), dtype=bool)
+            visible[rest_points] = rest_visible
+        else:
+            visible = np.zeros(polydata.GetNumberOfCells(), dtype=bool)
+            visible[~hidden_cells] = rest_visible
+        return visible
+
+    def _visible_from_proxy(self, polydata, proxy_points, dilation, **kwargs):
+        # See visible().
+        proxy, point_to_proxy = yield functools.partial(cluster_vertices, polydata, proxy_points)
+        proxy_visible = yield from self.visible_steps(proxy, **kwargs)
+        return (
+            yield functools.partial(
+                _visible_from_proxy,
+                polydata,
+                proxy,
+                point_to_proxy,
+                proxy_visible,
+                dilation,
+                self.engine != "points",
+            )
+        )
+
+    def remove_non_visible_faces(
+        self,
+        polydata,
+        positions=AXIS_POSITIONS,
+        remove_visible=False,
+        mode="any",
+        n_viewpoints=None,
+        min_new_points=0,
+        progress=None,
+        cancel=None,
+        proxy_points=None,
+        dilation=2,
+        skip_enclosed=False,
+    ):
+        """
+        New polydata with the faces of polydata seen from the viewpoints (or
+        the unseen ones if remove_visible). See visible() for the viewpoint,
+        progress, cancel, proxy and skip_enclosed options.
+        """
+        return run_steps(
+            self.remove_non_visible_faces_steps(
+                polydata,
+                positions,
+                remove_visible,
+                mode,
+                n_viewpoints,
+                min_new_points,
+                progress,
+                cancel,
+                proxy_points,
+                dilation,
+                skip_enclosed,
+            )
+        )
+
+    def remove_non_visible_faces_steps(
+        self,
+        polydata,
+        positions=AXIS_POSITIONS,
+        remove_visible=False,
+        mode="any",
+        n_viewpoints=None,
+        min_new_points=0,
+        progress=None,
+        cancel=None,
+        proxy_points=None,
+        dilation=2,
+        skip_enclosed=False,
+    ):
+        """
+        Generator version of remove_non_visible_faces(), stepping like
+        visible_steps().
+        """
+        visible = yield from self.visible_steps(
+            polydata,
+            positions,
+            n_viewpoints,
+            min_new_points,
+            progress,
+            cancel,
+            proxy_points,
+            dilation,
+            skip_enclosed,
+        )
+        return (
+            yield functools.partial(
+                _kept_cells, polydata, visible, self.engine == "points", mode, remove_visible
+            )
+        )
+
+    def process(self, polydatas, **kwargs):
+        """
+        Yields remove_non_visible_faces(polydata, **kwargs) for each
+        polydata of the iterable polydatas, reusing the render context.
+        """
+        for polydata in polydatas:
+            yield self.remove_non_visible_faces(polydata, **kwargs)
+
+    def close(self):
+        if self.render_window is not None:
+            self.render_window.Finalize()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _visible_from_proxy(polydata, proxy, point_to_proxy, proxy_visible, dilation, cells):
+    # See VisibilityEngine.visible(). proxy_visible is a mask of the proxy
+    # cells if cells, else of its points, and so is the result for polydata.
+    if cells:
+        # Points of the seen proxy faces.
+        proxy_cells = proxy_visible
+        proxy_visible = np.zeros(proxy.GetNumberOfPoints(), dtype=bool)
+        proxy_visible[triangles(proxy)[proxy_cells]] = True
+    proxy_visible = dilate_points(proxy, proxy_visible, dilation)
+    visible = proxy_visible[point_to_proxy]
+    if cells:
+        cells_ids = cells_from_points(polydata, visible, "any")
+        visible = np.zeros(polydata.GetNumberOfCells(), dtype=bool)
+        visible[cells_ids] = True
+    return visible
+
+
+def _kept_cells(polydata, visible, points, mode, remove_visible):
+    # See VisibilityEngine.remove_non_visible_faces(). visible is a mask of
+    # the points of polydata if points, else of its cells.
+    if remove_visible:
+        visible = ~visible
+    if points:
+        cells_ids = cells_from_points(polydata, visible, mode)
+    else:
+        cells_ids = np.flatnonzero(visible)
+    return extract_cells(polydata, cells_ids)
+
 
 def remove_non_visible_faces(
     polydata,
-    positions=[[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]],
+    positions=AXIS_POSITIONS,
     remove_visible=False,
+    mode="any",
+    n_viewpoints=None,
+    render_size=RENDER_SIZE,
+    min_new_points=0,
+    engine="points",
+    progress=None,
+    cancel=None,
+    proxy_points=None,
+    dilation=2,
+    workers=1,
+    skip_enclosed=False,
 ):
-    polydata.BuildLinks()
-
-    mapper = vtkPolyDataMapper()
-    mapper.SetInputData(polydata)
-    mapper.Update()
-
-    actor = vtkActor()
-    actor.SetMapper(mapper)
-
-    renderer = vtkRenderer()
-    renderer.AddActor(actor)
-
-    render_window = vtkRenderWindow()
-    render_window.AddRenderer(renderer)
-    render_window.SetSize(800, 800)
-    render_window.OffScreenRenderingOn()
-
-    camera = renderer.GetActiveCamera()
-    renderer.ResetCamera()
-
-    pos = np.array(camera.GetPosition())
-    fp = np.array(camera.GetFocalPoint())
-    v = pos - fp
-    mag = np.linalg.norm(v)
-    vn = v / mag
-
-    id_filter = vtkIdFilter()
-    id_filter.SetInputData(polydata)
-    id_filter.PointIdsOn()
-    id_filter.Update()
-
-    set_points = None
-
-    for position in positions:
-        pos = fp + np.array(position) * mag
-        camera.SetPosition(pos.tolist())
-        renderer.ResetCamera()
-        render_window.Render()
-
-        select_visible_points = vtkSelectVisiblePoints()
-        select_visible_points.SetInputData(id_filter.GetOutput())
-        select_visible_points.SetRenderer(renderer)
-        #  select_visible_points.SelectInvisibleOn()
-        select_visible_points.Update()
-        output = select_visible_points.GetOutput()
-        id_points = numpy_support.vtk_to_numpy(
-            output.GetPointData().GetAbstractArray("vtkIdFilter_Ids")
+    """
+    Keeps the faces of polydata seen from the given camera positions, using
+    a VisibilityEngine created for this call only. See VisibilityEngine for
+    the arguments.
+    """
+    with VisibilityEngine(render_size, engine, workers) as visibility_engine:
+        return visibility_engine.remove_non_visible_faces(
+            polydata,
+            positions,
+            remove_visible=remove_visible,
+            mode=mode,
+            n_viewpoints=n_viewpoints,
+            min_new_points=min_new_points,
+            progress=progress,
+            cancel=cancel,
+            proxy_points=proxy_points,
+            dilation=dilation,
+            skip_enclosed=skip_enclosed,
         )
-        if set_points is None:
-            set_points = set(id_points.tolist())
-        else:
-            set_points.update(id_points.tolist())
-        #  id_list = vtkIdList()
-        #  output.GetVerts().GetCell(1000, id_list)
 
-    if remove_visible:
-        set_points = set(range(polydata.GetNumberOfPoints())) - set_points
-    cells_ids = set()
-    for p_id in set_points:
-        id_list = vtkIdList()
-        polydata.GetPointCells(p_id, id_list)
-        for i in range(id_list.GetNumberOfIds()):
-            cells_ids.add(id_list.GetId(i))
 
+MESH_EXTENSIONS = (".stl", ".ply", ".obj")
+STATS_FIELDS = [
+    "input",
+    "output",
+    "input_faces",
+    "output_faces",
+    "reduction",
+    "read_time",
+    "visibility_time",
+    "write_time",
+    "total_time",
+    "error",
+]
+
+# Engine of the current batch worker process, see _init_worker.
+_worker_engine = None
+
+
+def read_mesh(filename):
+    from vtkmodules.vtkIOGeometry import vtkOBJReader, vtkSTLReader
+    from vtkmodules.vtkIOPLY import vtkPLYReader
+
+    readers = {".stl": vtkSTLReader, ".ply": vtkPLYReader, ".obj": vtkOBJReader}
+    ext = os.path.splitext(filename)[1].lower()
     try:
-        id_list = numpy_support.numpy_to_vtkIdTypeArray(
-            np.array(list(cells_ids), dtype=np.int64)
-        )
-    except ValueError:
-        id_list = vtkIdTypeArray()
+        reader = readers[ext]()
+    except KeyError:
+        raise ValueError(f"Unsupported mesh format {ext!r}")
+    reader.SetFileName(filename)
+    reader.Update()
+    polydata = reader.GetOutput()
+    if polydata is None or polydata.GetNumberOfPoints() == 0:
+        raise ValueError(f"No mesh could be read from {filename}")
+    return polydata
 
-    selection_node = vtkSelectionNode()
-    selection_node.SetFieldType(vtkSelectionNode.CELL)
-    selection_node.SetContentType(vtkSelectionNode.INDICES)
-    selection_node.SetSelectionList(id_list)
 
-    selection = vtkSelection()
-    selection.AddNode(selection_node)
+def write_mesh(polydata, filename):
+    from vtkmodules.vtkIOGeometry import vtkOBJWriter, vtkSTLWriter
+    from vtkmodules.vtkIOPLY import vtkPLYWriter
 
-    extract_selection = vtkExtractSelection()
-    extract_selection.SetInputData(0, polydata)
-    extract_selection.SetInputData(1, selection)
-    extract_selection.Update()
+    writers = {".stl": vtkSTLWriter, ".ply": vtkPLYWriter, ".obj": vtkOBJWriter}
+    ext = os.path.splitext(filename)[1].lower()
+    try:
+        writer = writers[ext]()
+    except KeyError:
+        raise ValueError(f"Unsupported mesh format {ext!r}")
+    writer.SetInputData(polydata)
+    writer.SetFileName(filename)
+    if ext != ".obj":
+        writer.SetFileTypeToBinary()
+    writer.Write()
 
-    geometry_filter = vtkGeometryFilter()
-    geometry_filter.SetInputData(extract_selection.GetOutput())
-    geometry_filter.Update()
 
-    clean_polydata = vtkCleanPolyData()
-    clean_polydata.SetInputData(geometry_filter.GetOutput())
-    clean_polydata.Update()
+def find_meshes(inputs):
+    """
+    Mesh files of inputs, a list of files, directories (their STL, PLY and
+    OBJ files) or glob patterns, without repetitions.
+    """
+    filenames = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = [
+                os.path.join(pattern, name)
+                for name in sorted(os.listdir(pattern))
+                if name.lower().endswith(MESH_EXTENSIONS)
+            ]
+        elif os.path.exists(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern))
+        filenames.extend(matches)
+    # A file can match more than one input.
+    return list(dict.fromkeys(filenames))
 
-    return clean_polydata.GetOutput()
 
+def output_paths(filenames, output_dir, output_format):
+    """
+    Output file of each of the mesh files filenames in output_dir, keeping
+    their paths relative to the deepest directory holding all of them so
+    that files with the same name in different directories do not
+    overwrite each other. Raises ValueError if two files would still have
+    the same output, as a.stl and a.ply would.
+    """
+    if not filenames:
+        return []
+    root = os.path.commonpath(
+        [os.path.dirname(os.path.abspath(filename)) for filename in filenames]
+    )
+    outputs = []
+    sources = {}
+    for filename in filenames:
+        name = os.path.splitext(os.path.relpath(os.path.abspath(filename), root))[0]
+        output_file = os.path.join(output_dir, f"{name}.{output_format}")
+        key = os.path.normcase(output_file)
+        if key in sources:
+            raise ValueError(f"{sources[key]} and {filename} would both be written to {output_file}")
+        sources[key] = filename
+        outputs.append(output_file)
+    return outputs
 
-def main():
-    from vtkmodules.vtkIOGeometry import vtkSTLReader
-    from vtkmodules.vtkIOPLY import vtkPLYWriter
 
-    input_file = sys.argv[1]
-    ouput_file = sys.argv[2]
+def _init_worker(render_size, engine, threads):
+    global _worker_engine
+    _worker_engine = VisibilityEngine(render_size, engine, threads)
 
-    reader = vtkSTLReader()
-    reader.SetFileName(input_file)
-    reader.Update()
 
-    output_polydata = remove_nonvisible_faces(
-        reader.GetOutput(),
-        [[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]],
+def _process_file(input_file, output_file, options):
+    stats = dict.fromkeys(STATS_FIELDS, "")
+    stats["input"] = input_file
+    stats["output"] = output_file
+    t0 = time.perf_counter()
+    try:
+        polydata = read_mesh(input_file)
+        t1 = time.perf_counter()
+        output_polydata = _worker_engine.remove_non_visible_faces(polydata, **options)
+        t2 = time.perf_counter()
+        write_mesh(output_polydata, output_file)
+        t3 = time.perf_counter()
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+        stats["total_time"] = f"{time.perf_counter() - t0:.3f}"
+        return stats
+
+    input_faces = polydata.GetNumberOfCells()
+    output_faces = output_polydata.GetNumberOfCells()
+    stats["input_faces"] = input_faces
+    stats["output_faces"] = output_faces
+    if input_faces:
+        stats["reduction"] = f"{1.0 - output_faces / input_faces:.4f}"
+    stats["read_time"] = f"{t1 - t0:.3f}"
+    stats["visibility_time"] = f"{t2 - t1:.3f}"
+    stats["write_time"] = f"{t3 - t2:.3f}"
+    stats["total_time"] = f"{t3 - t0:.3f}"
+    return stats
+
+
+def run_batch(
+    filenames,
+    output_dir,
+    output_format="ply",
+    stats_file=None,
+    workers=1,
+    render_size=RENDER_SIZE,
+    engine="points",
+    threads=1,
+    **options,
+):
+    """
+    Runs remove_non_visible_faces over the mesh files filenames, writing
+    the results to output_dir as output_format files (see output_paths),
+    with a process pool of workers processes, each with its own offscreen
+    VisibilityEngine (using threads threads with the "raycast" engine).
+    options are passed to VisibilityEngine.remove_non_visible_faces.
+    Per-file timing and face counts are written to the CSV stats_file as
+    each file finishes; a file that fails is recorded there with its error
+    and does not stop the batch. Returns the list of stats dicts.
+    """
+    global _worker_engine
+    jobs = list(zip(filenames, output_paths(filenames, output_dir, output_format)))
+    os.makedirs(output_dir, exist_ok=True)
+    for directory in {os.path.dirname(output_file) for _input_file, output_file in jobs}:
+        os.makedirs(directory, exist_ok=True)
+
+    stats_fd = None
+    writer = None
+    if stats_file:
+        stats_fd = open(stats_file, "w", newline="")
+        writer = csv.DictWriter(stats_fd, fieldnames=STATS_FIELDS)
+        writer.writeheader()
+
+    all_stats = []
+    try:
+        if workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(render_size, engine, threads),
+            )
+            with executor:
+                futures = [
+                    executor.submit(_process_file, input_file, output_file, options)
+                    for input_file, output_file in jobs
+                ]
+                results = (future.result() for future in as_completed(futures))
+                all_stats = _collect_stats(results, writer, stats_fd)
+        else:
+            _init_worker(render_size, engine, threads)
+            results = (
+                _process_file(input_file, output_file, options)
+                for input_file, output_file in jobs
+            )
+            all_stats = _collect_stats(results, writer, stats_fd)
+    finally:
+        if _worker_engine is not None:
+            _worker_engine.close()
+            _worker_engine = None
+        if stats_fd is not None:
+            stats_fd.close()
+    return all_stats
+
+
+def _collect_stats(results, writer, stats_fd):
+    all_stats = []
+    for stats in results:
+        all_stats.append(stats)
+        if writer is not None:
+            writer.writerow(stats)
+            stats_fd.flush()
+        status = stats["error"] or f"{stats['input_faces']} -> {stats['output_faces']} faces"
+        print(f"{stats['input']}: {status} ({stats['total_time']} s)", flush=True)
+    return all_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Remove the non-visible faces of STL, PLY or OBJ meshes."
+    )
+    parser.add_argument("inputs", nargs="+", help="mesh files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", required=True)
+    parser.add_argument("-f", "--format", choices=["ply", "stl", "obj"], default="ply")
+    parser.add_argument("--stats", help="CSV file with per-file timing and face counts")
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("--engine", choices=ENGINES, default="points")
+    parser.add_argument(
+        "--threads", type=int, default=1, help="threads per worker of the raycast engine"
+    )
+    parser.add_argument(
+        "--render-size",
+        type=int,
+        default=RENDER_SIZE,
+        help="view size in pixels; the cells and raycast engines drop faces smaller than a pixel",
+    )
+    parser.add_argument(
+        "--viewpoints",
+        type=int,
+        default=None,
+        help="number of viewpoints on a sphere (default: the six axis directions)",
+    )
+    parser.add_argument("--min-new-points", type=int, default=0)
+    parser.add_argument("--mode", choices=["any", "all"], default="any")
+    parser.add_argument("--remove-visible", action="store_true")
+    parser.add_argument(
+        "--proxy-points",
+        type=int,
+        default=None,
+        help="render views from a decimated proxy with about this many points",
+    )
+    parser.add_argument(
+        "--dilation",
+        type=int,
+        default=2,
+        help="rings of proxy neighbours also kept around the seen proxy points",
     )
+    parser.add_argument(
+        "--skip-enclosed",
+        action="store_true",
+        help="drop the components enclosed by a closed surface without rendering them",
+    )
+    args = parser.parse_args(argv)
 
-    writer = vtkPLYWriter()
-    writer.SetInputData(output_polydata)
-    writer.SetFileName(ouput_file)
-    writer.Write()
+    filenames = find_meshes(args.inputs)
+    if not filenames:
+        parser.error("no mesh files found")
+
+    try:
+        output_paths(filenames, args.output_dir, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    all_stats = run_batch(
+        filenames,
+        args.output_dir,
+        output_format=args.format,
+        stats_file=args.stats,
+        workers=args.workers,
+        render_size=args.render_size,
+        engine=args.engine,
+        threads=args.threads,
+        n_viewpoints=args.viewpoints,
+        min_new_points=args.min_new_points,
+        mode=args.mode,
+        remove_visible=args.remove_visible,
+        proxy_points=args.proxy_points,
+        dilation=args.dilation,
+        skip_enclosed=args.skip_enclosed,
+    )
+    return 1 if any(stats["error"] for stats in all_stats) else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
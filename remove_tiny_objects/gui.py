@@ -1,16 +1,96 @@
+import csv
 import os
 import tempfile
 
 import invesalius.data.slice_ as slc
 import numpy as np
-import scipy.ndimage as nd
 import wx
 from invesalius import project
 from pubsub import pub as Publisher
 
-from invesalius_rs import count_regions
+from . import history
+from .labeling import IncrementalLabels, SizeIndex
 
 INIT_MIN_SIZE = "10"
+PREVIEW_CHUNK_SIZE = 32
+SIZE_UNITS = ["voxels", "mm³"]
+STATISTICS_FIELDS = [
+    "label",
+    "voxels",
+    "volume_mm3",
+    "box_min_z",
+    "box_min_y",
+    "box_min_x",
+    "box_max_z",
+    "box_max_y",
+    "box_max_x",
+    "extent_z_mm",
+    "extent_y_mm",
+    "extent_x_mm",
+    "centroid_z_mm",
+    "centroid_y_mm",
+    "centroid_x_mm",
+]
+
+
+def write_statistics(filename, statistics):
+    """
+    Writes the IncrementalLabels.statistics() of the regions to the CSV
+    file filename, biggest regions first.
+    """
+    order = np.argsort(statistics["voxels"], kind="stable")[::-1]
+    with open(filename, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(STATISTICS_FIELDS)
+        for i in order:
+            writer.writerow(
+                [statistics["label"][i], statistics["voxels"][i], f"{statistics['volume'][i]:.4f}"]
+                + statistics["box_min"][i].tolist()
+                + statistics["box_max"][i].tolist()
+                + [f"{value:.4f}" for value in statistics["extent"][i]]
+                + [f"{value:.4f}" for value in statistics["centroid"][i]]
+            )
+
+
+class SizeHistogram(wx.Panel):
+    """
+    Bars of the number of regions with 2**i <= size < 2**(i + 1) voxels, in
+    a log scale, with the regions up to the maximum size to remove in red.
+    """
+
+    def __init__(self, parent):
+        super().__init__(parent, -1, size=(-1, 80))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.min_size = 1
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_SIZE, lambda evt: self.Refresh())
+
+    def set_data(self, counts, min_size):
+        self.counts = counts
+        self.min_size = min_size
+        self.SetToolTip(
+            "Regions by size: " + ", ".join(f"{2 ** i}+: {n}" for i, n in enumerate(counts) if n)
+        )
+        self.Refresh()
+
+    def OnPaint(self, evt):
+        dc = wx.PaintDC(self)
+        dc.SetBackground(wx.WHITE_BRUSH)
+        dc.Clear()
+        width, height = self.GetClientSize()
+        if len(self.counts) == 0 or width <= 0:
+            return
+        heights = np.log1p(self.counts) / np.log1p(self.counts.max()) * (height - 2)
+        bar_width = width / len(self.counts)
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        for i, bar_height in enumerate(heights):
+            if bar_height <= 0:
+                continue
+            removed = 2 ** i <= self.min_size
+            dc.SetBrush(wx.Brush(wx.Colour(200, 40, 40) if removed else wx.Colour(90, 90, 90)))
+            dc.DrawRectangle(
+                int(i * bar_width), int(height - bar_height), max(int(bar_width) - 1, 1), int(bar_height)
+            )
 
 
 class Window(wx.Dialog):
@@ -18,13 +98,20 @@ class Window(wx.Dialog):
         self,
         parent,
         image_matrix,
+        spacing=(1.0, 1.0, 1.0),
         title="Remove tiny objects",
         style=wx.DEFAULT_DIALOG_STYLE | wx.FRAME_FLOAT_ON_PARENT,
     ):
         super().__init__(parent, -1, title=title, style=style)
 
+        self.spacing = spacing
+        self.voxel_volume = float(np.prod(spacing))
         self.mask = None
+        self.labels = None
+        self.size_index = None
         self.preview_matrix = None
+        # Maximum size the preview matrix is showing.
+        self.preview_min_size = None
 
         self._init_gui()
         self._bind_events()
@@ -33,54 +120,153 @@ class Window(wx.Dialog):
         if self.mask:
             self.mask.add_modified_callback(self.on_modified_mask)
 
-    def _find_regions(self, matrix):
-        labels, num_labels = nd.label(matrix)
-        return labels, num_labels
-
     def _find_regions_actual_mask(self):
         s = slc.Slice()
         self.mask = s.current_mask
         if self.mask:
             s.do_threshold_to_all_slices()
-            labels, num_labels = self._find_regions(self.mask.matrix[1:, 1:, 1:])
-            counts = count_regions(labels, num_labels)
-            self.txt_num_regions.SetValue(str(num_labels))
+            self.labels = IncrementalLabels(
+                self.mask.matrix[1:, 1:, 1:], workers=os.cpu_count() or 1
+            )
+            self.size_index = None
 
             if self.preview_matrix is None:
                 _tmp, self.preview_matrix = self.create_temp_mask()
 
-            self.counts = counts
-            self.num_labels = num_labels
             s.aux_matrices["REMOVE_TINY"] = self.preview_matrix
             s.to_show_aux = "REMOVE_TINY"
 
             self._update_preview_matrix()
+            self._update_size_info()
+            Publisher.sendMessage("Reload actual slice")
 
-    def _update_preview_matrix(self):
-        min_size = self.txt_min_size.GetValue()
-        self.preview_matrix[:] = (self.counts <= min_size) * 255
+    def _update_regions(self):
+        # Relabels only what changed since the labels were last updated.
+        result = self.labels.update()
+        if result is None:
+            return
+        region, changed, old_sizes = result
+        self.size_index = None
+        flipped = self.labels.flipped(changed, old_sizes, self.preview_min_size)
+        boxes = [region] + [self.labels.component_box(label) for label in flipped]
+        self._update_preview_matrix(boxes, self.preview_min_size)
+        self._update_size_info()
+        # The sizes of the largest regions to keep may have changed.
+        self._set_max_size(self._max_size())
         Publisher.sendMessage("Reload actual slice")
 
+    def _remove_regions(self, voxels):
+        # The voxels (flat indices in the mask matrix) just removed are
+        # whole regions of the preview: they are taken out of the labels
+        # and the preview without relabelling anything.
+        index = np.unravel_index(voxels, self.mask.matrix.shape)
+        voxels = np.ravel_multi_index([i - 1 for i in index], self.labels.labels.shape)
+        if not self.labels.remove(voxels):
+            self._update_regions()
+            return
+        self.preview_matrix.reshape(-1)[voxels] = 0
+        self.size_index = None
+        self._update_size_info()
+        self._set_max_size(self._max_size())
+
+    def _max_size(self):
+        # Maximum size of the regions to remove, in voxels.
+        max_size = self.txt_min_size.GetValue()
+        if self.choice_unit.GetSelection() == SIZE_UNITS.index("mm³"):
+            max_size /= self.voxel_volume
+        max_size = int(max_size + 1e-9)
+        if self.chk_keep_largest.GetValue():
+            keep = self.spin_keep_largest.GetValue()
+            max_size = max(max_size, self._get_size_index().keep_largest_size(keep))
+        return max_size
+
+    def _set_max_size(self, max_size):
+        # Only the voxels of the regions between the previous and the new
+        # maximum size change in the preview.
+        if max_size == self.preview_min_size:
+            return
+        low, high = sorted((self.preview_min_size, max_size))
+        voxels, big_roots = self._get_size_index().between(low, high)
+        value = 255 if max_size > self.preview_min_size else 0
+        self.preview_matrix.reshape(-1)[voxels] = value
+        boxes = [self.labels.component_box(root) for root in big_roots]
+        self._update_preview_matrix(boxes, max_size)
+        self._update_size_info()
+        Publisher.sendMessage("Reload actual slice")
+
+    def _update_preview_matrix(self, boxes=None, min_size=None):
+        # Shows the regions up to min_size in boxes (slices), or in the whole
+        # preview, a few slices at a time.
+        if min_size is None:
+            min_size = self._max_size()
+        nslices = self.preview_matrix.shape[0]
+        if boxes is None:
+            boxes = [(slice(0, nslices),)]
+        for box in boxes:
+            start, stop, _step = box[0].indices(nslices)
+            for z0 in range(start, stop, PREVIEW_CHUNK_SIZE):
+                chunk = (slice(z0, min(z0 + PREVIEW_CHUNK_SIZE, stop)),) + tuple(box[1:])
+                sizes = self.labels.voxel_sizes(chunk)
+                self.preview_matrix[chunk] = ((sizes > 0) & (sizes <= min_size)) * 255
+        self.preview_min_size = min_size
+
+    def _get_size_index(self):
+        # Made again only after the labels changed, its voxels only when
+        # the maximum size changes.
+        if self.size_index is None:
+            self.size_index = SizeIndex(self.labels)
+        return self.size_index
+
+    def _update_size_info(self):
+        size_index = self._get_size_index()
+        min_size = self.preview_min_size
+        nremoved, voxels = size_index.at_most(min_size)
+        self.txt_num_regions.SetValue(str(self.labels.num_regions))
+        self.txt_removed.SetLabel(
+            f"{nremoved} regions ({voxels} voxels, {voxels * self.voxel_volume:.1f} mm³) to remove"
+        )
+        self.histogram.set_data(size_index.histogram(), min_size)
+
     def _init_gui(self):
-        self.txt_min_size = wx.SpinCtrl(
-            self, -1, value=INIT_MIN_SIZE, min=1, max=10 ** 10
+        self.txt_min_size = wx.SpinCtrlDouble(
+            self, -1, value=INIT_MIN_SIZE, min=0, max=10 ** 10, inc=1
         )
+        self.txt_min_size.SetDigits(2)
+        self.choice_unit = wx.Choice(self, -1, choices=SIZE_UNITS)
+        self.choice_unit.SetSelection(0)
+        self.chk_keep_largest = wx.CheckBox(self, -1, "Keep only the largest regions")
+        self.spin_keep_largest = wx.SpinCtrl(self, -1, value="1", min=1, max=10 ** 9)
 
         self.txt_num_regions = wx.TextCtrl(self, -1, "0")
+        self.txt_removed = wx.StaticText(self, -1, "")
+        self.histogram = SizeHistogram(self)
 
+        self.btn_export = wx.Button(self, -1, "Export statistics...")
         self.btn_remove = wx.Button(self, -1, "Remove")
 
         sizer = wx.BoxSizer(wx.VERTICAL)
         sizer.Add(
             wx.StaticText(self, -1, "Maximum size to remove"), 0, wx.EXPAND | wx.ALL, 5
         )
-        sizer.Add(self.txt_min_size, 1, wx.EXPAND | wx.ALL, 5)
+        size_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        size_sizer.Add(self.txt_min_size, 1, wx.EXPAND | wx.RIGHT, 5)
+        size_sizer.Add(self.choice_unit, 0, wx.EXPAND)
+        sizer.Add(size_sizer, 1, wx.EXPAND | wx.ALL, 5)
+
+        keep_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        keep_sizer.Add(self.chk_keep_largest, 1, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 5)
+        keep_sizer.Add(self.spin_keep_largest, 0, wx.EXPAND)
+        sizer.Add(keep_sizer, 0, wx.EXPAND | wx.ALL, 5)
 
         sizer.Add(
             wx.StaticText(self, -1, "Number of regions"), 0, wx.EXPAND | wx.ALL, 5
         )
         sizer.Add(self.txt_num_regions, 1, wx.EXPAND | wx.ALL, 5)
 
+        sizer.Add(self.histogram, 0, wx.EXPAND | wx.ALL, 5)
+        sizer.Add(self.txt_removed, 0, wx.EXPAND | wx.ALL, 5)
+
+        sizer.Add(self.btn_export, 0, wx.EXPAND | wx.ALL, 5)
         sizer.Add(self.btn_remove, 1, wx.EXPAND | wx.ALL, 5)
 
         self.SetSizer(sizer)
@@ -88,12 +274,17 @@ class Window(wx.Dialog):
         self.Layout()
 
     def _bind_events(self):
-        self.txt_min_size.Bind(wx.EVT_SPINCTRL, self.OnSetMinSize)
+        self.txt_min_size.Bind(wx.EVT_SPINCTRLDOUBLE, self.OnSetMinSize)
+        self.choice_unit.Bind(wx.EVT_CHOICE, self.OnSetUnit)
+        self.chk_keep_largest.Bind(wx.EVT_CHECKBOX, self.OnSetMinSize)
+        self.spin_keep_largest.Bind(wx.EVT_SPINCTRL, self.OnSetMinSize)
+        self.btn_export.Bind(wx.EVT_BUTTON, self.OnExportStatistics)
         self.btn_remove.Bind(wx.EVT_BUTTON, self.OnRemove)
         self.Bind(wx.EVT_CLOSE, self.OnClose)
 
     def create_temp_mask(self):
-        temp_file = tempfile.mktemp()
+        fd, temp_file = tempfile.mkstemp()
+        os.close(fd)
         sz, sy, sx = self.mask.matrix.shape
         matrix = np.memmap(
             temp_file, mode="w+", dtype="uint8", shape=(sz - 1, sy - 1, sx - 1)
@@ -101,12 +292,40 @@ class Window(wx.Dialog):
         return temp_file, matrix
 
     def OnSetMinSize(self, evt):
-        self._update_preview_matrix()
+        if self.labels is None:
+            return
+        self._set_max_size(self._max_size())
+
+    def OnSetUnit(self, evt):
+        # Keeps the same maximum size in the new unit.
+        value = self.txt_min_size.GetValue()
+        if self.choice_unit.GetSelection() == SIZE_UNITS.index("mm³"):
+            self.txt_min_size.SetValue(value * self.voxel_volume)
+        else:
+            self.txt_min_size.SetValue(round(value / self.voxel_volume))
+        self.OnSetMinSize(evt)
+
+    def OnExportStatistics(self, evt):
+        if self.labels is None:
+            return
+        with wx.FileDialog(
+            self,
+            "Export statistics",
+            wildcard="CSV files (*.csv)|*.csv",
+            style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT,
+        ) as dialog:
+            if dialog.ShowModal() != wx.ID_OK:
+                return
+            filename = dialog.GetPath()
+        write_statistics(filename, self.labels.statistics(self.spacing))
 
     def on_modified_mask(self):
-        print("On modified mask")
-        self._find_regions_actual_mask()
-        self._update_preview_matrix()
+        s = slc.Slice()
+        if s.current_mask is not self.mask:
+            self._find_regions_actual_mask()
+            return
+        s.do_threshold_to_all_slices()
+        self._update_regions()
 
     def OnClose(self, evt):
         if self.mask:
@@ -135,10 +354,13 @@ class Window(wx.Dialog):
         if self.mask and self.preview_matrix is not None:
             s = slc.Slice()
             s.discard_all_buffers()
-            cp_mask = self.mask.matrix.copy()
-            m = self.mask.matrix[1:, 1:, 1:]
-            m[self.preview_matrix > 127] = 1
-            self.mask.was_edited = True
-            self.preview_matrix[:] = 0
-            self.mask.save_history(0, 'VOLUME', self.mask.matrix.copy(), cp_mask)
+            # Only the removed voxels are kept for undo, not copies of the
+            # mask before and after.
+            voxels, old_values = history.set_voxels(
+                self.mask.matrix, self.preview_matrix, 1, (1, 1, 1), PREVIEW_CHUNK_SIZE
+            )
+            if len(voxels):
+                self.mask.was_edited = True
+                history.save_history(self.mask, voxels, old_values, 1)
+                self._remove_regions(voxels)
             Publisher.sendMessage("Reload actual slice")
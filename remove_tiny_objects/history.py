@@ -0,0 +1,71 @@
+"""
+Undo history of the voxels removed by remove_tiny_objects.
+
+The nodes of the InVesalius mask history hold whole slices or volumes.
+The nodes here hold only the voxels of the mask that were set, as flat
+indices in the mask matrix, so an edit costs disk and memory in
+proportion to the voxels it changed. They are added in pairs, the state
+before and after the edit, as EditionHistory.new_node does.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+
+class SparseEditionNode:
+    """
+    Node of a mask EditionHistory setting the voxels (flat indices in the
+    mask matrix) to values, one per voxel or one for all. Saved to a
+    temporary file like the nodes of InVesalius.
+    """
+
+    def __init__(self, voxels, values):
+        self.index = 0
+        self.orientation = "VOLUME"
+        self.clean = False
+        fd, self.filename = tempfile.mkstemp(suffix=".npz")
+        with os.fdopen(fd, "wb") as npz_file:
+            np.savez(npz_file, voxels=voxels, values=values)
+
+    def commit_history(self, mvolume):
+        with np.load(self.filename) as data:
+            mvolume.reshape(-1)[data["voxels"]] = data["values"]
+
+    def __del__(self):
+        os.remove(self.filename)
+
+
+def set_voxels(matrix, marked, value, offset=(0, 0, 0), chunk_size=32):
+    """
+    Sets the voxels of matrix that are nonzero in marked to value, marked
+    being a volume inside matrix from offset. Goes chunk_size slices at a
+    time. Returns the flat indices in matrix of the voxels set, and their
+    old values.
+    """
+    index_dtype = np.min_scalar_type(matrix.size - 1)
+    nz, ny, nx = marked.shape
+    oz, oy, ox = offset
+    sy, sx = matrix.shape[1:]
+    voxels = []
+    values = []
+    for z0 in range(0, nz, chunk_size):
+        selected = marked[z0 : z0 + chunk_size] != 0
+        target = matrix[oz + z0 : oz + z0 + len(selected), oy : oy + ny, ox : ox + nx]
+        values.append(target[selected])
+        target[selected] = value
+        zy, x = np.divmod(np.flatnonzero(selected), nx)
+        z, y = np.divmod(zy, ny)
+        voxels.append((((z + oz + z0) * sy + y + oy) * sx + x + ox).astype(index_dtype))
+    if not voxels:
+        return np.zeros(0, dtype=index_dtype), np.zeros(0, dtype=matrix.dtype)
+    return np.concatenate(voxels), np.concatenate(values)
+
+
+def save_history(mask, voxels, old_values, value):
+    """
+    Adds to the history of mask the edit that set the voxels (flat
+    indices in mask.matrix), whose values were old_values, to value.
+    """
+    mask.history.add(SparseEditionNode(voxels, old_values))
+    mask.history.add(SparseEditionNode(voxels, value))
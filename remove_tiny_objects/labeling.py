@@ -0,0 +1,520 @@
+"""
+Connected components of a mask kept up to date while the mask is edited.
+
+The label volume is computed once, slab by slab in threads. After an edit
+only the edited box is labelled again, growing it only when it can't tell
+whether a component that lost voxels was split. The new labels are joined
+to the components around the box with a union-find over the labels, which
+also keeps the size and bounding box of each component.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.ndimage as nd
+
+# Mask values from this up are foreground; removed voxels are set to 1.
+FOREGROUND_MIN = 128
+# Slices labelled at a time by label_slabs.
+SLAB_SIZE = 64
+# IncrementalLabels.update labels the whole volume again, slab by slab,
+# when the box to relabel is bigger than this fraction of the volume.
+UPDATE_MAX_FRACTION = 0.25
+
+
+def _box_slices(box):
+    return tuple(slice(lo, hi) for lo, hi in zip(box[0], box[1]))
+
+
+def _union_box(a, b):
+    return (np.minimum(a[0], b[0]), np.maximum(a[1], b[1]))
+
+
+def _structure(structure):
+    if structure is None:
+        structure = nd.generate_binary_structure(3, 1)
+    return np.asarray(structure, dtype=bool)
+
+
+def _find(parent, labels):
+    # Root of each of labels in the union-find parent.
+    roots = parent[labels]
+    while True:
+        up = parent[roots]
+        if (up == roots).all():
+            return roots
+        roots = up
+
+
+def _hook(parent, a, b):
+    # Joins the sets of a[i] and b[i] for each i: roots are hooked to the
+    # smallest root they are joined to until every pair has the same root.
+    while len(a):
+        root_a = _find(parent, a)
+        root_b = _find(parent, b)
+        pending = root_a != root_b
+        a = a[pending]
+        b = b[pending]
+        low = np.minimum(root_a[pending], root_b[pending])
+        high = np.maximum(root_a[pending], root_b[pending])
+        np.minimum.at(parent, high, low)
+
+
+def _face_pairs(structure, below, above):
+    # Labels of the voxels of the slice below joined by structure to the
+    # voxels of the slice above it.
+    pairs_a = []
+    pairs_b = []
+    ny, nx = below.shape
+    for dy, dx in np.argwhere(structure[2]) - 1:
+        a = below[max(-dy, 0) : ny - max(dy, 0), max(-dx, 0) : nx - max(dx, 0)]
+        b = above[max(dy, 0) : ny + min(dy, 0), max(dx, 0) : nx + min(dx, 0)]
+        joined = (a != 0) & (b != 0)
+        pairs_a.append(a[joined])
+        pairs_b.append(b[joined])
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def _label_slabs(matrix, structure, workers, slab_size, stats=True, output=None):
+    # Labels of matrix >= FOREGROUND_MIN made slab by slab in workers
+    # threads into output (a new int32 volume if None), numbered after the
+    # labels of the previous slabs, but not joined across the slab faces.
+    # Returns the labels, the number of labels, their sizes and boxes (None
+    # unless stats) and the labels joined across faces.
+    nz = matrix.shape[0]
+    labels = np.empty(matrix.shape, dtype=np.int32) if output is None else output
+    bounds = list(range(0, nz, slab_size)) + [nz]
+    slabs = list(zip(bounds[:-1], bounds[1:]))
+
+    def label_slab(slab):
+        z0, z1 = slab
+        slab_labels = labels[z0:z1]
+        nlabels = nd.label(matrix[z0:z1] >= FOREGROUND_MIN, structure, output=slab_labels)
+        if not stats:
+            return nlabels, None, None, None
+        sizes = np.zeros(nlabels + 1, dtype=np.int64)
+        for z in range(z1 - z0):
+            sizes += np.bincount(slab_labels[z].ravel(), minlength=nlabels + 1)
+        objects = nd.find_objects(slab_labels, nlabels)
+        box_min = np.fromiter((s.start for o in objects for s in o), np.int64, 3 * nlabels).reshape(-1, 3)
+        box_max = np.fromiter((s.stop for o in objects for s in o), np.int64, 3 * nlabels).reshape(-1, 3)
+        box_min[:, 0] += z0
+        box_max[:, 0] += z0
+        return nlabels, sizes[1:], box_min, box_max
+
+    def add_offset(k):
+        z0, z1 = slabs[k]
+        slab_labels = labels[z0:z1]
+        np.add(slab_labels, offsets[k], out=slab_labels, where=slab_labels != 0)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        counts, sizes, box_min, box_max = zip(*executor.map(label_slab, slabs))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        list(executor.map(add_offset, range(1, len(slabs))))
+
+    nlabels = int(offsets[-1])
+    pairs = [np.zeros(0, dtype=np.int64)]
+    for z0, _z1 in slabs[1:]:
+        a, b = _face_pairs(structure, labels[z0 - 1], labels[z0])
+        pairs.append(np.unique(a.astype(np.int64) * (nlabels + 1) + b))
+    a, b = np.divmod(np.concatenate(pairs), nlabels + 1)
+    if not stats:
+        return labels, nlabels, None, None, (a, b)
+    sizes = np.concatenate([np.zeros(1, dtype=np.int64)] + list(sizes))
+    box_min = np.concatenate([np.zeros((1, 3), dtype=np.int64)] + list(box_min))
+    box_max = np.concatenate([np.zeros((1, 3), dtype=np.int64)] + list(box_max))
+    return labels, nlabels, sizes, (box_min, box_max), (a, b)
+
+
+def label_slabs(matrix, structure=None, workers=1, slab_size=SLAB_SIZE):
+    """
+    Same labels as scipy.ndimage.label(matrix >= FOREGROUND_MIN,
+    structure), made slab_size slices at a time by workers threads straight
+    into an int32 volume. The labels of each slab are then joined across
+    the slab faces with a union-find and numbered in one more pass. Only
+    one slab of foreground exists per thread. Returns the labels and the
+    number of labels.
+    """
+    structure = _structure(structure)
+    labels, nlabels, _sizes, _boxes, (a, b) = _label_slabs(matrix, structure, workers, slab_size, False)
+    parent = np.arange(nlabels + 1, dtype=np.int64)
+    _hook(parent, a, b)
+    roots = _find(parent, parent)
+    # Each component gets the rank of its smallest label, the order of its
+    # first voxel, as in the serial labels.
+    is_root = roots == np.arange(len(roots))
+    is_root[0] = False
+    number = np.cumsum(is_root).astype(np.int32)[roots]
+
+    def number_slices(z0):
+        # A few slices at a time, np.take makes a copy of the indices.
+        np.take(number, labels[z0 : z0 + 4], out=labels[z0 : z0 + 4])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        list(executor.map(number_slices, range(0, len(labels), 4)))
+    return labels, int(np.count_nonzero(is_root))
+
+
+class IncrementalLabels:
+    """
+    Labels of the connected components of matrix >= FOREGROUND_MIN, with
+    the connectivity of structure (see scipy.ndimage.label). labels holds
+    the label of each voxel (0 for the background); the component of a
+    voxel is the root of its label, see roots(). Call update() after
+    matrix is edited, or remove() after whole components were removed.
+    """
+
+    def __init__(self, matrix, structure=None, workers=1):
+        self.matrix = matrix
+        self.structure = _structure(structure)
+        self.workers = workers
+        self.labels = None
+        self._label()
+
+    @property
+    def num_regions(self):
+        return int(np.count_nonzero(self.sizes))
+
+    def foreground(self, slices=(Ellipsis,)):
+        return self.matrix[slices] >= FOREGROUND_MIN
+
+    def roots(self, labels):
+        """
+        Component (root label) of each of the labels.
+        """
+        return _find(self.parent, labels)
+
+    def voxel_sizes(self, slices=(Ellipsis,)):
+        """
+        Size of the component of each voxel of labels[slices], 0 for the
+        background.
+        """
+        return self.sizes[self.roots(self.labels[slices])]
+
+    def component_box(self, label):
+        """
+        Slices of a box containing the voxels of label, and of the labels
+        joined to it if it is a root.
+        """
+        return _box_slices((self.box_min[label], self.box_max[label]))
+
+    def changed_box(self, chunk_size=32):
+        """
+        Box (min, max) of the voxels of matrix whose foreground state
+        differs from labels, or None if there are none. Compares chunk_size
+        slices at a time.
+        """
+        box = None
+        for z0 in range(0, self.labels.shape[0], chunk_size):
+            chunk = slice(z0, z0 + chunk_size)
+            changed = self.foreground(chunk) != (self.labels[chunk] != 0)
+            if not changed.any():
+                continue
+            lo = []
+            hi = []
+            for axis in range(3):
+                other = tuple(i for i in range(3) if i != axis)
+                index = np.flatnonzero(changed.any(axis=other))
+                lo.append(index[0])
+                hi.append(index[-1] + 1)
+            lo[0] += z0
+            hi[0] += z0
+            chunk_box = (np.array(lo), np.array(hi))
+            box = chunk_box if box is None else _union_box(box, chunk_box)
+        return box
+
+    def remove(self, voxels):
+        """
+        Takes out of the labels the voxels (flat indices in labels) set to
+        the background in matrix, if they are whole components, as removed
+        by remove_tiny_objects, in time and memory in proportion to the
+        voxels. Returns whether they were; if not, nothing is changed and
+        update() must be called instead.
+        """
+        if len(voxels) == 0:
+            return True
+        flat = self.labels.reshape(-1)
+        roots, counts = np.unique(self.roots(flat[voxels]), return_counts=True)
+        if roots[0] == 0 or (self.sizes[roots] != counts).any():
+            return False
+        flat[voxels] = 0
+        self.sizes[roots] = 0
+        return True
+
+    def update(self, box=None):
+        """
+        Updates the labels after matrix was edited inside box, (min, max)
+        corners of a box, found with changed_box() if not given. Returns
+        the slices of the relabelled box, the old components with voxels in
+        it and their sizes before the update, or None if nothing changed.
+        A box bigger than UPDATE_MAX_FRACTION of the volume, to start with
+        or grown to tell a split, is not relabelled: the whole volume is
+        labelled again, and its slices are returned with no old components.
+        """
+        if box is None:
+            box = self.changed_box()
+            if box is None:
+                return None
+        shape = np.array(self.labels.shape)
+        edited = (np.asarray(box[0]), np.asarray(box[1]))
+        margin = 1
+        while True:
+            box = (np.maximum(edited[0] - margin, 0), np.minimum(edited[1] + margin, shape))
+            if np.prod(box[1] - box[0]) > UPDATE_MAX_FRACTION * self.labels.size:
+                self._label()
+                empty = np.zeros(0, dtype=np.int64)
+                return _box_slices((np.zeros(3, dtype=np.int64), shape)), empty, empty
+            region = _box_slices(box)
+            labels = self.labels[region]
+            foreground = self.foreground(region)
+            local, nlocal = nd.label(foreground, self.structure)
+            old = labels != 0
+            old_roots = self.roots(labels[old])
+
+            # A component losing voxels may split. Its old pieces in the
+            # box (parts connected inside the box) were all joined through
+            # the outside of the box, whose border was not edited. What is
+            # left of an old piece is either one new piece reaching the
+            # border, which keeps the label, or new pieces that don't reach
+            # it, which are components of their own. If more than one new
+            # piece of an old piece reaches the border, they may or may not
+            # be joined outside, and the test is repeated on bigger boxes,
+            # up to the box of the whole component.
+            border = np.zeros(nlocal + 1, dtype=bool)
+            for axis in range(3):
+                if box[0][axis] > 0:
+                    border[np.take(local, 0, axis)] = True
+                if box[1][axis] < shape[axis]:
+                    border[np.take(local, -1, axis)] = True
+            border[0] = False
+            lost = np.unique(old_roots[~foreground[old]])
+            left = np.isin(old_roots, lost) & foreground[old] & border[local[old]]
+            old_local, _nold = nd.label(old, self.structure)
+            pieces = np.unique(old_local[old][left].astype(np.int64) * (nlocal + 1) + local[old][left])
+            pieces_old, pieces_count = np.unique(pieces // (nlocal + 1), return_counts=True)
+            ambiguous = pieces_old[pieces_count > 1]
+            split = np.unique(old_roots[np.isin(old_local[old], ambiguous)])
+            if len(split) == 0:
+                break
+            whole = box
+            for root in split:
+                whole = _union_box(whole, (self.box_min[root], self.box_max[root]))
+            if (whole[0] == box[0]).all() and (whole[1] == box[1]).all():
+                break
+            margin *= 4
+            if margin >= (whole[1] - whole[0]).max():
+                edited = whole
+                margin = 0
+
+        on_border = border[local[old]]
+
+        # The voxels of the box are taken out of the sizes of their old
+        # components, and come back with their new labels.
+        inside = np.bincount(old_roots, minlength=len(self.sizes))
+        changed = np.flatnonzero(inside)
+        old_sizes = self.sizes[changed]
+        self.sizes -= inside
+
+        first = len(self.parent)
+        self._grow(nlocal)
+        self.sizes[first:] = np.bincount(local.ravel(), minlength=nlocal + 1)[1:]
+        self._set_boxes(local, first, box[0])
+        np.add(local, first - 1, out=local, where=local != 0)
+
+        # New labels meeting an old component are the same component,
+        # except for the pieces cut off a component.
+        kept = ~np.isin(old_roots, split) & foreground[old]
+        kept &= ~np.isin(old_roots, lost) | on_border
+        pairs = np.unique(local[old][kept].astype(np.int64) * len(self.parent) + old_roots[kept])
+        self._merge(*np.divmod(pairs, len(self.parent)))
+
+        labels[...] = local
+        self.parent = self.roots(self.parent)
+        return region, changed, old_sizes
+
+    def statistics(self, spacing=(1.0, 1.0, 1.0), chunk_size=16):
+        """
+        Statistics of each component, from one pass over labels chunk_size
+        slices at a time. spacing is the size of the voxels in x, y, z
+        order, as in InVesalius. Returns a dict of arrays with one row per
+        component: "label" (its root), "voxels", "volume" (in units of
+        spacing cubed), "box_min" and "box_max" (voxel indices of the
+        corners of its box), "extent" (size of the box) and "centroid"
+        (of the voxel centres). The last four are in z, y, x order, like
+        the matrix, the last two in units of spacing.
+        """
+        roots = np.flatnonzero(self.sizes)
+        n = len(roots)
+        rank = np.zeros(len(self.sizes), dtype=np.int64)
+        rank[roots] = np.arange(1, n + 1)
+        voxels = np.zeros(n + 1, dtype=np.int64)
+        sums = np.zeros((n + 1, 3))
+        box_min = np.full((n + 1, 3), np.iinfo(np.int64).max)
+        box_max = np.zeros((n + 1, 3), dtype=np.int64)
+        # Voxel coordinates in a chunk, from its first slice.
+        coordinates = np.indices((chunk_size,) + self.labels.shape[1:], dtype=np.float64)
+        for z0 in range(0, self.labels.shape[0], chunk_size):
+            ranks = rank[self.roots(self.labels[z0 : z0 + chunk_size])]
+            flat = ranks.ravel()
+            counts = np.bincount(flat, minlength=n + 1)
+            voxels += counts
+            for axis in range(3):
+                weights = coordinates[axis, : len(ranks)].ravel()
+                sums[:, axis] += np.bincount(flat, weights, n + 1)
+            sums[:, 0] += counts * z0
+
+            objects = nd.find_objects(ranks, n)
+            found = np.flatnonzero(counts[1:])
+            starts = np.fromiter((s.start for i in found for s in objects[i]), np.int64, 3 * len(found))
+            stops = np.fromiter((s.stop for i in found for s in objects[i]), np.int64, 3 * len(found))
+            offset = (z0, 0, 0)
+            box_min[found + 1] = np.minimum(box_min[found + 1], starts.reshape(-1, 3) + offset)
+            box_max[found + 1] = np.maximum(box_max[found + 1], stops.reshape(-1, 3) + offset)
+
+        spacing = np.asarray(spacing, dtype=np.float64)[::-1]
+        voxels = voxels[1:]
+        box_min = box_min[1:]
+        box_max = box_max[1:]
+        return {
+            "label": roots,
+            "voxels": voxels,
+            "volume": voxels * spacing.prod(),
+            "box_min": box_min,
+            "box_max": box_max,
+            "extent": (box_max - box_min) * spacing,
+            "centroid": sums[1:] / np.maximum(voxels, 1)[:, None] * spacing,
+        }
+
+    def flipped(self, components, old_sizes, min_size):
+        """
+        The old components (labels), as returned by update(), whose size
+        went from old_sizes to the other side of min_size. Only their voxels
+        outside the relabelled box change of side, and they are still in
+        the component_box() of the old label.
+        """
+        sizes = self.sizes[self.roots(components)]
+        flipped = (sizes > 0) & ((old_sizes <= min_size) != (sizes <= min_size))
+        return components[flipped]
+
+    def _label(self):
+        # Labels the whole matrix, into the previous labels if there are
+        # any. The labels of the slabs are kept, joined by the union-find.
+        self.labels, nlabels, self.sizes, (self.box_min, self.box_max), pairs = _label_slabs(
+            self.matrix, self.structure, self.workers, SLAB_SIZE, output=self.labels
+        )
+        self.parent = np.arange(nlabels + 1, dtype=np.int64)
+        self._merge(*pairs)
+        self.parent = self.roots(self.parent)
+
+    def _grow(self, n):
+        self.parent = np.concatenate((self.parent, np.arange(len(self.parent), len(self.parent) + n)))
+        self.sizes = np.concatenate((self.sizes, np.zeros(n, dtype=np.int64)))
+        self.box_min = np.concatenate((self.box_min, np.zeros((n, 3), dtype=np.int64)))
+        self.box_max = np.concatenate((self.box_max, np.zeros((n, 3), dtype=np.int64)))
+
+    def _set_boxes(self, labels, first, offset):
+        # Boxes of the labels 1, 2, ... of labels as labels first, first + 1, ...
+        objects = nd.find_objects(labels)
+        found = [i for i, slices in enumerate(objects) if slices is not None]
+        if not found:
+            return
+        starts = np.array([[s.start for s in objects[i]] for i in found])
+        stops = np.array([[s.stop for s in objects[i]] for i in found])
+        ids = np.array(found) + first
+        self.box_min[ids] = starts + offset
+        self.box_max[ids] = stops + offset
+
+    def _merge(self, a, b):
+        # Joins the components of the labels a[i] and b[i] for each i.
+        # Sizes and boxes go to the new roots.
+        joined = np.unique(self.roots(np.concatenate((a, b))))
+        _hook(self.parent, a, b)
+        new_roots = self.roots(joined)
+        moved = new_roots != joined
+        joined = joined[moved]
+        new_roots = new_roots[moved]
+        np.add.at(self.sizes, new_roots, self.sizes[joined])
+        self.sizes[joined] = 0
+        np.minimum.at(self.box_min, new_roots, self.box_min[joined])
+        np.maximum.at(self.box_max, new_roots, self.box_max[joined])
+
+
+# Components up to this size have their voxels in a SizeIndex.
+INDEX_MAX_SIZE = 1_000_000
+
+
+class SizeIndex:
+    """
+    Components of an IncrementalLabels sorted by size. The voxels of the
+    components of up to max_size voxels are grouped in that order the
+    first time they are needed, so the components with sizes in a range,
+    and their voxels, are found without going over the volume. Made stale
+    by IncrementalLabels.update().
+    """
+
+    def __init__(self, labels, max_size=INDEX_MAX_SIZE, chunk_size=32):
+        self.labels = labels
+        self.chunk_size = chunk_size
+        roots = np.flatnonzero(labels.sizes)
+        self.roots = roots[np.argsort(labels.sizes[roots], kind="stable")]
+        self.sizes = labels.sizes[self.roots]
+        self.nindexed = int(np.searchsorted(self.sizes, max_size, "right"))
+        self.voxels = None
+        self.starts = None
+
+    def _index_voxels(self):
+        labels = self.labels
+        rank = np.full(len(labels.sizes), -1, dtype=np.int64)
+        rank[self.roots[: self.nindexed]] = np.arange(self.nindexed)
+        slice_size = int(np.prod(labels.labels.shape[1:]))
+        voxels = []
+        ranks = []
+        for z0 in range(0, labels.labels.shape[0], self.chunk_size):
+            chunk = labels.labels[z0 : z0 + self.chunk_size]
+            chunk_ranks = rank[labels.roots(chunk)].ravel()
+            indexed = np.flatnonzero(chunk_ranks >= 0)
+            voxels.append(indexed + z0 * slice_size)
+            ranks.append(chunk_ranks[indexed])
+        ranks = np.concatenate(ranks)
+        order = np.argsort(ranks, kind="stable")
+        self.voxels = np.concatenate(voxels)[order]
+        self.starts = np.searchsorted(ranks[order], np.arange(self.nindexed + 1))
+
+    def between(self, low, high):
+        """
+        Voxels (flat indices) of the indexed components with low < size <=
+        high, and the roots of the components in that range too big to be
+        indexed.
+        """
+        if self.voxels is None:
+            self._index_voxels()
+        first, last = np.searchsorted(self.sizes, (low, high), "right")
+        start = self.starts[min(first, self.nindexed)]
+        stop = self.starts[min(last, self.nindexed)]
+        big = self.roots[max(first, self.nindexed) : max(last, self.nindexed)]
+        return self.voxels[start:stop], big
+
+    def at_most(self, size):
+        """
+        Number of components with at most size voxels, and their voxels.
+        """
+        n = int(np.searchsorted(self.sizes, size, "right"))
+        return n, int(self.sizes[:n].sum())
+
+    def keep_largest_size(self, n):
+        """
+        Maximum size to remove to keep only the n largest components, and
+        the ones as big as the n-th largest.
+        """
+        if n >= len(self.sizes):
+            return 0
+        if n <= 0:
+            return int(self.sizes[-1])
+        return int(self.sizes[-n]) - 1
+
+    def histogram(self):
+        """
+        Number of components with 2**i <= size < 2**(i + 1) for each i.
+        """
+        if len(self.sizes) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.bincount(np.log2(self.sizes).astype(np.int64))
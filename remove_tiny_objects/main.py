@@ -13,5 +13,5 @@ def load():
     image_matrix = s.matrix
     spacing = s.spacing
 
-    g = gui.Window(wx.GetApp().GetTopWindow(), image_matrix)
+    g = gui.Window(wx.GetApp().GetTopWindow(), image_matrix, spacing)
     g.Show()
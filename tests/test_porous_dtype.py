@@ -0,0 +1,46 @@
+"""
+The float32 porous volumes, scaled straight into int16, against the
+previous float64 field normalized by image_normalize.
+"""
+import numpy as np
+import pytest
+
+from porous_creation import schwarzp
+
+MIN_VALUE = -1000
+MAX_VALUE = 1000
+SIZE = 48
+BOUNDS = (-10, 10, -10, 10, -10, 10)
+CUSTOM = schwarzp.ImplicitSurface("Custom", expression="cos(x) * sin(y) + z ** 2 / 50")
+
+
+def image_normalize(image, min_=0, max_=1):
+    # Same as invesalius.data.imagedata_utils.image_normalize.
+    output = np.empty(shape=image.shape, dtype=np.int16)
+    imin, imax = image.min(), image.max()
+    output[:] = (image - imin) * ((max_ - min_) / (imax - imin)) + min_
+    return output
+
+
+def max_diff(reference, output):
+    assert output.dtype == np.int16
+    return int(np.abs(reference.astype(np.int32) - output).max())
+
+
+@pytest.mark.parametrize("method", sorted(schwarzp.SURFACES) + [CUSTOM], ids=lambda method: getattr(method, "name", method))
+def test_float32_scale_to_int16(method):
+    reference = image_normalize(
+        schwarzp.create_schwarzp(method, *BOUNDS, SIZE, SIZE, SIZE), MIN_VALUE, MAX_VALUE
+    )
+    output = schwarzp.create_schwarzp(
+        method, *BOUNDS, SIZE, SIZE, SIZE, dtype=np.float32, scale_to=(MIN_VALUE, MAX_VALUE)
+    )
+    assert max_diff(reference, output) <= 1
+
+
+def test_float32_blobs_normalize_volume():
+    reference = image_normalize(schwarzp.create_blobs(SIZE, SIZE, SIZE, seed=0), MIN_VALUE, MAX_VALUE)
+    output = schwarzp.normalize_volume(
+        schwarzp.create_blobs(SIZE, SIZE, SIZE, seed=0, dtype=np.float32), MIN_VALUE, MAX_VALUE
+    )
+    assert max_diff(reference, output) <= 1
@@ -0,0 +1,66 @@
+"""
+create_surface with each generator, with the parameters the dialog gives
+them (see Window.get_generator).
+"""
+import numpy as np
+import pytest
+
+from porous_creation import schwarzp, surface
+
+SIZE = 24
+GENERATORS = {
+    "implicit": (
+        schwarzp.create_schwarzp,
+        {
+            "method": "Gyroid",
+            "init_x": -5,
+            "end_x": 5,
+            "init_y": -5,
+            "end_y": 5,
+            "init_z": -5,
+            "end_z": 5,
+            "sx": SIZE,
+            "sy": SIZE,
+            "sz": SIZE,
+        },
+    ),
+    "blobs": (
+        schwarzp.create_blobs,
+        {"sx": SIZE, "sy": SIZE, "sz": SIZE, "gaussian": 2, "seed": 1, "dtype": np.float32},
+    ),
+    "voronoi": (
+        schwarzp.create_voronoi,
+        {"sx": SIZE, "sy": SIZE, "sz": SIZE, "number_sites": 20, "normalize": False, "border": True, "seed": 1},
+    ),
+    "voronoi_non_random": (
+        schwarzp.create_voronoi_non_random,
+        {
+            "sx": SIZE,
+            "sy": SIZE,
+            "sz": SIZE,
+            "nsx": 3,
+            "nsy": 3,
+            "nsz": 3,
+            "normalize": False,
+            "noise": True,
+            "border": True,
+            "seed": 1,
+        },
+    ),
+}
+
+
+@pytest.mark.parametrize("name", sorted(GENERATORS))
+def test_create_surface(name):
+    if name.startswith("voronoi"):
+        pytest.importorskip("invesalius_rs")
+    func, params = GENERATORS[name]
+    field = func(**params)
+    level = float(np.median(field))
+    spacing = (0.5, 1.0, 2.0)
+    polydata = surface.create_surface(func, params, level=level, spacing=spacing, chunk_size=8, workers=2)
+    assert polydata.GetNumberOfPolys() > 0
+    xmin, xmax, ymin, ymax, zmin, zmax = polydata.GetBounds()
+    assert min(xmin, ymin, zmin) >= 0
+    extent = (np.array([xmax, ymax, zmax]) / spacing).round(3)
+    assert (extent <= SIZE - 1).all()
@@ -0,0 +1,154 @@
+"""
+Visibility of remove_non_visible_faces and its mesh and ray casting
+helpers checked on small meshes, against brute force where it is simple.
+"""
+import numpy as np
+import pytest
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components as graph_components
+
+pytest.importorskip("vtkmodules")
+
+from vtkmodules.util import numpy_support  # noqa: E402
+from vtkmodules.vtkCommonCore import vtkPoints  # noqa: E402
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData  # noqa: E402
+from vtkmodules.vtkFiltersSources import vtkSphereSource  # noqa: E402
+
+from remove_non_visible_faces.mesh import (  # noqa: E402
+    connected_components,
+    enclosed_cells,
+    extract_cells,
+    triangles,
+)
+from remove_non_visible_faces.raycast import cast_view  # noqa: E402
+from remove_non_visible_faces.remove_non_visible_faces import fibonacci_sphere  # noqa: E402
+
+
+def make_polydata(points, tris):
+    polydata = vtkPolyData()
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(np.asarray(points, dtype=np.float64), deep=True))
+    polydata.SetPoints(vtk_points)
+    polys = vtkCellArray()
+    for tri in tris:
+        polys.InsertNextCell(3, [int(i) for i in tri])
+    polydata.SetPolys(polys)
+    return polydata
+
+
+def sphere(radius, center=(0.0, 0.0, 0.0)):
+    source = vtkSphereSource()
+    source.SetRadius(radius)
+    source.SetCenter(*center)
+    source.SetThetaResolution(24)
+    source.SetPhiResolution(24)
+    source.Update()
+    polydata = source.GetOutput()
+    return numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()), triangles(polydata)
+
+
+def join(*meshes):
+    points = []
+    tris = []
+    offset = 0
+    for mesh_points, mesh_tris in meshes:
+        points.append(mesh_points)
+        tris.append(mesh_tris + offset)
+        offset += len(mesh_points)
+    return make_polydata(np.concatenate(points), np.concatenate(tris))
+
+
+@pytest.mark.parametrize("n", [6, 32, 100])
+def test_fibonacci_sphere(n):
+    points = fibonacci_sphere(n)
+    assert np.allclose(np.linalg.norm(points, axis=1), 1.0)
+    # The same lattice, in any order.
+    i = np.arange(n) + 0.5
+    assert np.allclose(np.sort(points[:, 2]), np.sort(1.0 - 2.0 * i / n))
+    # Every prefix of at least 4 points reaches both hemispheres.
+    for k in range(4, n + 1):
+        z = points[:k, 2]
+        assert z.max() > 0.25 and z.min() < -0.25, k
+
+
+def test_connected_components():
+    rng = np.random.default_rng(0)
+    npoints = 200
+    tris = rng.integers(0, npoints, (80, 3))
+    labels, n = connected_components(make_polydata(rng.random((npoints, 3)), tris))
+
+    a = tris.ravel()
+    b = np.roll(tris, -1, axis=1).ravel()
+    graph = coo_matrix((np.ones(len(a)), (a, b)), shape=(npoints, npoints))
+    expected_n, expected = graph_components(graph, directed=False)
+    assert n == expected_n
+    assert labels.min() == 0 and labels.max() == n - 1
+    pairs = np.unique(np.stack((labels, expected)), axis=1)
+    assert pairs.shape[1] == n
+
+
+def test_enclosed_cells():
+    outer = sphere(1.0)
+    inner = sphere(0.4, (0.1, -0.2, 0.3))
+    enclosed = enclosed_cells(join(outer, inner))
+    assert not enclosed[: len(outer[1])].any()
+    assert enclosed[len(outer[1]) :].all()
+
+    # Side by side, or inside a surface with a hole: nothing enclosed.
+    assert not enclosed_cells(join(outer, sphere(0.4, (3.0, 0.0, 0.0)))).any()
+    polydata = join(outer, inner)
+    opened = extract_cells(polydata, np.arange(1, polydata.GetNumberOfCells()))
+    assert not enclosed_cells(opened).any()
+
+
+def brute_force_view(points, tris, center, radius, direction, resolution):
+    # First triangle hit by the ray of each pixel centre, tested against
+    # every triangle, in pixel order as cast_view.
+    direction = np.asarray(direction, dtype=np.float64)
+    direction = direction / np.linalg.norm(direction)
+    up = (0.0, 0.0, 1.0) if abs(direction[2]) < 0.9 else (0.0, 1.0, 0.0)
+    u = np.cross(up, direction)
+    u /= np.linalg.norm(u)
+    v = np.cross(direction, u)
+    pixel_size = 2.0 * radius / resolution
+    hits = []
+    for py in range(resolution):
+        for px in range(resolution):
+            x = (px - resolution / 2.0 + 0.5) * pixel_size
+            y = (py - resolution / 2.0 + 0.5) * pixel_size
+            origin = center + x * u + y * v
+            nearest = None
+            for i, (a, b, c) in enumerate(points[tris]):
+                # Moller-Trumbore, for the whole line along direction.
+                e1 = b - a
+                e2 = c - a
+                p = np.cross(direction, e2)
+                det = e1 @ p
+                if abs(det) < 1e-12:
+                    continue
+                t = origin - a
+                l1 = (t @ p) / det
+                q = np.cross(t, e1)
+                l2 = (direction @ q) / det
+                if l1 < 0 or l2 < 0 or l1 + l2 > 1:
+                    continue
+                # Distance along direction, the nearest hit is the largest.
+                s = (e2 @ q) / det
+                if nearest is None or s > nearest[0]:
+                    nearest = (s, i)
+            if nearest is not None:
+                hits.append(nearest[1])
+    return np.array(hits, dtype=np.int64)
+
+
+@pytest.mark.parametrize("direction", [(0, 0, 1), (1, 2, -0.5), (0.1, 0.05, -1)])
+def test_cast_view(direction):
+    rng = np.random.default_rng(1)
+    points = rng.random((30, 3))
+    tris = rng.integers(0, len(points), (25, 3))
+    center = points.mean(axis=0)
+    radius = 1.0
+    resolution = 16
+    expected = brute_force_view(points, tris, center, radius, direction, resolution)
+    assert len(expected) > 0
+    assert np.array_equal(cast_view(points, tris, center, radius, direction, resolution), expected)
@@ -0,0 +1,198 @@
+"""
+Labels and undo history of remove_tiny_objects against scipy.ndimage.label
+and full copies of the mask, on small random masks.
+"""
+import os
+
+import numpy as np
+import pytest
+import scipy.ndimage as nd
+
+from remove_tiny_objects.history import SparseEditionNode, set_voxels
+from remove_tiny_objects.labeling import FOREGROUND_MIN, IncrementalLabels, SizeIndex, label_slabs
+
+SHAPE = (30, 31, 32)
+FULL_STRUCTURE = np.ones((3, 3, 3), dtype=bool)
+
+
+def random_mask(rng, shape=SHAPE, density=0.3):
+    # Foreground values from FOREGROUND_MIN up, background below, as in
+    # InVesalius masks.
+    foreground = rng.random(shape) < density
+    return np.where(
+        foreground, rng.integers(FOREGROUND_MIN, 256, shape), rng.integers(0, FOREGROUND_MIN, shape)
+    ).astype(np.uint8)
+
+
+def assert_same_components(labels, matrix, structure=None):
+    expected, n = nd.label(matrix >= FOREGROUND_MIN, structure)
+    roots = labels.roots(labels.labels)
+    assert labels.num_regions == n
+    assert np.array_equal(roots != 0, expected != 0)
+    # One component for each one of nd.label, and the other way round.
+    pairs = np.unique(np.stack((roots[expected != 0], expected[expected != 0])), axis=1)
+    assert pairs.shape[1] == n
+    assert len(np.unique(pairs[0])) == n
+    sizes = np.bincount(expected.ravel())
+    sizes[0] = 0
+    assert np.array_equal(labels.voxel_sizes(), sizes[expected])
+    return expected, n
+
+
+@pytest.mark.parametrize("structure", [None, FULL_STRUCTURE], ids=["faces", "full"])
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("slab_size", [1, 5, 64])
+def test_label_slabs(slab_size, workers, structure):
+    matrix = random_mask(np.random.default_rng(0))
+    labels, n = label_slabs(matrix, structure, workers, slab_size)
+    expected, expected_n = nd.label(matrix >= FOREGROUND_MIN, structure)
+    assert n == expected_n
+    assert labels.dtype == np.int32
+    assert np.array_equal(labels, expected)
+
+
+@pytest.mark.parametrize("structure", [None, FULL_STRUCTURE], ids=["faces", "full"])
+def test_incremental_labels_update(structure):
+    rng = np.random.default_rng(1)
+    matrix = random_mask(rng)
+    labels = IncrementalLabels(matrix, structure, workers=2)
+    assert_same_components(labels, matrix, structure)
+    for _ in range(20):
+        lo = rng.integers(0, np.array(SHAPE) - 2)
+        hi = np.minimum(lo + rng.integers(1, 8, 3), SHAPE)
+        box = tuple(slice(a, b) for a, b in zip(lo, hi))
+        matrix[box] = random_mask(rng, matrix[box].shape, rng.choice([0.0, 0.3, 1.0]))
+        labels.update()
+        assert_same_components(labels, matrix, structure)
+    assert labels.update() is None
+
+    # Cutting a bar in two, and a box bigger than UPDATE_MAX_FRACTION.
+    matrix[:] = 0
+    matrix[10:20, 15, 2:30] = 255
+    labels.update()
+    matrix[10:20, 15, 16] = 0
+    labels.update()
+    assert_same_components(labels, matrix, structure)
+    matrix[:] = random_mask(rng)
+    labels.update()
+    assert_same_components(labels, matrix, structure)
+
+
+def test_incremental_labels_remove():
+    rng = np.random.default_rng(2)
+    matrix = random_mask(rng)
+    labels = IncrementalLabels(matrix)
+    before = labels.labels.copy()
+
+    # Not whole components: nothing changes.
+    flat_sizes = labels.voxel_sizes().reshape(-1)
+    big = np.flatnonzero(flat_sizes > 2)
+    assert not labels.remove(big[:1])
+    assert not labels.remove(np.flatnonzero(flat_sizes == 0)[:1])
+    assert np.array_equal(labels.labels, before)
+
+    voxels = np.flatnonzero((flat_sizes > 0) & (flat_sizes <= 3))
+    matrix.reshape(-1)[voxels] = 1
+    assert labels.remove(voxels)
+    assert labels.remove(voxels[:0])
+    assert_same_components(labels, matrix)
+
+
+def test_incremental_labels_statistics():
+    rng = np.random.default_rng(3)
+    matrix = random_mask(rng)
+    labels = IncrementalLabels(matrix)
+    # Joined labels, and roots that are not the smallest label.
+    matrix[5:25, 5:25, 16] = 255
+    labels.update()
+    expected, n = assert_same_components(labels, matrix)
+
+    spacing = (0.5, 1.0, 2.0)
+    stats = labels.statistics(spacing, chunk_size=4)
+    roots = labels.roots(labels.labels)
+    root_of = np.zeros(n + 1, dtype=np.int64)
+    root_of[expected[expected != 0]] = roots[expected != 0]
+    order = np.argsort(root_of[1:])
+    assert np.array_equal(stats["label"], root_of[1:][order])
+
+    zyx_spacing = np.array(spacing[::-1])
+    voxels = np.bincount(expected.ravel())[1:]
+    centroids = np.array(nd.center_of_mass(expected != 0, expected, np.arange(1, n + 1)))
+    objects = nd.find_objects(expected)
+    box_min = np.array([[s.start for s in o] for o in objects])
+    box_max = np.array([[s.stop for s in o] for o in objects])
+    assert np.array_equal(stats["voxels"], voxels[order])
+    assert np.allclose(stats["volume"], voxels[order] * np.prod(spacing))
+    assert np.allclose(stats["centroid"], centroids[order] * zyx_spacing)
+    assert np.array_equal(stats["box_min"], box_min[order])
+    assert np.array_equal(stats["box_max"], box_max[order])
+    assert np.allclose(stats["extent"], (box_max - box_min)[order] * zyx_spacing)
+
+
+def test_size_index():
+    rng = np.random.default_rng(4)
+    matrix = random_mask(rng)
+    labels = IncrementalLabels(matrix)
+    expected, n = assert_same_components(labels, matrix)
+    sizes = np.bincount(expected.ravel())[1:]
+    voxel_sizes = labels.voxel_sizes().reshape(-1)
+    index = SizeIndex(labels, max_size=5, chunk_size=7)
+
+    for size in (0, 1, 4, 10, sizes.max()):
+        small = sizes <= size
+        assert index.at_most(size) == (np.count_nonzero(small), sizes[small].sum())
+
+    for low, high in ((0, 1), (1, 5), (3, 40), (0, sizes.max())):
+        voxels, big = index.between(low, high)
+        in_range = (voxel_sizes > low) & (voxel_sizes <= high)
+        assert np.array_equal(np.sort(voxels), np.flatnonzero(in_range & (voxel_sizes <= 5)))
+        big_sizes = labels.sizes[big]
+        assert ((big_sizes > 5) & (big_sizes > low) & (big_sizes <= high)).all()
+        assert big_sizes.sum() == np.count_nonzero(in_range & (voxel_sizes > 5))
+
+    largest_first = np.sort(sizes)[::-1]
+    for keep in range(-1, n + 2):
+        kept = sizes > index.keep_largest_size(keep)
+        if keep <= 0:
+            assert not kept.any()
+        elif keep >= n:
+            assert kept.all()
+        else:
+            assert np.array_equal(kept, sizes >= largest_first[keep - 1])
+
+
+def test_sparse_edition_node():
+    rng = np.random.default_rng(5)
+    matrix = random_mask(rng, (10, 12, 14))
+    marked = (rng.random((6, 7, 8)) < 0.4).astype(np.uint8)
+    offset = (2, 3, 4)
+    before = matrix.copy()
+    voxels, old_values = set_voxels(matrix, marked, 1, offset, chunk_size=4)
+
+    after = before.copy()
+    after[2:8, 3:10, 4:12][marked != 0] = 1
+    assert np.array_equal(matrix, after)
+    assert np.array_equal(before.reshape(-1)[voxels], old_values)
+    assert len(voxels) == np.count_nonzero(marked)
+
+    # Undo and redo as the pair of history nodes.
+    undo = SparseEditionNode(voxels, old_values)
+    redo = SparseEditionNode(voxels, 1)
+    undo.commit_history(matrix)
+    assert np.array_equal(matrix, before)
+    redo.commit_history(matrix)
+    assert np.array_equal(matrix, after)
+    undo.commit_history(matrix)
+    assert np.array_equal(matrix, before)
+
+    filename = undo.filename
+    assert os.path.exists(filename)
+    del undo
+    assert not os.path.exists(filename)
+
+
+def test_set_voxels_nothing_marked():
+    matrix = np.zeros((4, 5, 6), dtype=np.uint8)
+    voxels, old_values = set_voxels(matrix, np.zeros((0, 5, 6), dtype=np.uint8), 1)
+    assert len(voxels) == 0 and len(old_values) == 0
+    assert old_values.dtype == matrix.dtype